@@ -0,0 +1,109 @@
+"Admission control: a bounded number of generations at once, a bounded wait queue with per-client round-robin and priority lanes, and fast 503s past that"
+import asyncio, math, os, time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from metrics import ADMISSION_REJECTED, ADMISSION_WAIT
+
+LANES = ("interactive", "batch")  # highest priority first
+
+class Overloaded(Exception):
+    "Raised instead of queueing when the wait queue is full or a wait runs out; `retry_after` is the suggested delay in seconds"
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Server is busy ({reason.replace('_', ' ')}), please retry in {retry_after}s")
+        self.reason,self.retry_after = reason,retry_after
+
+def client_id(request):
+    "Who a request counts against for fairness: `X-Client-Id` when the caller sets one, else its address"
+    return request.headers.get("x-client-id") or (request.client.host if request.client else "unknown")
+
+class AdmissionController:
+    "`capacity` generations run at once; up to `queue_size` more wait, served lane by lane and round-robin across clients within a lane, a full queue giving up lower-lane waiters to higher-lane arrivals"
+    def __init__(self, capacity=32, queue_size=64, client_queue=16, max_wait=None):
+        self.capacity,self.queue_size,self.client_queue = capacity,queue_size,client_queue
+        self.max_wait = {lane: 10.0 for lane in LANES} | (max_wait or {})
+        self.active,self.service = 0,1.0  # service: moving average of seconds a slot is held, for Retry-After
+        self.queues = {lane: OrderedDict() for lane in LANES}  # lane -> client -> waiting futures, clients in turn order
+
+    def depth(self, lane=None): return sum(len(q) for lane_,qs in self.queues.items() if lane in (None, lane_) for q in qs.values())
+
+    def retry_after(self, queued=None):
+        "Seconds until the queue has likely drained enough to take another request; `queued` stands in for this worker's own queue, e.g. the job backlog"
+        return max(1, math.ceil(self.service * ((self.depth() if queued is None else queued) + 1) / self.capacity))
+
+    def reject(self, lane, reason, queued=None):
+        "Count a refusal and build the Overloaded error for it"
+        ADMISSION_REJECTED.inc(lane=lane, reason=reason)
+        return Overloaded(reason, self.retry_after(queued))
+
+    def _lower(self, lane):
+        "The newest waiter in a lane below `lane`, lowest lane first, as (lane, client): the one a `lane` arrival pushes out of a full queue"
+        for lower in reversed(LANES[LANES.index(lane) + 1:]):
+            if q := self.queues[lower]: return lower, next(reversed(q))
+        return None
+
+    def _preempt(self, lane):
+        "Make room in a full queue for `lane` by refusing a lower-lane waiter, so batch work can't crowd out interactive requests"
+        lower,client = self._lower(lane)
+        waiters = self.queues[lower][client]
+        fut = waiters.pop()
+        if not waiters: del self.queues[lower][client]
+        if not fut.done(): fut.set_exception(self.reject(lower, "preempted"))
+
+    def check(self, client, lane="interactive"):
+        "Raise Overloaded now if `slot(client, lane)` would have to queue and there's no room, so a request can be refused before any work starts"
+        if self.active < self.capacity and not self.depth(): return
+        if self.depth() >= self.queue_size and self._lower(lane) is None: raise self.reject(lane, "queue_full")
+        if len(self.queues[lane].get(client, ())) >= self.client_queue: raise self.reject(lane, "client_queue_full")
+
+    def _grant(self):
+        "Hand free slots to waiters: higher lanes first, then the client whose turn it is"
+        for lane in LANES:
+            q = self.queues[lane]
+            while q and self.active < self.capacity:
+                client,waiters = q.popitem(last=False)
+                fut = waiters.popleft()
+                if waiters: q[client] = waiters  # back of the line for this client's next request
+                if fut.done(): continue  # gave up waiting
+                self.active += 1
+                fut.set_result(None)
+
+    async def acquire(self, client, lane="interactive"):
+        start = time.monotonic()
+        self.check(client, lane)
+        if self.active < self.capacity and not self.depth(): self.active += 1
+        else:
+            if self.depth() >= self.queue_size: self._preempt(lane)
+            fut = asyncio.get_running_loop().create_future()
+            self.queues[lane].setdefault(client, deque()).append(fut)
+            try: await asyncio.wait_for(fut, self.max_wait[lane])
+            except asyncio.TimeoutError: raise self.reject(lane, "wait_timeout") from None
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled(): self.release()  # granted just as the caller went away
+                raise
+            finally:
+                waiters = self.queues[lane].get(client)
+                if waiters is not None and fut in waiters:
+                    waiters.remove(fut)
+                    if not waiters: del self.queues[lane][client]
+        ADMISSION_WAIT.observe(time.monotonic() - start, lane=lane)
+
+    def release(self, held=None):
+        self.active -= 1
+        if held is not None: self.service += 0.1 * (held - self.service)
+        self._grant()
+
+    @asynccontextmanager
+    async def slot(self, client, lane="interactive"):
+        "Hold one of the `capacity` slots for the block, waiting in `lane` behind earlier requests; raises Overloaded instead of waiting past `max_wait`"
+        await self.acquire(client, lane)
+        start = time.monotonic()
+        try: yield
+        finally: self.release(time.monotonic() - start)
+
+    def stats(self): return dict(active=self.active, capacity=self.capacity, queued={lane: self.depth(lane) for lane in LANES}, queue_size=self.queue_size, retry_after=self.retry_after())
+
+def admission_from_env():
+    "Admission controller with `ADMISSION_CAPACITY` slots, `ADMISSION_QUEUE` waiters (`ADMISSION_CLIENT_QUEUE` per client) and `ADMISSION_MAX_WAIT[_<LANE>]` seconds"
+    wait = {lane: float(os.getenv(f"ADMISSION_MAX_WAIT_{lane.upper()}", os.getenv("ADMISSION_MAX_WAIT", 120 if lane == "batch" else 10))) for lane in LANES}
+    return AdmissionController(capacity=int(os.getenv("ADMISSION_CAPACITY", 32)), queue_size=int(os.getenv("ADMISSION_QUEUE", 64)),
+                               client_queue=int(os.getenv("ADMISSION_CLIENT_QUEUE", 16)), max_wait=wait)
@@ -1,18 +1,61 @@
 from fasthtml.common import *
 from monsterui.all import *
-from lisette import *
-import json, uuid
+from store import MemoryStore, store_from_env, start_cleanup
+from cache import cache_key, cache_from_env
+from ratelimit import governor
+from clients import registry, warm_imports
+from server import app_options, run
+from jsonstream import JsonObjectStream, repair_json
+from metrics import CONTENT_TYPE, ERRORS, GENERATIONS_CANCELLED, MetricsMiddleware, metrics, waiting_on_provider, watch_admission, watch_cache, watch_flights, watch_pools, watch_semantic
+from tracing import TracingMiddleware, span, tag, trace_task
+from jobs import QueueFull, job_key, queue_from_env
+from disconnect import Disconnected, unless_disconnected
+from semantic import semantic_cache_from_env
+from coalesce import singleflight_from_env
+from admission import Overloaded, admission_from_env, client_id
+import asyncio, functools, hashlib, json, os, uuid
 
+sse_ext = Script(src="https://cdn.jsdelivr.net/npm/htmx-ext-sse@2.2.3/sse.js")
+# htmx's default response handling with one change: swap 503s, so "server busy, retry in Ns" shows up where the result would have
+htmx_config = Meta(name="htmx-config", content=json.dumps({"responseHandling": [{"code": "204", "swap": False}, {"code": "503", "swap": True}, {"code": "[23]..", "swap": True}, {"code": "[45]..", "swap": False, "error": True}]}))
+theme = Theme.blue
 app,rt = fast_app(
-    hdrs=Theme.blue.headers(),
-    live=True,   # Enable live reload
-    debug=True   # Enable debug mode for better error messages
+    hdrs=(*theme.headers(), sse_ext, htmx_config),
+    **app_options()  # live reload and debug in development only; `python app.py --prod` or ENVIRONMENT=production turns both off
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)  # opt-in: TRACE_PATH for spans, PROFILE_SLOW_MS for slow-request stacks
 
 components = [("role", "Role & Persona"), ("task", "Task Definition"), ("format", "Output Format"), ("examples", "Examples")]
 models = [("gpt-4", "GPT-4"), ("gpt-3.5-turbo", "GPT-3.5"), ("claude-3", "Claude 3")]
 presets = [("", "Select a preset..."), ("content", "Content Creator"), ("tutor", "Educational Tutor"), ("analyst", "Business Analyst"), ("coder", "Code Assistant")]
-progress_state = {}
+progress_state = store_from_env()
+response_cache = cache_from_env()
+semantic_cache = semantic_cache_from_env()
+inflight = singleflight_from_env()
+admission = admission_from_env()
+page_cache = MemoryStore(maxsize=256, ttl=float("inf"))
+page_lookups = metrics.counter("prompt_maker_page_cache_lookups_total", "Index page renders served from `page_cache` (hit) or rendered (miss)", ["result"])
+watch_cache("response", response_cache)
+if semantic_cache is not None: watch_semantic("semantic", semantic_cache)
+watch_pools(registry)
+watch_flights("generation", inflight)
+watch_admission(admission)
+
+@app.on_event("startup")
+async def start_cleanup_tasks():
+    start_cleanup(progress_state, interval=int(os.getenv("SESSION_CLEANUP_INTERVAL", 60)))
+    start_cleanup(response_cache, interval=int(os.getenv("SESSION_CLEANUP_INTERVAL", 60)))
+    if semantic_cache is not None: start_cleanup(semantic_cache, interval=int(os.getenv("SESSION_CLEANUP_INTERVAL", 60)))
+    start_cleanup(generation_jobs, interval=int(os.getenv("SESSION_CLEANUP_INTERVAL", 60)))
+    generation_jobs.start()
+    registry.warm(["openai/gpt-4o", *[m for m,_ in models]])
+    warm_imports(("litellm", "lisette"))
+
+@app.on_event("shutdown")
+async def close_clients():
+    await generation_jobs.stop()  # unfinished jobs go back to the queue for the next worker
+    await registry.aclose()
 
 def apply_preset(preset_type):
     if preset_type == "content": return dict(components=["role", "task", "format"], role_text="You are a skilled content creator", criteria="Create engaging content")
@@ -21,82 +64,314 @@ def apply_preset(preset_type):
     if preset_type == "coder": return dict(components=["role", "task", "examples"], role_text="You are an expert programmer", criteria="Help with coding tasks")
     return {}
 
-def generate_prompt_content(criteria, components, model='openai/gpt-4o'):
+system_msg = "You are an expert at crafting effective LLM prompts. Generate specific, detailed content for each requested component."
+
+component_help = {"role": "Define the AI's expertise and persona", "task": "Specific instructions for what to do", "format": "How to structure the output", "examples": "Concrete examples demonstrating the desired output"}
+
+def prompt_request(criteria, components):
     comp_list = ", ".join([c for c in components])
-    system_msg = "You are an expert at crafting effective LLM prompts. Generate specific, detailed content for each requested component."
-    user_msg = f"""Given this user request: "{criteria}"
+    help_list = "\n".join(f"- {c}: {h}" for c,h in component_help.items())
+    return f"""Given this user request: "{criteria}"
 
 Generate content for these components: {comp_list}
 
 Return a JSON object with keys matching the component names. For each component provide specific, actionable text (not generic placeholders).
 
 Available components:
-- role: Define the AI's expertise and persona
-- task: Specific instructions for what to do
-- format: How to structure the output
-- examples: Concrete examples demonstrating the desired output
+{help_list}
 
 Return ONLY valid JSON, no other text."""
-    chat = Chat(model, sp=system_msg)
-    response = chat(user_msg)
-    return response.choices[0].message.content
 
-def parse_llm_response(content):
-    if content.startswith('```json'): content = content[7:]
-    if content.startswith('```'): content = content[3:]
-    if content.endswith('```'): content = content[:-3]
-    return json.loads(content.strip())
+def component_request(criteria, component):
+    return f"""Given this user request: "{criteria}"
 
-@rt('/')
-def get(preset: str = ""):
+Write the "{component}" component of a prompt for it ({component_help[component].lower()}). Provide specific, actionable text (not generic placeholders).
+
+Return ONLY the text for this component, no heading or other commentary."""
+
+def semantic_get(criteria, scope):
+    "Cached generation for criteria that say nearly the same thing under `scope` (model and components), or None"
+    if semantic_cache is None: return None
+    content,similarity = semantic_cache.get(criteria, scope)
+    if content is not None: tag(semantic_similarity=round(similarity, 4))
+    return content
+
+def semantic_set(criteria, scope, content):
+    if semantic_cache is not None: semantic_cache.set(criteria, scope, content)
+
+def semantic_override(criteria, scope):
+    "A regeneration that skips the cache right after a near-duplicate hit means the hit was wrong: count it against the threshold"
+    if semantic_cache is not None: semantic_cache.override(criteria, scope)
+
+def chat(model):
+    "A lisette chat over the rate-limit governor; lisette and LiteLLM are imported on first use since they dominate cold start"
+    from lisette import AsyncChat
+    return AsyncChat(model, sp=system_msg, completefunc=governor.acompletion)
+
+async def generate_component(criteria, component, model='openai/gpt-4o', no_cache=False):
+    "Text for one component, cached under (model, criteria, component) so editing one field only re-runs what changed"
+    user_msg = component_request(criteria, component)
+    key,scope = cache_key(model, system_msg, user_msg, temperature=0),(model, "component", component)
+    if not no_cache and ((content := await response_cache.aget(key)) is not None or (content := semantic_get(criteria, scope)) is not None): return content
+    if no_cache: semantic_override(criteria, scope)
+    async def complete():
+        response = await chat(model)(user_msg)
+        content = response.choices[0].message.content.strip()
+        await response_cache.aset(key, content)
+        semantic_set(criteria, scope, content)
+        return content
+    return await inflight.do(key, complete)
+
+async def iter_components(criteria, components, model='openai/gpt-4o', no_cache=False):
+    "Generate every component with its own concurrent call, yielding (component, text) in completion order"
+    async def named(c):
+        with span("component", component=c): return c, await generate_component(criteria, c, model, no_cache)
+    tasks = [asyncio.create_task(named(c)) for c in components]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        for t in tasks: t.cancel()
+
+def to_generate(components, d):
+    "Selected components the user hasn't written themselves, so the model has to fill them in"
+    return [c for c in components if c in component_help and not (d.get(f"{c}_text") or "").strip()]
+
+def component_schema(components): return {"type": "object", "properties": {c: {"type": "string"} for c in components}, "required": list(components), "additionalProperties": False}
+
+@functools.cache
+def response_format(model, components):
+    "Strictest structured output `model` supports: a JSON schema of the requested `components`, plain JSON mode, or None"
+    import litellm
+    try:
+        if litellm.supports_response_schema(model=model): return {"type": "json_schema", "json_schema": {"name": "prompt_components", "schema": component_schema(components), "strict": True}}
+        if "response_format" in (litellm.get_supported_openai_params(model=model) or []): return {"type": "json_object"}
+    except Exception: pass
+    return None
+
+def format_kw(model, components):
+    fmt = response_format(model, tuple(components))
+    return dict(response_format=fmt) if fmt else {}
+
+async def generate_prompt_content(criteria, components, model='openai/gpt-4o', no_cache=False):
+    user_msg = prompt_request(criteria, components)
+    key,scope = cache_key(model, system_msg, user_msg, temperature=0),(model, "prompt", tuple(sorted(components)))
+    if not no_cache and ((content := await response_cache.aget(key)) is not None or (content := semantic_get(criteria, scope)) is not None): return content
+    if no_cache: semantic_override(criteria, scope)
+    async def complete():
+        response = await chat(model)(user_msg, **format_kw(model, components))
+        content = response.choices[0].message.content
+        await response_cache.aset(key, content)
+        semantic_set(criteria, scope, content)
+        return content
+    return await inflight.do(key, complete)
+
+async def stream_prompt_content(criteria, components, model='openai/gpt-4o', no_cache=False):
+    "Yield content deltas from the provider's token stream as they arrive (a cache hit arrives as one delta)"
+    user_msg = prompt_request(criteria, components)
+    key,scope = cache_key(model, system_msg, user_msg, temperature=0),(model, "prompt", tuple(sorted(components)))
+    if not no_cache and ((content := await response_cache.aget(key)) is not None or (content := semantic_get(criteria, scope)) is not None):
+        yield content
+        return
+    if no_cache: semantic_override(criteria, scope)
+    async def deltas():
+        from litellm import ModelResponseStream
+        content = ""
+        async for o in await chat(model)(user_msg, stream=True, **format_kw(model, components)):
+            if isinstance(o, ModelResponseStream) and (delta := o.choices[0].delta.content):
+                content += delta
+                yield delta
+        await response_cache.aset(key, content)
+        semantic_set(criteria, scope, content)
+    async for delta in inflight.stream(("stream", key), deltas): yield delta  # one upstream stream, replayed to everyone who asked for the same thing
+
+section_titles = {"role": "Role & Persona", "task": "Task", "format": "Output Format", "examples": "Examples"}
+section_defaults = {"role": "You are an expert assistant.", "format": "Provide a clear, well-structured response.", "examples": "Include relevant examples where appropriate."}
+
+def section_body(name, parsed, criteria, text=""):
+    "Text for one component: the user's own if given, else the model's, else a default"
+    if text and text.strip(): return text
+    value = parsed.get(name, section_defaults.get(name, criteria))
+    return value if isinstance(value, str) else json.dumps(value, indent=2)
+
+def assemble_prompt(parsed, criteria, components, role_text="", task_text="", format_text="", examples_text="", **kwargs):
+    texts = dict(role=role_text, task=task_text, format=format_text, examples=examples_text)
+    return "\n\n".join([f"# {section_titles[c]}\n{section_body(c, parsed, criteria, texts[c])}" for c in section_titles if c in components] or [f"# Request\n{criteria}"])
+
+def section_card(name, parsed, d): return Div(H4(section_titles[name]), Pre(section_body(name, parsed, d["criteria"], d.get(f"{name}_text")), cls='text-sm whitespace-pre-wrap'), cls='border p-3 rounded mb-2')
+
+def result_card(model, final_prompt):
+    return Div(DivFullySpaced(P(f"Model: {model}", cls='font-bold'), Button("Copy", onclick="navigator.clipboard.writeText(document.getElementById('prompt-text').textContent); alert('Copied!');", cls=ButtonT.ghost)), Pre(final_prompt, id="prompt-text", cls='border p-4 rounded bg-gray-50 text-sm whitespace-pre-wrap mt-2'))
+
+def index_form(preset="", job=None):
     data = apply_preset(preset) if preset else {}
     components_checked = data.get("components", [])
     return Form(
         Grid(
             Card(H3("Select & Customize Components"), *[Div(LabelCheckboxX(comp[1], name="components", value=comp[0], checked=comp[0] in components_checked, cls='mb-2'), TextArea(data.get(f"{comp[0]}_text", ""), placeholder=f"Enter your {comp[1].lower()}...", name=f"{comp[0]}_text", rows=2, cls='w-full mt-1 mb-3')) for comp in components]),
-            Card(H3("Configuration"), Div(Select(*[Option(p[1], value=p[0], selected=p[0]==preset) for p in presets], name="preset", id="preset-select", cls='w-full mb-2'), Button("Apply Preset", onclick="window.location.href='/?preset='+document.querySelector('select[name=preset]').value", cls=ButtonT.secondary + ' mb-4')), Select(*[Option(m[1], value=m[0]) for m in models], name="model", cls='w-full mb-4'), H4("Main Criteria"), TextArea(data.get("criteria", ""), placeholder="Describe what you want your prompt to do...", name="criteria", rows=6, cls='w-full mb-4'), Button("Generate Prompt", cls=ButtonT.primary, hx_post="/generate", hx_include="form", hx_target="#output")),
+            Card(H3("Configuration"), Div(Select(*[Option(p[1], value=p[0], selected=p[0]==preset) for p in presets], name="preset", id="preset-select", cls='w-full mb-2'), Button("Apply Preset", onclick="window.location.href='/?preset='+document.querySelector('select[name=preset]').value", cls=ButtonT.secondary + ' mb-4')), Select(*[Option(m[1], value=m[0]) for m in models], name="model", cls='w-full mb-4'), LabelCheckboxX("Stream tokens as they are generated", name="stream", value="1", checked=True, cls='mb-2'), LabelCheckboxX("Generate each component in parallel", name="parallel", value="1", cls='mb-2'), LabelCheckboxX("Skip cache and always call the model", name="no_cache", value="1", cls='mb-4'), H4("Main Criteria"), TextArea(data.get("criteria", ""), placeholder="Describe what you want your prompt to do...", name="criteria", rows=6, cls='w-full mb-4'), Button("Generate Prompt", cls=ButtonT.primary, hx_post="/generate", hx_include="form", hx_target="#output", hx_on__before_request="const o = htmx.find('#final-output'); if (o) htmx.trigger(o, 'htmx:abort')")),
             cols=2, gap=4
         ),
-        Card(H3("Generated Prompt"), Div("Your prompt will appear here...", id="output", cls='border p-4 min-h-32'))
+        Card(H3("Generated Prompt"), Div(job_view(job) if job else "Your prompt will appear here...", id="output", cls='border p-4 min-h-32'))
     )
 
+def catalog_version():
+    "Changes whenever the components, models or presets shown on the index page change"
+    return hash(repr((components, models, presets)))
+
+def render_index(request, preset):
+    "Index page HTML and ETag, rendered once per preset, theme, page/fragment and host, then served from `page_cache`"
+    full_page = not is_full_page(request, None)
+    key = repr((preset, theme.name, full_page, str(request.base_url), catalog_version()))
+    if (page := page_cache.get(key)) is not None:
+        page_lookups.inc(result="hit")
+        return page
+    page_lookups.inc(result="miss")
+    form = index_form(preset)
+    if full_page:
+        canonical = str(request.url.replace(query=f"preset={preset}" if preset else "")).replace('http://', 'https://', 1)
+        form = respond(request, [Title(app.title), Link(rel="canonical", href=canonical)], form)
+    html = to_xml(form)
+    page_cache[key] = page = (html, f'"{hashlib.sha256(html.encode()).hexdigest()[:16]}"')
+    return page
+
+@rt('/')
+def get(request, preset: str = "", job: str = ""):
+    if job: return Title(app.title), index_form(job=job)  # back to a queued generation after a reload; not cached
+    html,etag = render_index(request, preset if preset in dict(presets) else "")
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "HX-Request, HX-History-Restore-Request"}
+    if etag in request.headers.get("if-none-match", ""): return Response(status_code=304, headers=headers)
+    return HTMLResponse(html, headers=headers)
+
 @rt("/progress/{session_id}")
 def get_progress(session_id: str):
-    status = progress_state.get(session_id, {"progress": 0, "done": False})
-    if status["done"]: return Div()
-    return Progress(value=status["progress"], hx_get=f"/progress/{session_id}", hx_trigger="every 500ms", hx_swap="outerHTML")
+    job = generation_jobs.get(session_id)
+    if job is None or job["status"] not in ("queued", "running"): return Div()
+    return Progress(value=max(10, job["progress"]), hx_get=f"/progress/{session_id}", hx_trigger="every 500ms", hx_swap="outerHTML")
 
 @rt("/generate", methods=["POST"])
 async def generate(request):
-    form_data = await request.form()
+    with span("parse_form"): form_data = await request.form()
     criteria,components,model = form_data.get("criteria", ""),form_data.getlist("components"),form_data.get("model", "gpt-3.5-turbo")
     role_text,task_text,format_text,examples_text = form_data.get("role_text", ""),form_data.get("task_text", ""),form_data.get("format_text", ""),form_data.get("examples_text", "")
+    no_cache,parallel = bool(form_data.get("no_cache")),bool(form_data.get("parallel"))
     if not criteria.strip(): return Div("Please enter some criteria first!", cls='text-red-500')
-    session_id = str(uuid.uuid4())
-    progress_state[session_id] = {"progress": 10, "done": False}
-    form_json = json.dumps({"criteria": criteria, "components": components, "model": model, "role_text": role_text, "task_text": task_text, "format_text": format_text, "examples_text": examples_text, "session_id": session_id})
-    return Div(Progress(value=10, hx_get=f"/progress/{session_id}", hx_trigger="load, every 500ms", hx_swap="outerHTML"), Div(id="final-output", hx_post=f"/generate-result", hx_trigger="load delay:100ms", hx_vals=form_json))
-
-@rt("/generate-result", methods=["POST"])
-async def generate_result(request):
-    data = await request.form()
-    session_id,criteria,components,model = data.get("session_id"),data.get("criteria"),data.getlist("components"),data.get("model")
-    role_text,task_text,format_text,examples_text = data.get("role_text"),data.get("task_text"),data.get("format_text"),data.get("examples_text")
-    progress_state[session_id] = {"progress": 30, "done": False}
-    llm_content = generate_prompt_content(criteria, components if components else ["role", "task", "format"])
-    progress_state[session_id] = {"progress": 80, "done": False}
-    parsed = parse_llm_response(llm_content)
-    prompt_parts = []
-    if "role" in components: prompt_parts.append(f"# Role & Persona\n{role_text if role_text.strip() else parsed.get('role', 'You are an expert assistant.')}")
-    if "task" in components: prompt_parts.append(f"# Task\n{task_text if task_text.strip() else parsed.get('task', criteria)}")
-    if "format" in components: prompt_parts.append(f"# Output Format\n{format_text if format_text.strip() else parsed.get('format', 'Provide a clear, well-structured response.')}")
-    if "examples" in components: 
-        ex = parsed.get('examples', 'Include relevant examples where appropriate.')
-        ex = ex if isinstance(ex, str) else json.dumps(ex, indent=2)
-        prompt_parts.append(f"# Examples\n{examples_text if examples_text.strip() else ex}")
-    if not prompt_parts: prompt_parts.append(f"# Request\n{criteria}")
-    final_prompt = "\n\n".join(prompt_parts)
-    progress_state[session_id] = {"progress": 100, "done": True}
-    return Div(DivFullySpaced(P(f"Model: {model}", cls='font-bold'), Button("Copy", onclick="navigator.clipboard.writeText(document.getElementById('prompt-text').textContent); alert('Copied!');", cls=ButtonT.ghost)), Pre(final_prompt, id="prompt-text", cls='border p-4 rounded bg-gray-50 text-sm whitespace-pre-wrap mt-2'))
+    d = dict(criteria=criteria, components=components, model=model, role_text=role_text, task_text=task_text, format_text=format_text, examples_text=examples_text, no_cache=no_cache, parallel=parallel)
+    client = client_id(request)
+    try: admission.check(client)
+    except Overloaded as e: return busy(e)
+    if form_data.get("stream"):
+        session_id = str(uuid.uuid4())
+        tag(session_id=session_id)
+        await progress_state.aset(session_id, {"progress": 0, "done": False, "data": d, "client": client})
+        return Div(Button("Cancel", hx_post=f"/cancel/{session_id}", hx_target="#stream-view", hx_swap="outerHTML", cls=ButtonT.ghost), Div(id="sections", sse_swap="section", hx_swap="beforeend"), Pre(id="stream-text", sse_swap="token", hx_swap="beforeend", cls='border p-4 rounded bg-gray-50 text-sm whitespace-pre-wrap'), id="stream-view", hx_ext="sse", sse_connect=f"/stream/{session_id}", sse_swap="done", sse_close="done")
+    try: session_id = await asyncio.to_thread(generation_jobs.submit, dict(d, client=client), key=job_key(d), client=client)  # identical requests share a job whoever sent them
+    except QueueFull as e: return busy(admission.reject("interactive", "job_queue_full", e.queued))  # runners only take jobs as admission slots free up, so cap what waits for them
+    tag(session_id=session_id)
+    return job_view(session_id), HtmxResponseHeaders(push_url=f"/?job={session_id}")
+
+def busy(e):
+    "A 503 with Retry-After: refusing straight away beats making every request wait behind a spike"
+    return HTMLResponse(to_xml(Div(str(e), cls='text-red-500')), status_code=503, headers={"Retry-After": str(e.retry_after)})
+
+def job_view(session_id):
+    "Progress, a cancel button and the result of a queued generation, which `/?job=<id>` shows again after a reload or reconnect"
+    return Div(Progress(value=10, hx_get=f"/progress/{session_id}", hx_trigger="load, every 500ms", hx_swap="outerHTML"), Button("Cancel", hx_post=f"/cancel/{session_id}", hx_target="#final-output", cls=ButtonT.ghost),
+               Div(id="final-output", hx_get=f"/result/{session_id}", hx_trigger="load"))
+
+async def run_generation(session_id, d):
+    "Generate, assemble and render one non-streaming result; runs as a job, so it outlives the request and survives a worker restart"
+    with trace_task("generation", session_id=session_id):
+        await asyncio.to_thread(generation_jobs.set_progress, session_id, 30)
+        try:
+            async with admission.slot(d.get("client", "unknown")):
+                with span("generate", parallel=d["parallel"]):
+                    if d["parallel"]: parsed = {c: text async for c,text in iter_components(d["criteria"], to_generate(d["components"], d), no_cache=d["no_cache"])}
+                    else: content = await generate_prompt_content(d["criteria"], d["components"] if d["components"] else ["role", "task", "format"], no_cache=d["no_cache"])
+            if not d["parallel"]:
+                with span("parse_response"): parsed = repair_json(content)
+        except Exception as e:
+            ERRORS.inc(where="generate", type=type(e).__name__)
+            raise
+        await asyncio.to_thread(generation_jobs.set_progress, session_id, 80)
+        with span("assemble"): return to_xml(result_card(d["model"], assemble_prompt(parsed, **d)))
+
+generation_jobs = queue_from_env(run_generation)
+
+def job_html(job):
+    if job is None: return Div("This generation has expired, please generate again.", cls='text-red-500')
+    if job["status"] == "done": return NotStr(job["result"])
+    if job["status"] == "failed": return Div(f"Error generating prompt: {job['error']}", cls='text-red-500')
+    if job["status"] == "cancelled": return Div("Generation cancelled.", cls='text-gray-500')
+    return Div("Still generating, reload to check again.", cls='text-gray-500')
+
+@rt("/result/{session_id}")
+async def get_result(request, session_id: str):
+    tag(session_id=session_id)
+    try:
+        with waiting_on_provider(): return job_html(await unless_disconnected(request, generation_jobs.wait(session_id)))
+    except Disconnected:
+        generation_jobs.abandon(session_id)  # cancelled unless the page comes back for it (a reload, or another tab) within the grace period
+        return Response(status_code=499)
+
+@rt("/cancel/{session_id}", methods=["POST"])
+def cancel(request, session_id: str):
+    "Stop a job, or a stream: swapping the reply in over the stream closes its event source, and that disconnect stops the provider call"
+    progress_state.pop(session_id, None)  # a stream that hasn't connected yet never starts
+    generation_jobs.cancel(session_id, client=client_id(request))  # a job other clients also asked for keeps running for them
+    job = generation_jobs.get(session_id)
+    return job_html(job) if job and job["status"] not in ("queued", "running") else Div("Generation cancelled.", cls='text-gray-500')
+
+@rt("/jobs/{session_id}")
+def job_status(session_id: str):
+    job = generation_jobs.get(session_id)
+    if job is None: return JSONResponse({"error": "No such job"}, status_code=404)
+    return {k: job[k] for k in ("id", "status", "progress", "error", "attempts", "created", "updated")}
+
+async def parallel_events(d):
+    "SSE events for a parallel generation: a `section` as each component's own call finishes, then the assembled prompt as `done`"
+    parsed = {}
+    async for c,text in iter_components(d["criteria"], to_generate(d["components"], d), no_cache=d["no_cache"]):
+        parsed[c] = text
+        yield sse_message(section_card(c, parsed, d), event="section")
+    yield sse_message(result_card(d["model"], assemble_prompt(parsed, **d)), event="done")
+
+async def stream_events(session_id, d):
+    "SSE events for one generation: a `token` per provider chunk, a `section` as each component's value completes, then the assembled prompt as `done`"
+    parser = JsonObjectStream()
+    try:
+        with span("stream", parallel=bool(d.get("parallel"))):
+            if d.get("parallel"):
+                async for msg in parallel_events(d): yield msg
+                return
+            async for delta in stream_prompt_content(d["criteria"], d["components"] if d["components"] else ["role", "task", "format"], no_cache=d["no_cache"]):
+                yield sse_message(Span(delta), event="token")
+                for k,v in parser.feed(delta):
+                    if k in d["components"]: yield sse_message(section_card(k, {k: v}, d), event="section")
+        with span("assemble"): final_prompt = assemble_prompt(parser.partial(), **d)
+        yield sse_message(result_card(d["model"], final_prompt), event="done")
+    except Exception as e:
+        ERRORS.inc(where="stream", type=type(e).__name__)
+        yield sse_message(Div(f"Error generating prompt: {e}", cls='text-red-500'), event="done")
+
+@rt("/metrics")
+def get_metrics(): return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+async def admitted(client, events):
+    "`events` while holding an admission slot, or a busy message in their place when the wait queue can't take them"
+    try:
+        async with admission.slot(client):
+            async for msg in events: yield msg
+    except Overloaded as e: yield sse_message(Div(str(e), cls='text-red-500'), event="done")
+    except (asyncio.CancelledError, GeneratorExit):
+        GENERATIONS_CANCELLED.inc(reason="disconnect")  # the event source closed (tab closed, Cancel, or a new Generate), which cancels the provider call too
+        raise
+
+@rt("/stream/{session_id}")
+async def stream(session_id: str):
+    tag(session_id=session_id)
+    state = await progress_state.apop(session_id, {})
+    if state.get("data") is None: return EventStream(iter([sse_message(Div("This generation has expired, please generate again.", cls='text-red-500'), event="done")]))
+    return EventStream(admitted(state.get("client", "unknown"), stream_events(session_id, state["data"])))
 
-serve()
+if __name__ == "__main__": run("app")
@@ -3,8 +3,21 @@ from monsterui.all import *
 import os
 import asyncio
 from dotenv import load_dotenv
-import litellm
 import json
+import uuid
+from cache import cache_key, cache_from_env
+from hedge import hedger_from_env
+from assets import Asset
+from server import app_options, run
+from history import history_from_env
+from clients import registry, warm_imports
+from templates import library_from_env, normalize
+from metrics import CONTENT_TYPE, ERRORS, GENERATIONS_CANCELLED, MetricsMiddleware, metrics, watch_admission, watch_cache, watch_flights, watch_pools, watch_semantic
+from tracing import TracingMiddleware, span
+from semantic import semantic_cache_from_env
+from coalesce import singleflight_from_env
+from admission import Overloaded, admission_from_env, client_id
+from disconnect import Disconnected, unless_disconnected
 
 # Load environment variables
 load_dotenv()
@@ -12,10 +25,46 @@ load_dotenv()
 # App setup with MonsterUI blue theme
 app,rt = fast_app(
     hdrs=Theme.blue.headers(),
-    live=True,   # Enable live reload
-    debug=True   # Enable debug mode for better error messages
+    # Live reload and debug tracebacks in development only;
+    # `python app_bkp.py --prod` or ENVIRONMENT=production turns both off
+    **app_options()
 )
 
+# Request timing for /metrics, split into provider wait and our own overhead
+app.add_middleware(MetricsMiddleware)
+
+# Opt-in stage spans (TRACE_PATH, OTLP/JSON lines) and stack dumps for slow requests (PROFILE_SLOW_MS)
+app.add_middleware(TracingMiddleware)
+
+# Cache of LLM responses keyed by a hash of model, messages and sampling settings
+response_cache = cache_from_env()
+
+# Near-duplicate criteria ("python loops tutorial for beginners" vs "beginner tutorial on Python loops") reuse a generation too
+semantic_cache = semantic_cache_from_env()
+
+# Saved prompt versions, searchable and shared by every worker (SQLite in WAL mode)
+prompt_history = history_from_env()
+
+# Custom templates, deduplicated by content hash and synced to browsers by version number
+template_library = library_from_env()
+
+# Optional hedging to a backup model on a slow first token, plus a fallback chain for failed calls
+hedger = hedger_from_env()
+
+# Identical generations already in flight are joined rather than sent to the provider again
+inflight = singleflight_from_env()
+
+# Bounded concurrent generations and wait queue; interactive requests go ahead of batch items, clients take turns
+admission = admission_from_env()
+
+# Cache hit rates and connection pool utilization are read from their own counters at scrape time
+watch_cache("response", response_cache)
+if semantic_cache is not None:
+    watch_semantic("semantic", semantic_cache)
+watch_pools(registry)
+watch_flights("generation", inflight)
+watch_admission(admission)
+
 # Define the 7 core prompt components
 prompt_components = [
     ("role", "Role & Persona", "Define the AI's role, expertise, and perspective"),
@@ -37,6 +86,18 @@ llm_models = [
     ("gemini-pro", "Gemini Pro", "Google's flagship model"),
 ]
 
+@app.on_event("startup")
+async def open_clients():
+    """Create one pooled HTTP client per provider up front, so requests never pay for client setup"""
+    registry.warm([model for model, _, _ in llm_models])
+    # LiteLLM loads on the first generation, or here with LLM_WARMUP=true, rather than at import
+    warm_imports()
+
+@app.on_event("shutdown")
+async def close_clients():
+    """Close pooled connections once in-flight requests have drained"""
+    await registry.aclose()
+
 # Enhanced prompt templates based on components
 prompt_templates = {
     "role": "You are a {expertise} with deep knowledge in {domain}. Your approach is {style} and you always {approach}.",
@@ -88,6 +149,10 @@ template_presets = [
     }
 ]
 
+# Client script and preset data, hashed and precompressed once so browsers can cache them indefinitely
+client_script = Asset.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "prompt_maker.js"), "text/javascript")
+presets_json = Asset(json.dumps(template_presets), "application/json")
+
 def component_selector():
     """Build the component selection interface"""
     return Div(
@@ -142,173 +207,6 @@ def component_selector():
             ),
             cls='mt-6'
         ),
-        
-        # JavaScript for Select All / Clear All and Templates
-        Script(f"""
-            // Template presets data
-            const templatePresets = {json.dumps(template_presets)};
-            
-            function selectAll() {{
-                document.querySelectorAll('input[name="components"]').forEach(cb => cb.checked = true);
-            }}
-            function clearAll() {{
-                document.querySelectorAll('input[name="components"]').forEach(cb => cb.checked = false);
-            }}
-            
-            function applyTemplate() {{
-                const select = document.getElementById('template_preset');
-                const index = select.value;
-                
-                if (index === '') return;
-                
-                const template = templatePresets[index];
-                
-                // Clear all first
-                clearAll();
-                
-                // Apply template components
-                template.components.forEach(component => {{
-                    const checkbox = document.getElementById(`comp_${{component}}`);
-                    if (checkbox) checkbox.checked = true;
-                }});
-                
-                // Show feedback
-                const option = select.options[select.selectedIndex];
-                alert(`Applied template: ${{template.name}}`);
-                
-                // Reset selection
-                select.value = '';
-            }}
-            
-            function saveTemplate() {{
-                const selectedComponents = Array.from(document.querySelectorAll('input[name="components"]:checked'))
-                    .map(cb => cb.value);
-                
-                if (selectedComponents.length === 0) {{
-                    alert('Please select some components first!');
-                    return;
-                }}
-                
-                const name = prompt('Template name:');
-                if (!name) return;
-                
-                const description = prompt('Template description:');
-                if (!description) return;
-                
-                const category = prompt('Category (e.g., Writing, Technical, Business):') || 'Custom';
-                
-                // Save to localStorage
-                const customTemplates = JSON.parse(localStorage.getItem('custom_templates') || '[]');
-                customTemplates.push({{
-                    name: name,
-                    description: description,
-                    components: selectedComponents,
-                    category: category,
-                    created: new Date().toLocaleString(),
-                    id: Date.now()
-                }});
-                
-                localStorage.setItem('custom_templates', JSON.stringify(customTemplates));
-                
-                alert(`Template "${{name}}" saved successfully!`);
-                updateTemplateDropdown();
-            }}
-            
-            function showTemplateManager() {{
-                const customTemplates = JSON.parse(localStorage.getItem('custom_templates') || '[]');
-                
-                if (customTemplates.length === 0) {{
-                    alert('No custom templates saved yet. Create one using "Save as Template"!');
-                    return;
-                }}
-                
-                let templateList = customTemplates.map((template, index) => 
-                    `${{index + 1}}. ${{template.name}} (${{template.category}}) - ${{template.components.length}} components`
-                ).join('\\n');
-                
-                const choice = prompt(`Custom Templates:\\n\\n${{templateList}}\\n\\nEnter template number to delete, or press Cancel:`);
-                
-                if (choice && !isNaN(choice)) {{
-                    const index = parseInt(choice) - 1;
-                    if (index >= 0 && index < customTemplates.length) {{
-                        const template = customTemplates[index];
-                        if (confirm(`Delete template "${{template.name}}"?`)) {{
-                            customTemplates.splice(index, 1);
-                            localStorage.setItem('custom_templates', JSON.stringify(customTemplates));
-                            alert('Template deleted!');
-                            updateTemplateDropdown();
-                        }}
-                    }}
-                }}
-            }}
-            
-            function updateTemplateDropdown() {{
-                const select = document.getElementById('template_preset');
-                const customTemplates = JSON.parse(localStorage.getItem('custom_templates') || '[]');
-                
-                // Clear existing options except first
-                while (select.options.length > 1) {{
-                    select.removeChild(select.lastChild);
-                }}
-                
-                // Add built-in presets
-                templatePresets.forEach((preset, index) => {{
-                    const option = new Option(`${{preset.name}} - ${{preset.description}}`, index);
-                    select.appendChild(option);
-                }});
-                
-                // Add custom templates
-                if (customTemplates.length > 0) {{
-                    const separator = new Option('--- Custom Templates ---', '', false, false);
-                    separator.disabled = true;
-                    select.appendChild(separator);
-                    
-                    customTemplates.forEach((template, index) => {{
-                        const option = new Option(`${{template.name}} - ${{template.description}}`, `custom_${{index}}`);
-                        select.appendChild(option);
-                    }});
-                }}
-            }}
-            
-            // Enhanced applyTemplate to handle custom templates
-            function applyTemplate() {{
-                const select = document.getElementById('template_preset');
-                const value = select.value;
-                
-                if (value === '') return;
-                
-                let template;
-                if (value.startsWith('custom_')) {{
-                    const customTemplates = JSON.parse(localStorage.getItem('custom_templates') || '[]');
-                    const index = parseInt(value.replace('custom_', ''));
-                    template = customTemplates[index];
-                }} else {{
-                    template = templatePresets[value];
-                }}
-                
-                if (!template) return;
-                
-                // Clear all first
-                clearAll();
-                
-                // Apply template components
-                template.components.forEach(component => {{
-                    const checkbox = document.getElementById(`comp_${{component}}`);
-                    if (checkbox) checkbox.checked = true;
-                }});
-                
-                // Show feedback
-                alert(`Applied template: ${{template.name}}`);
-                
-                // Reset selection
-                select.value = '';
-            }}
-            
-            // Initialize template dropdown on page load
-            document.addEventListener('DOMContentLoaded', function() {{
-                updateTemplateDropdown();
-            }});
-        """)
     )
 
 def main_input_area():
@@ -350,55 +248,6 @@ Your criteria should be specific, actionable, and include any constraints or pre
             ),
             cls='mt-2 px-1'
         ),
-        
-        # JavaScript for word count and auto-save
-        Script("""
-            let saveTimeout;
-            
-            function updateWordCount() {
-                const textarea = document.getElementById('main_criteria');
-                const text = textarea.value.trim();
-                
-                const wordCount = text === '' ? 0 : text.split(/\s+/).length;
-                const charCount = textarea.value.length;
-                
-                document.getElementById('word-count').textContent = wordCount;
-                document.getElementById('char-count').textContent = charCount;
-            }
-            
-            function autoSave() {
-                const status = document.getElementById('save-status');
-                status.classList.remove('opacity-0');
-                status.textContent = 'Saving...';
-                status.className = status.className.replace('text-green-600', 'text-yellow-600');
-                
-                // Clear existing timeout
-                clearTimeout(saveTimeout);
-                
-                // Set new timeout for auto-save
-                saveTimeout = setTimeout(() => {
-                    // Simulate save (in real app, this would send to server)
-                    localStorage.setItem('prompt_criteria', document.getElementById('main_criteria').value);
-                    
-                    status.textContent = 'Auto-saved';
-                    status.className = status.className.replace('text-yellow-600', 'text-green-600');
-                    
-                    // Hide status after 2 seconds
-                    setTimeout(() => {
-                        status.classList.add('opacity-0');
-                    }, 2000);
-                }, 1000);
-            }
-            
-            // Load saved content on page load
-            document.addEventListener('DOMContentLoaded', function() {
-                const saved = localStorage.getItem('prompt_criteria');
-                if (saved) {
-                    document.getElementById('main_criteria').value = saved;
-                    updateWordCount();
-                }
-            });
-        """)
     )
 
 def output_panel():
@@ -467,702 +316,316 @@ def output_panel():
             
             cls='mb-4'
         ),
-        
-        # JavaScript for generation and actions
-        Script("""
-            function previewPrompt() {
-                const output = document.getElementById('generated_prompt');
-                const selectedComponents = Array.from(document.querySelectorAll('input[name="components"]:checked'))
-                    .map(cb => cb.value);
-                const criteria = document.getElementById('main_criteria').value.trim();
-                
-                if (!criteria) {
-                    alert('Please enter your criteria first!');
-                    return;
-                }
-                
-                const prompt = buildStructuredPrompt(selectedComponents, criteria);
-                output.value = prompt;
-                
-                // Show preview feedback
-                const status = document.getElementById('gen-status');
-                status.textContent = 'Preview Generated';
-                status.className = status.className.replace('text-muted-foreground', 'text-blue-600');
-                setTimeout(() => {
-                    status.textContent = 'Ready';
-                    status.className = status.className.replace('text-blue-600', 'text-muted-foreground');
-                }, 2000);
-            }
-            
-            async function generatePrompt() {
-                const btn = document.getElementById('generate_btn');
-                const status = document.getElementById('gen-status');
-                const spinner = document.getElementById('gen-spinner');
-                const output = document.getElementById('generated_prompt');
-                
-                // Get selected components
-                const selectedComponents = Array.from(document.querySelectorAll('input[name="components"]:checked'))
-                    .map(cb => cb.value);
-                
-                // Get main criteria
-                const criteria = document.getElementById('main_criteria').value.trim();
-                
-                if (!criteria) {
-                    alert('Please enter your criteria first!');
-                    return;
-                }
-                
-                // Get configuration
-                const model = document.getElementById('llm_model').value || 'gpt-3.5-turbo';
-                const customConditions = document.getElementById('custom_conditions').value || '';
-                
-                // Update UI for generation
-                btn.disabled = true;
-                status.textContent = 'Generating with AI...';
-                status.className = status.className.replace('text-muted-foreground', 'text-blue-600');
-                spinner.classList.remove('hidden');
-                
-                try {
-                    // Call real API
-                    const response = await fetch('/api/generate', {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify({
-                            components: selectedComponents,
-                            criteria: criteria,
-                            custom_conditions: customConditions,
-                            model: model
-                        })
-                    });
-                    
-                    const result = await response.json();
-                    
-                    if (result.success) {
-                        output.value = result.prompt;
-                        status.textContent = 'AI Generation Complete';
-                        status.className = status.className.replace('text-blue-600', 'text-green-600');
-                    } else {
-                        output.value = `Error: ${result.error}`;
-                        status.textContent = 'Generation Error';
-                        status.className = status.className.replace('text-blue-600', 'text-red-600');
-                    }
-                } catch (error) {
-                    output.value = `Network error: ${error.message}`;
-                    status.textContent = 'Network Error';
-                    status.className = status.className.replace('text-blue-600', 'text-red-600');
-                }
-                
-                // Reset UI
-                btn.disabled = false;
-                spinner.classList.add('hidden');
-                
-                // Auto-hide status after 3 seconds
-                setTimeout(() => {
-                    status.textContent = 'Ready';
-                    status.className = status.className.replace(/text-(green|red)-600/, 'text-muted-foreground');
-                }, 3000);
-            }
-            
-            function buildStructuredPrompt(components, criteria) {
-                let prompt = `# AI Prompt\\n\\n`;
-                
-                if (components.includes('role')) {
-                    prompt += `## Role & Persona\\nAct as an expert in the relevant field with deep knowledge and experience.\\n\\n`;
-                }
-                
-                if (components.includes('task')) {
-                    prompt += `## Task\\n${criteria}\\n\\n`;
-                }
-                
-                if (components.includes('context')) {
-                    prompt += `## Context\\nConsider the broader context and background information relevant to this task.\\n\\n`;
-                }
-                
-                if (components.includes('format')) {
-                    prompt += `## Output Format\\nProvide a clear, well-structured response that is easy to understand and actionable.\\n\\n`;
-                }
-                
-                if (components.includes('examples')) {
-                    prompt += `## Examples\\nInclude relevant examples to illustrate key points where appropriate.\\n\\n`;
-                }
-                
-                if (components.includes('constraints')) {
-                    prompt += `## Constraints\\nEnsure the response is accurate, helpful, and follows best practices.\\n\\n`;
-                }
-                
-                if (components.includes('evaluation')) {
-                    prompt += `## Success Criteria\\nThe response should be comprehensive, actionable, and directly address the stated requirements.\\n\\n`;
-                }
-                
-                // Add custom conditions if present
-                const customConditions = document.getElementById('custom_conditions').value.trim();
-                if (customConditions) {
-                    prompt += `## Additional Requirements\\n${customConditions}\\n\\n`;
-                }
-                
-                return prompt;
-            }
-            
-            function copyPrompt() {
-                const output = document.getElementById('generated_prompt');
-                output.select();
-                document.execCommand('copy');
-                
-                // Show temporary feedback
-                const btn = event.target;
-                const originalText = btn.textContent;
-                btn.textContent = 'Copied!';
-                setTimeout(() => btn.textContent = originalText, 1500);
-            }
-            
-            function editPrompt() {
-                const output = document.getElementById('generated_prompt');
-                output.readOnly = !output.readOnly;
-                
-                const btn = event.target;
-                btn.textContent = output.readOnly ? 'Edit' : 'Lock';
-            }
-            
-            function saveToHistory() {
-                const prompt = document.getElementById('generated_prompt').value;
-                if (!prompt.trim()) {
-                    alert('No prompt to save!');
-                    return;
-                }
-                
-                // Get existing history and calculate next version
-                const history = JSON.parse(localStorage.getItem('prompt_history') || '[]');
-                const criteria = document.getElementById('main_criteria').value;
-                
-                // Find similar prompts (same criteria) to determine version
-                const similarPrompts = history.filter(h => h.criteria === criteria);
-                const nextVersion = `v${similarPrompts.length + 1}.0`;
-                
-                // Create new prompt entry
-                const newPrompt = {
-                    id: Date.now(),
-                    version: nextVersion,
-                    prompt: prompt,
-                    timestamp: new Date().toLocaleString(),
-                    criteria: criteria,
-                    components: Array.from(document.querySelectorAll('input[name="components"]:checked')).map(cb => cb.value),
-                    model: document.getElementById('llm_model').value || 'gpt-3.5-turbo',
-                    wordCount: prompt.trim().split(/\s+/).length,
-                    charCount: prompt.length
-                };
-                
-                history.unshift(newPrompt);
-                localStorage.setItem('prompt_history', JSON.stringify(history.slice(0, 20))); // Keep 20 prompts
-                
-                // Update button to show next version
-                const btn = document.getElementById('save_btn');
-                const nextVersionNumber = `v${similarPrompts.length + 2}.0`;
-                btn.textContent = `Save ${nextVersionNumber}`;
-                
-                // Show feedback
-                const originalText = btn.textContent;
-                btn.textContent = `Saved ${nextVersion}!`;
-                setTimeout(() => btn.textContent = originalText, 2000);
-                
-                // Update history display if visible
-                updateHistoryDisplay();
-            }
-            
-            function showExportModal() {
-                const prompt = document.getElementById('generated_prompt').value;
-                if (!prompt.trim()) {
-                    alert('No prompt to export!');
-                    return;
-                }
-                
-                // Create modal content
-                const modalContent = `
-                    <div style="position: fixed; top: 0; left: 0; width: 100%; height: 100%; background: rgba(0,0,0,0.5); z-index: 1000; display: flex; align-items: center; justify-content: center;" onclick="closeExportModal()">
-                        <div style="background: white; padding: 2rem; border-radius: 8px; max-width: 500px; width: 90%;" onclick="event.stopPropagation();">
-                            <h3 style="margin-top: 0;">Export Prompt</h3>
-                            <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 1rem; margin: 1rem 0;">
-                                <button onclick="exportAs('text')" style="padding: 0.5rem; border: 1px solid #ccc; border-radius: 4px; background: #f8f9fa;">Plain Text</button>
-                                <button onclick="exportAs('markdown')" style="padding: 0.5rem; border: 1px solid #ccc; border-radius: 4px; background: #f8f9fa;">Markdown</button>
-                                <button onclick="exportAs('json')" style="padding: 0.5rem; border: 1px solid #ccc; border-radius: 4px; background: #f8f9fa;">JSON</button>
-                                <button onclick="exportAs('copy')" style="padding: 0.5rem; border: 1px solid #ccc; border-radius: 4px; background: #e3f2fd;">Copy to Clipboard</button>
-                            </div>
-                            <button onclick="closeExportModal()" style="width: 100%; padding: 0.5rem; border: 1px solid #ccc; border-radius: 4px; background: #f5f5f5;">Close</button>
-                        </div>
-                    </div>
-                `;
-                
-                // Add modal to page
-                const modal = document.createElement('div');
-                modal.id = 'export-modal';
-                modal.innerHTML = modalContent;
-                document.body.appendChild(modal);
-            }
-            
-            function closeExportModal() {
-                const modal = document.getElementById('export-modal');
-                if (modal) modal.remove();
-            }
-            
-            function exportAs(format) {
-                const prompt = document.getElementById('generated_prompt').value;
-                const criteria = document.getElementById('main_criteria').value;
-                const timestamp = new Date().toLocaleString();
-                const components = Array.from(document.querySelectorAll('input[name="components"]:checked')).map(cb => cb.value);
-                
-                let content, filename, mimeType;
-                
-                switch (format) {
-                    case 'text':
-                        content = prompt;
-                        filename = `prompt_${Date.now()}.txt`;
-                        mimeType = 'text/plain';
-                        break;
-                        
-                    case 'markdown':
-                        content = `# AI Prompt Export\\n\\n**Generated:** ${timestamp}\\n**Components:** ${components.join(', ')}\\n\\n## Original Criteria\\n${criteria}\\n\\n## Generated Prompt\\n${prompt}`;
-                        filename = `prompt_${Date.now()}.md`;
-                        mimeType = 'text/markdown';
-                        break;
-                        
-                    case 'json':
-                        content = JSON.stringify({
-                            timestamp,
-                            criteria,
-                            components,
-                            prompt,
-                            metadata: {
-                                wordCount: prompt.trim().split(/\s+/).length,
-                                charCount: prompt.length,
-                                model: document.getElementById('llm_model').value
-                            }
-                        }, null, 2);
-                        filename = `prompt_${Date.now()}.json`;
-                        mimeType = 'application/json';
-                        break;
-                        
-                    case 'copy':
-                        navigator.clipboard.writeText(prompt).then(() => {
-                            alert('Prompt copied to clipboard!');
-                        });
-                        closeExportModal();
-                        return;
-                }
-                
-                // Download file
-                const blob = new Blob([content], { type: mimeType });
-                const url = URL.createObjectURL(blob);
-                const a = document.createElement('a');
-                a.href = url;
-                a.download = filename;
-                a.click();
-                URL.revokeObjectURL(url);
-                
-                closeExportModal();
-            }
-            
-            function updateHistoryDisplay() {
-                const history = JSON.parse(localStorage.getItem('prompt_history') || '[]');
-                const count = document.getElementById('history_count');
-                const historyList = document.getElementById('history_list');
-                
-                // Update count
-                count.textContent = `${history.length} saved`;
-                
-                // Update history list
-                if (history.length === 0) {
-                    historyList.innerHTML = '<p class="text-muted-foreground">No prompts saved yet. Generate and save prompts to see them here.</p>';
-                } else {
-                    historyList.innerHTML = history.slice(0, 5).map(item => `
-                        <div class="border-b pb-3 mb-3 cursor-pointer hover:bg-muted p-2 rounded" onclick="loadPrompt(${item.id})">
-                            <div class="flex justify-between items-start mb-1">
-                                <strong class="text-sm">${item.version}</strong>
-                                <small class="text-muted-foreground">${item.timestamp}</small>
-                            </div>
-                            <div class="text-sm text-muted-foreground mb-1">
-                                Model: ${item.model} | ${item.wordCount} words
-                            </div>
-                            <div class="text-sm line-clamp-2">${item.criteria.substring(0, 100)}${item.criteria.length > 100 ? '...' : ''}</div>
-                        </div>
-                    `).join('');
-                    
-                    if (history.length > 5) {
-                        historyList.innerHTML += `<p class="text-center text-muted-foreground text-sm">And ${history.length - 5} more...</p>`;
-                    }
-                }
-            }
-            
-            function toggleHistory() {
-                const panel = document.getElementById('history_panel');
-                const btn = document.getElementById('history_btn');
-                
-                if (panel.classList.contains('hidden')) {
-                    panel.classList.remove('hidden');
-                    btn.textContent = '︽ Hide History';
-                    updateHistoryDisplay();
-                } else {
-                    panel.classList.add('hidden');
-                    btn.innerHTML = '<svg class="w-4 h-4 mr-2" fill="currentColor"><use href="#history"></use></svg>History';
-                }
-            }
-            
-            function loadPrompt(promptId) {
-                const history = JSON.parse(localStorage.getItem('prompt_history') || '[]');
-                const prompt = history.find(p => p.id === promptId);
-                
-                if (prompt) {
-                    // Load prompt data
-                    document.getElementById('main_criteria').value = prompt.criteria;
-                    document.getElementById('generated_prompt').value = prompt.prompt;
-                    
-                    // Update component selection
-                    document.querySelectorAll('input[name="components"]').forEach(cb => {
-                        cb.checked = prompt.components.includes(cb.value);
-                    });
-                    
-                    // Update model selection
-                    document.getElementById('llm_model').value = prompt.model;
-                    
-                    // Update word count
-                    updateWordCount();
-                    
-                    // Hide history panel
-                    toggleHistory();
-                    
-                    alert(`Loaded ${prompt.version} from ${prompt.timestamp}`);
-                }
-            }
-            
-            function exportTemplates() {
-                const customTemplates = JSON.parse(localStorage.getItem('custom_templates') || '[]');
-                
-                if (customTemplates.length === 0) {
-                    alert('No custom templates to export. Create some templates first!');
-                    return;
-                }
-                
-                const exportData = {
-                    templates: customTemplates,
-                    exported: new Date().toISOString(),
-                    version: '1.0',
-                    app: 'AI Prompt Maker'
-                };
-                
-                const blob = new Blob([JSON.stringify(exportData, null, 2)], { type: 'application/json' });
-                const url = URL.createObjectURL(blob);
-                const a = document.createElement('a');
-                a.href = url;
-                a.download = `prompt_templates_${new Date().toISOString().split('T')[0]}.json`;
-                a.click();
-                URL.revokeObjectURL(url);
-                
-                alert(`Exported ${customTemplates.length} templates successfully!`);
-            }
-            
-            function importTemplates() {
-                const input = document.createElement('input');
-                input.type = 'file';
-                input.accept = '.json';
-                input.onchange = function(event) {
-                    const file = event.target.files[0];
-                    if (!file) return;
-                    
-                    const reader = new FileReader();
-                    reader.onload = function(e) {
-                        try {
-                            const importData = JSON.parse(e.target.result);
-                            
-                            if (!importData.templates || !Array.isArray(importData.templates)) {
-                                alert('Invalid template file format!');
-                                return;
-                            }
-                            
-                            const existingTemplates = JSON.parse(localStorage.getItem('custom_templates') || '[]');
-                            const newTemplates = importData.templates;
-                            
-                            // Ask user about merge strategy
-                            const choice = confirm(`Import ${newTemplates.length} templates?\\n\\nOK = Merge with existing\\nCancel = Replace all existing`);
-                            
-                            let finalTemplates;
-                            if (choice) {
-                                // Merge - avoid duplicates by name
-                                const existingNames = existingTemplates.map(t => t.name);
-                                const uniqueNew = newTemplates.filter(t => !existingNames.includes(t.name));
-                                finalTemplates = [...existingTemplates, ...uniqueNew];
-                                
-                                if (uniqueNew.length < newTemplates.length) {
-                                    alert(`Imported ${uniqueNew.length} new templates. ${newTemplates.length - uniqueNew.length} were skipped (duplicates).`);
-                                } else {
-                                    alert(`Imported ${uniqueNew.length} templates successfully!`);
-                                }
-                            } else {
-                                // Replace
-                                finalTemplates = newTemplates;
-                                alert(`Replaced all templates with ${newTemplates.length} imported templates!`);
-                            }
-                            
-                            localStorage.setItem('custom_templates', JSON.stringify(finalTemplates));
-                            updateTemplateDropdown();
-                            
-                        } catch (error) {
-                            alert('Error reading template file: ' + error.message);
-                        }
-                    };
-                    reader.readAsText(file);
-                };
-                input.click();
-            }
-            
-            function showHelp() {
-                const helpContent = `
-                    <div style="position: fixed; top: 0; left: 0; width: 100%; height: 100%; background: rgba(0,0,0,0.8); z-index: 2000; display: flex; align-items: center; justify-content: center;" onclick="closeHelp()">
-                        <div style="background: white; padding: 2rem; border-radius: 12px; max-width: 600px; width: 90%; max-height: 80vh; overflow-y: auto;" onclick="event.stopPropagation();">
-                            <div style="display: flex; justify-content: between; align-items: center; margin-bottom: 1rem;">
-                                <h2 style="margin: 0;">🚀 AI Prompt Maker - Quick Help</h2>
-                                <button onclick="closeHelp()" style="background: #f5f5f5; border: 1px solid #ddd; border-radius: 4px; padding: 0.5rem; cursor: pointer;">✕</button>
-                            </div>
-                            
-                            <div style="space-y: 1rem;">
-                                <div>
-                                    <h3 style="color: #2563eb; margin-bottom: 0.5rem;">⌨️ Keyboard Shortcuts</h3>
-                                    <div style="font-family: monospace; font-size: 0.9rem; line-height: 1.6;">
-                                        <div><strong>Ctrl+P</strong> - Preview prompt</div>
-                                        <div><strong>Ctrl+G</strong> - Generate with AI</div>
-                                        <div><strong>Ctrl+S</strong> - Save to history</div>
-                                        <div><strong>Ctrl+H</strong> - Toggle history</div>
-                                        <div><strong>Ctrl+E</strong> - Export prompt</div>
-                                        <div><strong>Ctrl+A</strong> - Select all components</div>
-                                        <div><strong>Ctrl+D</strong> - Clear all components</div>
-                                        <div><strong>?</strong> - Show this help</div>
-                                        <div><strong>Escape</strong> - Close modals</div>
-                                    </div>
-                                </div>
-                                
-                                <div>
-                                    <h3 style="color: #2563eb; margin-bottom: 0.5rem;">📝 Quick Start</h3>
-                                    <ol style="padding-left: 1.2rem; line-height: 1.6;">
-                                        <li>Choose a template or select components manually</li>
-                                        <li>Enter your criteria in the main text area</li>
-                                        <li>Click Preview for instant results or Generate with AI for enhanced prompts</li>
-                                        <li>Save your prompts and export them for later use</li>
-                                    </ol>
-                                </div>
-                                
-                                <div>
-                                    <h3 style="color: #2563eb; margin-bottom: 0.5rem;">💡 Pro Tips</h3>
-                                    <ul style="padding-left: 1.2rem; line-height: 1.6;">
-                                        <li>Use templates for consistent prompt structures</li>
-                                        <li>Save custom templates for your specific use cases</li>
-                                        <li>Export templates to share with your team</li>
-                                        <li>Version numbering helps track prompt iterations</li>
-                                        <li>Custom conditions add specific requirements</li>
-                                    </ul>
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-                `;
-                
-                const modal = document.createElement('div');
-                modal.id = 'help-modal';
-                modal.innerHTML = helpContent;
-                document.body.appendChild(modal);
-            }
-            
-            function closeHelp() {
-                const modal = document.getElementById('help-modal');
-                if (modal) modal.remove();
-            }
-            
-            // Keyboard shortcuts
-            document.addEventListener('keydown', function(e) {
-                // Don't trigger shortcuts when typing in inputs
-                if (e.target.tagName === 'TEXTAREA' || e.target.tagName === 'INPUT') {
-                    return;
-                }
-                
-                if (e.ctrlKey || e.metaKey) {
-                    switch(e.key) {
-                        case 'p':
-                            e.preventDefault();
-                            previewPrompt();
-                            break;
-                        case 'g':
-                            e.preventDefault();
-                            generatePrompt();
-                            break;
-                        case 's':
-                            e.preventDefault();
-                            saveToHistory();
-                            break;
-                        case 'h':
-                            e.preventDefault();
-                            toggleHistory();
-                            break;
-                        case 'e':
-                            e.preventDefault();
-                            showExportModal();
-                            break;
-                        case 'a':
-                            e.preventDefault();
-                            selectAll();
-                            break;
-                        case 'd':
-                            e.preventDefault();
-                            clearAll();
-                            break;
-                    }
-                } else if (e.key === '?') {
-                    e.preventDefault();
-                    showHelp();
-                } else if (e.key === 'Escape') {
-                    // Close any open modals
-                    closeHelp();
-                    closeExportModal();
-                }
-            });
-            
-            // Enhanced loading states
-            function showLoading(element, text = 'Loading...') {
-                const loadingSpinner = element.querySelector('.loading-spinner') || document.createElement('div');
-                loadingSpinner.className = 'loading-spinner';
-                loadingSpinner.innerHTML = `
-                    <div style="display: flex; align-items: center; justify-content: center; padding: 1rem;">
-                        <div style="width: 20px; height: 20px; border: 2px solid #f3f3f3; border-top: 2px solid #3498db; border-radius: 50%; animation: spin 1s linear infinite; margin-right: 0.5rem;"></div>
-                        <span>${text}</span>
-                    </div>
-                `;
-                if (!element.querySelector('.loading-spinner')) {
-                    element.appendChild(loadingSpinner);
-                }
-            }
-            
-            function hideLoading(element) {
-                const spinner = element.querySelector('.loading-spinner');
-                if (spinner) spinner.remove();
-            }
-            
-            // Add CSS for spinner animation
-            const style = document.createElement('style');
-            style.textContent = `
-                @keyframes spin {
-                    0% { transform: rotate(0deg); }
-                    100% { transform: rotate(360deg); }
-                }
-                .tooltip {
-                    position: relative;
-                    display: inline-block;
-                }
-                .tooltip .tooltiptext {
-                    visibility: hidden;
-                    width: 200px;
-                    background-color: #333;
-                    color: #fff;
-                    text-align: center;
-                    border-radius: 6px;
-                    padding: 5px;
-                    position: absolute;
-                    z-index: 1;
-                    bottom: 125%;
-                    left: 50%;
-                    margin-left: -100px;
-                    opacity: 0;
-                    transition: opacity 0.3s;
-                    font-size: 0.8rem;
-                }
-                .tooltip:hover .tooltiptext {
-                    visibility: visible;
-                    opacity: 1;
-                }
-            `;
-            document.head.appendChild(style);
-            
-            // Initialize history display and other features on page load
-            document.addEventListener('DOMContentLoaded', function() {
-                updateHistoryDisplay();
-                
-                // Add tooltips to buttons
-                addTooltips();
-                
-                // Show welcome message for first-time users
-                if (!localStorage.getItem('has_visited')) {
-                    setTimeout(() => {
-                        if (confirm('Welcome to AI Prompt Maker! 🎉\\n\\nWould you like to see a quick tour of the features?')) {
-                            showHelp();
-                        }
-                        localStorage.setItem('has_visited', 'true');
-                    }, 1000);
-                }
-            });
-            
-            function addTooltips() {
-                // Add tooltips to key elements
-                const tooltips = {
-                    'generate_btn': 'Generate enhanced prompt using AI (Ctrl+G)',
-                    'preview_btn': 'Quick preview of structured prompt (Ctrl+P)', 
-                    'save_btn': 'Save this prompt to history (Ctrl+S)',
-                    'history_btn': 'View saved prompts (Ctrl+H)',
-                    'template_preset': 'Quick-apply common component combinations'
-                };
-                
-                Object.entries(tooltips).forEach(([id, text]) => {
-                    const element = document.getElementById(id);
-                    if (element && !element.title) {
-                        element.title = text;
-                    }
-                });
-            }
-        """)
     )
 
-async def generate_with_llm(model, prompt, temperature=0.7, max_tokens=1000):
-    """Generate prompt using LiteLLM"""
-    try:
-        # Set up LiteLLM with OpenAI API key
-        os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-        
-        response = await litellm.acompletion(
-            model=model,
-            messages=[{
-                "role": "user", 
-                "content": f"""You are a prompt engineering expert. Create a high-quality, structured prompt based on these requirements:
+async def generate_with_llm(model, prompt, temperature=0.7, max_tokens=1000, no_cache=False, criteria=None, scope=()):
+    """Generate prompt using LiteLLM, raising once retries against the provider are exhausted
+    
+    When `criteria` is given, a generation for near-identical criteria under the same `scope`
+    (components, conditions) is served from the semantic cache as well.
+    """
+    user_msg = f"""You are a prompt engineering expert. Create a high-quality, structured prompt based on these requirements:
 
 {prompt}
 
 Generate a professional prompt that incorporates the selected components effectively. The output should be ready to use with any LLM."""
-            }],
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
+    
+    # Serve identical requests from the cache unless the caller opts out
+    key = cache_key(model, None, user_msg, temperature, max_tokens)
+    if not no_cache and (cached := await response_cache.aget(key)) is not None:
+        return cached
+    
+    # Criteria only match other criteria generated with the same model, settings and scope
+    use_semantic = semantic_cache is not None and criteria is not None
+    semantic_scope = (model, temperature, max_tokens, *scope)
+    if use_semantic and not no_cache:
+        cached, _ = semantic_cache.get(criteria, semantic_scope)
+        if cached is not None:
+            return cached
+    elif use_semantic:
+        # Asking for a fresh generation right after a near-duplicate hit suggests the hit was wrong
+        semantic_cache.override(criteria, semantic_scope)
+    
+    async def complete():
+        # Calls go through the rate-limit governor, hedged or falling back to other models when configured
+        with span("generate", model=model):
+            content = await hedger.complete(
+                model,
+                messages=[{"role": "user", "content": user_msg}],
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
         
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error generating prompt: {str(e)}"
+        await response_cache.aset(key, content)
+        if use_semantic:
+            semantic_cache.set(criteria, semantic_scope, content)
+        return content
+    
+    # Concurrent identical requests (same fingerprint as the cache key) share one provider call
+    return await inflight.do(key, complete)
+
+def busy_response(error):
+    """503 with Retry-After, so clients back off instead of piling onto a saturated provider"""
+    return JSONResponse({"success": False, "error": str(error), "retry_after": error.retry_after},
+                        status_code=503, headers={"Retry-After": str(error.retry_after)})
 
 @rt("/api/generate", methods=["POST"])
-async def api_generate(data: dict):
-    """API endpoint for prompt generation"""
+async def api_generate(request, data: dict):
+    """API endpoint for prompt generation, refused with a 503 when the admission queue is full"""
     try:
         # Extract data from request
         components = data.get("components", [])
         criteria = data.get("criteria", "")
         custom_conditions = data.get("custom_conditions", "")
         model = data.get("model", "gpt-3.5-turbo")
+        no_cache = bool(data.get("no_cache", False))
         
         # Use sensible defaults for temperature and tokens
         temperature = 0.7  # Good balance of creativity and coherence
         max_tokens = 1000  # Sufficient for most prompts
         
         # Build initial prompt
-        initial_prompt = build_structured_prompt(components, criteria, custom_conditions)
+        with span("build_prompt"):
+            initial_prompt = build_structured_prompt(components, criteria, custom_conditions)
+        
+        # Generate enhanced prompt using LLM, once a generation slot is free
+        async def generate():
+            async with admission.slot(client_id(request), "interactive"):
+                return await generate_with_llm(model, initial_prompt, temperature, max_tokens, no_cache=no_cache,
+                                               criteria=criteria, scope=(tuple(sorted(components)), custom_conditions.strip()))
         
-        # Generate enhanced prompt using LLM
-        enhanced_prompt = await generate_with_llm(model, initial_prompt, temperature, max_tokens)
+        # Closing the tab or navigating away cancels the provider call instead of paying for tokens nobody reads
+        enhanced_prompt = await unless_disconnected(request, generate())
         
         return {"success": True, "prompt": enhanced_prompt}
     
+    except Overloaded as e:
+        return busy_response(e)
+    except Disconnected:
+        GENERATIONS_CANCELLED.inc(reason="disconnect")
+        return Response(status_code=499)
     except Exception as e:
+        ERRORS.inc(where="generate", type=type(e).__name__)
         return {"success": False, "error": str(e)}
 
+def parse_batch_text(text):
+    """Parse an uploaded batch: one JSON document, or JSONL with one request per line"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+async def read_batch_items(request):
+    """Read batch items from a JSON object body, a JSONL body, or an uploaded .json/.jsonl file"""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        body = parse_batch_text((await form["file"].read()).decode())
+    elif content_type.startswith("application/json"):
+        # FastHTML parses JSON bodies as form data, so lists must be wrapped as {"items": [...]}
+        body = await request.json()
+    else:
+        body = parse_batch_text((await request.body()).decode())
+    
+    items = body.get("items", [body]) if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        raise ValueError("Expected a list of generation requests")
+    # Reject the batch before streaming starts: a bad entry mid-stream would cut the response off for every other entry
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"Item {index} is {type(item).__name__}, expected a JSON object")
+    return items
+
+async def generate_batch_item(index, item, client="unknown"):
+    """Generate one batch entry in the batch admission lane, returning a result tagged with the caller's id"""
+    item_id = item.get("id", index)
+    try:
+        with span("batch_item", item_id=str(item_id)):
+            model = item.get("model", "gpt-3.5-turbo")
+            initial_prompt = build_structured_prompt(item.get("components", []), item.get("criteria", ""), item.get("custom_conditions", ""))
+            
+            async with admission.slot(client, "batch"):
+                prompt = await generate_with_llm(model, initial_prompt, item.get("temperature", 0.7), item.get("max_tokens", 1000), bool(item.get("no_cache", False)),
+                                                 criteria=item.get("criteria", ""), scope=(tuple(sorted(item.get("components", []))), item.get("custom_conditions", "").strip()))
+        return {"id": item_id, "success": True, "prompt": prompt}
+    except Overloaded as e:
+        # The batch lane yields to interactive traffic; tell the caller when to resubmit this entry
+        return {"id": item_id, "success": False, "error": str(e), "retry_after": e.retry_after}
+    except Exception as e:
+        ERRORS.inc(where="batch", type=type(e).__name__)
+        return {"id": item_id, "success": False, "error": str(e)}
+
+async def stream_batch(items, concurrency, client="unknown"):
+    """Run batch entries concurrently and yield JSONL lines in completion order"""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def run(index, item):
+        async with semaphore:
+            return await generate_batch_item(index, item, client)
+    
+    tasks = [asyncio.create_task(run(i, item)) for i, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield json.dumps(await next_done) + "\n"
+    finally:
+        # Stop outstanding calls if the client goes away mid-stream
+        cancelled = sum(task.cancel() for task in tasks)
+        if cancelled:
+            GENERATIONS_CANCELLED.inc(cancelled, reason="disconnect")
+
+@rt("/api/generate/batch", methods=["POST"])
+async def api_generate_batch(request):
+    """Batch endpoint: a JSON list or JSONL upload in, JSONL results out as they complete"""
+    try:
+        items = await read_batch_items(request)
+    except Exception as e:
+        return JSONResponse({"success": False, "error": f"Invalid batch: {e}"}, status_code=400)
+    
+    max_concurrency = int(os.getenv("BATCH_CONCURRENCY", 8))
+    try:
+        concurrency = max(1, min(int(request.query_params.get("concurrency", max_concurrency)), max_concurrency))
+    except ValueError:
+        return JSONResponse({"success": False, "error": "concurrency must be an integer"}, status_code=400)
+    
+    # Refuse the whole batch up front when the queue is already full, rather than failing every entry
+    client = client_id(request)
+    try:
+        admission.check(client, "batch")
+    except Overloaded as e:
+        return busy_response(e)
+    
+    return StreamingResponse(stream_batch(items, concurrency, client), media_type="application/x-ndjson")
+
+@rt("/api/cache-stats")
+def cache_stats():
+    """Hit/miss counters for the response cache, and for the semantic cache with its overridden hits"""
+    stats = response_cache.stats()
+    if semantic_cache is not None:
+        stats["semantic"] = semantic_cache.stats()
+    return stats
+
+@rt("/api/hedge-stats")
+def hedge_stats():
+    """Hedging and fallback counters, with the current first-token deadline per hedged model"""
+    return hedger.stats()
+
+@rt("/api/pool-stats")
+def pool_stats():
+    """Connection pool utilization per provider"""
+    return registry.stats()
+
+@rt("/metrics")
+def get_metrics():
+    """Prometheus text-format metrics for this process: latency, tokens, cost, errors, caches and pools"""
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+def session_user(session):
+    """Anonymous per-browser id kept in the signed session cookie; history and templates are scoped to it"""
+    if "history_user" not in session:
+        session["history_user"] = uuid.uuid4().hex
+    return session["history_user"]
+
+@rt("/api/history", methods=["GET"])
+def history_list(session, cursor: int = 0, limit: int = 20, q: str = "", criteria: str = None):
+    """A page of saved prompts, newest first, optionally full-text searched with `q`; pass `next_cursor` back for the next page"""
+    user = session_user(session)
+    items, next_cursor = prompt_history.list(user, cursor or None, max(1, min(limit, 100)), q, criteria)
+    return {"items": items, "next_cursor": next_cursor, "total": prompt_history.count(user)}
+
+@rt("/api/history", methods=["POST"])
+def history_save(session, data: dict):
+    """Save a prompt as the next version for its criteria"""
+    if not str(data.get("prompt", "")).strip():
+        return JSONResponse({"success": False, "error": "No prompt to save"}, status_code=400)
+    user = session_user(session)
+    entry = prompt_history.add(user, data.get("criteria", ""), data["prompt"], data.get("components", []), data.get("model", ""))
+    return {"success": True, "entry": entry, "next_version": entry["version"] + 1, "total": prompt_history.count(user)}
+
+@rt("/api/history/{id}", methods=["GET"])
+def history_get(session, id: int):
+    """One saved prompt"""
+    entry = prompt_history.get(session_user(session), id)
+    return entry if entry else JSONResponse({"success": False, "error": "Not found"}, status_code=404)
+
+@rt("/api/history/{id}", methods=["DELETE"])
+def history_delete(session, id: int):
+    """Delete one saved prompt"""
+    return {"success": prompt_history.delete(session_user(session), id)}
+
+@rt("/api/templates", methods=["GET"])
+def templates_sync(request, session, since: int = 0, limit: int = 1000):
+    """Template changes after version `since`; the ETag is the library version, so an up-to-date client gets a 304"""
+    library = session_user(session)
+    version = template_library.version(library)
+    etag = f'"{version}"'
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+    changes, more = template_library.changes(library, since, max(1, min(limit, 5000)))
+    # With more pages to come, the client continues from the last change it received rather than the current version
+    return JSONResponse({"version": changes[-1]["version"] if more else version, "more": more, "changes": changes},
+                        headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@rt("/api/templates", methods=["POST"])
+def templates_add(session, data: dict):
+    """Save one template; saving identical content again is a no-op"""
+    if not str(data.get("name", "")).strip() or not data.get("components"):
+        return JSONResponse({"success": False, "error": "A template needs a name and components"}, status_code=400)
+    library = session_user(session)
+    try:
+        hash, added = template_library.add(library, data)
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    return {"success": True, "hash": hash, "added": added, "version": template_library.version(library)}
+
+@rt("/api/templates/{hash}", methods=["DELETE"])
+def templates_delete(session, hash: str):
+    """Delete one template by content hash"""
+    return {"success": template_library.delete(session_user(session), hash)}
+
+async def read_template_lines(request):
+    """Yield templates from a streamed JSONL body line by line, without holding the raw upload in memory"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if buffer.strip():
+        yield json.loads(buffer)
+
+@rt("/api/templates/import", methods=["POST"])
+async def templates_import(request, session, mode: str = "merge"):
+    """Bulk import as JSONL (or the older `{"templates": [...]}` export file), deduplicated by content hash; `mode=replace` clears the library first"""
+    library = session_user(session)
+    
+    # Parse and check the whole upload before writing anything, so a bad or truncated file leaves the library as it was
+    templates = []
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            body = await request.json()
+            items = body.get("templates", []) if isinstance(body, dict) else body
+            if not isinstance(items, list):
+                raise ValueError("Expected a list of templates")
+            templates = [normalize(template) for template in items]
+        else:
+            async for template in read_template_lines(request):
+                templates.append(normalize(template))
+    except ValueError as e:  # includes JSON and UTF-8 decoding errors
+        return JSONResponse({"success": False, "error": f"Invalid template file: {e}", "added": 0}, status_code=400)
+    
+    if mode == "replace":
+        added, duplicates = await asyncio.to_thread(template_library.replace, library, templates)
+    else:
+        added, duplicates = await asyncio.to_thread(template_library.import_many, library, templates)
+    return {"success": True, "added": added, "duplicates": duplicates, "version": template_library.version(library)}
+
+@rt("/api/templates/export")
+def templates_export(session):
+    """Stream the whole library as JSONL, one template per line"""
+    return StreamingResponse(template_library.export(session_user(session)), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": 'attachment; filename="prompt_templates.jsonl"'})
+
 def build_structured_prompt(components, criteria, custom_conditions=""):
     """Build a structured prompt from components and criteria"""
     prompt_parts = []
@@ -1193,6 +656,20 @@ def build_structured_prompt(components, criteria, custom_conditions=""):
     
     return "\n\n".join(prompt_parts)
 
+@rt("/assets/prompt_maker.js/{version}")
+def client_script_asset(request, version: str):
+    """Serve the client script; the version in the URL changes whenever its content does"""
+    if version != client_script.version:
+        return RedirectResponse(f"/assets/prompt_maker.js/{client_script.version}", status_code=302)
+    return client_script.response(request)
+
+@rt("/api/template-presets")
+def template_presets_json(request):
+    """Built-in template presets as JSON, cached for good under the versioned URL used by the page"""
+    if request.query_params.get("v") == presets_json.version:
+        return presets_json.response(request)
+    return presets_json.response(request, cache_control="no-cache")
+
 @rt
 def index():
     """Main prompt maker interface"""
@@ -1233,6 +710,8 @@ def index():
             Div(
                 Card(
                     H4("Prompt History"),
+                    Input(type="search", id="history_search", placeholder="Search saved prompts...",
+                          oninput="searchHistory()", cls='mb-3'),
                     Div("No prompts saved yet. Generate and save prompts to see them here.", 
                         id="history_list", cls='text-muted-foreground'),
                     cls='mb-4'
@@ -1274,7 +753,13 @@ def index():
             ),
             
             cls=ContainerT.xl
-        )
+        ),
+        
+        # All page behaviour lives in one cached, versioned script
+        Script(src=f"/assets/prompt_maker.js/{client_script.version}",
+               data_presets_url=f"/api/template-presets?v={presets_json.version}")
     )
 
-serve()
+# Development: FastHTML's live-reloading server. Production: multi-worker uvicorn (see server.py)
+if __name__ == "__main__":
+    run("app_bkp")
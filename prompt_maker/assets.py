@@ -0,0 +1,39 @@
+"Versioned, precompressed assets served with strong ETags and immutable caching"
+import gzip, hashlib
+from pathlib import Path
+from starlette.responses import Response
+
+try: import brotli
+except ImportError: brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+SUFFIXES = {"gzip": "gz", "br": "br"}
+
+class Asset:
+    "An in-memory asset compressed once up front; its `version` is a content hash, so URLs carrying it can be cached forever"
+    def __init__(self, body, media_type):
+        self.body = body if isinstance(body, bytes) else body.encode()
+        self.media_type,self.version = media_type,hashlib.sha256(self.body).hexdigest()[:16]
+        self.variants = {"gzip": gzip.compress(self.body, 9, mtime=0)}
+        if brotli is not None: self.variants["br"] = brotli.compress(self.body, quality=11)
+
+    @classmethod
+    def from_file(cls, path, media_type): return cls(Path(path).read_bytes(), media_type)
+
+    def encoding_for(self, accept_encoding):
+        "Smallest precompressed variant the client accepts, or None for the raw body"
+        accepted = {e.split(";")[0].strip() for e in (accept_encoding or "").split(",")}
+        return next((e for e in ("br", "gzip") if e in accepted and e in self.variants), None)
+
+    def etag(self, encoding=None):
+        "Strong ETag for one encoding of the body: each variant is different bytes, so a cache must never revalidate one with another's tag"
+        return f'"{self.version}-{SUFFIXES[encoding]}"' if encoding else f'"{self.version}"'
+
+    def response(self, request, cache_control=IMMUTABLE):
+        "Serve the asset, answering a matching If-None-Match with 304"
+        encoding = self.encoding_for(request.headers.get("accept-encoding"))
+        etag = self.etag(encoding)
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if etag in request.headers.get("if-none-match", ""): return Response(status_code=304, headers=headers)
+        if encoding: return Response(self.variants[encoding], media_type=self.media_type, headers={**headers, "Content-Encoding": encoding})
+        return Response(self.body, media_type=self.media_type, headers=headers)
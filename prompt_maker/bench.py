@@ -0,0 +1,219 @@
+"Load test: serve an app against the mock LLM provider, drive its endpoints at fixed concurrency, and save throughput, latency and memory as JSON"
+import argparse, asyncio, json, os, random, re, socket, subprocess, sys, tempfile, time, uuid
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = {"app": "index=1,generate_flow=4", "app_bkp": "index=1,api_generate=4"}
+CRITERIA = ["Write a product launch email", "Explain recursion to a beginner", "Summarize a quarterly sales report", "Review a pull request for security issues"]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def tree_rss(pid):
+    "Resident memory in bytes of `pid` and its children (uvicorn workers), from /proc; None where that isn't available"
+    try:
+        parents = {}
+        for d in os.listdir("/proc"):
+            if d.isdigit():
+                try: parents[int(d)] = int(open(f"/proc/{d}/stat").read().rsplit(")", 1)[1].split()[1])
+                except OSError: pass
+        pids,todo = set(),[pid]
+        while todo:
+            p = todo.pop()
+            pids.add(p)
+            todo += [c for c,pp in parents.items() if pp == p and c not in pids]
+        return sum(int(open(f"/proc/{p}/statm").read().split()[1]) for p in pids if os.path.exists(f"/proc/{p}/statm")) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError): return None
+
+def percentile(xs, q):
+    if not xs: return None
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, max(0, round(q / 100 * len(xs) + 0.5) - 1))]
+
+def summarize(samples, elapsed):
+    "count, errors, RPS and latency percentiles (ms) for one endpoint's (seconds, ok) samples"
+    ok = [t for t,good in samples if good]
+    ms = lambda v: None if v is None else round(v * 1000, 2)
+    return dict(count=len(samples), errors=len(samples) - len(ok), rps=round(len(samples) / elapsed, 2),
+                p50_ms=ms(percentile(ok, 50)), p95_ms=ms(percentile(ok, 95)), p99_ms=ms(percentile(ok, 99)),
+                mean_ms=ms(sum(ok) / len(ok) if ok else None), max_ms=ms(max(ok) if ok else None))
+
+class Bench:
+    def __init__(self, base, args):
+        self.base,self.args,self.samples,self.recording = base,args,{},False
+
+    async def timed(self, name, fn):
+        "Run one request, recording its latency and whether it succeeded under `name` once warm-up is over"
+        t0 = time.perf_counter()
+        try: ok,res = await fn()
+        except httpx.HTTPError: ok,res = False,None
+        if self.recording: self.samples.setdefault(name, []).append((time.perf_counter() - t0, ok))
+        return res
+
+    @property
+    def no_cache(self): return self.args.cache == "miss"
+
+    def criteria(self):
+        "Criteria for one generation: unique when measuring provider-bound generations, else one of a few that repeat, so nearly all hit the cache"
+        return random.choice(CRITERIA) + (f" ({uuid.uuid4().hex[:8]})" if self.no_cache else "")
+
+    async def index(self, c):
+        async def get():
+            r = await c.get("/")
+            return r.status_code == 200, r
+        await self.timed("GET /", get)
+
+    async def generate_flow(self, c):
+        "The browser's non-streaming flow: POST /generate, then wait on /result/{id} while polling /progress/{id}"
+        t0,hx = time.perf_counter(),{"HX-Request": "true"}
+        data = dict(criteria=self.criteria(), components=["role", "task", "format"], model="gpt-4")
+        if self.no_cache: data["no_cache"] = "1"  # unique criteria can still land near an earlier one in the semantic cache
+        async def generate():
+            r = await c.post("/generate", data=data, headers=hx)
+            return r.status_code == 200, r
+        r = await self.timed("POST /generate", generate)
+        if r is None: return
+        ok = r.status_code == 200 and "Error generating prompt" not in r.text
+        if m := re.search(r'hx-get="(/result/[^"]+)"', r.text):
+            session_id,done = m.group(1).rsplit("/", 1)[1],asyncio.Event()
+            async def result():
+                res = await c.get(m.group(1), headers=hx)
+                return res.status_code == 200 and "Error generating prompt" not in res.text, res
+            async def poll():
+                while not done.is_set():
+                    async def progress():
+                        res = await c.get(f"/progress/{session_id}", headers=hx)
+                        return res.status_code == 200, res
+                    await self.timed("GET /progress/{id}", progress)
+                    try: await asyncio.wait_for(done.wait(), self.args.poll_interval)
+                    except asyncio.TimeoutError: pass
+            poller = asyncio.create_task(poll())
+            try: res = await self.timed("GET /result/{id}", result)
+            finally:
+                done.set()
+                await poller
+            ok = res is not None and res.status_code == 200 and "Error generating prompt" not in res.text
+        if self.recording: self.samples.setdefault("generate_flow", []).append((time.perf_counter() - t0, ok))
+
+    async def api_generate(self, c):
+        async def post():
+            r = await c.post("/api/generate", json=dict(criteria=self.criteria(), components=["role", "task", "format"], model="gpt-3.5-turbo", no_cache=self.no_cache))
+            return r.status_code == 200 and r.json().get("success", False), r
+        await self.timed("POST /api/generate", post)
+
+    async def worker(self, c, mix, until):
+        names,weights = zip(*mix.items())
+        while time.perf_counter() < until:
+            await getattr(self, random.choices(names, weights)[0])(c)
+
+async def drive(base, args, mix, pid):
+    "Warm up, then run `args.concurrency` closed-loop workers for `args.duration` seconds, sampling the server's memory"
+    bench = Bench(base, args)
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=base, timeout=args.timeout, limits=limits) as c:
+        warm_until = time.perf_counter() + args.warmup
+        await asyncio.gather(*[bench.worker(c, mix, warm_until) for _ in range(args.concurrency)])
+        rss,stop = [tree_rss(pid)],asyncio.Event()
+        async def sample_memory():
+            while not stop.is_set():
+                try: await asyncio.wait_for(stop.wait(), 0.5)
+                except asyncio.TimeoutError: rss.append(tree_rss(pid))
+        sampler = asyncio.create_task(sample_memory())
+        bench.recording,t0 = True,time.perf_counter()
+        await asyncio.gather(*[bench.worker(c, mix, t0 + args.duration) for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        await sampler
+        rss.append(tree_rss(pid))
+        mock = (await c.get(f"{args.mock_url}/stats")).json()
+    mb = lambda b: None if b is None else round(b / 2**20, 1)
+    memory = dict(start_mb=mb(rss[0]), end_mb=mb(rss[-1]), peak_mb=mb(max((r for r in rss if r), default=None)),
+                  growth_mb=mb(rss[-1] - rss[0]) if rss[0] and rss[-1] else None)
+    endpoints = {name: summarize(s, elapsed) for name,s in sorted(bench.samples.items())}
+    every = [x for name,s in bench.samples.items() if name != "generate_flow" for x in s]
+    return dict(elapsed_s=round(elapsed, 2), overall=summarize(every, elapsed), endpoints=endpoints, memory=memory, mock_provider=mock)
+
+def wait_ready(url, proc, log, timeout=60):
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        if proc.poll() is not None: break
+        try:
+            if httpx.get(url, timeout=2).status_code < 500: return
+        except httpx.HTTPError: pass
+        time.sleep(0.2)
+    log.seek(0)
+    raise SystemExit(f"Server at {url} did not start:\n{log.read()[-2000:]}")
+
+def git_commit():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True).stdout.strip() or None
+    except OSError: return None
+
+def compare(result, baseline):
+    "Print RPS and p95 changes per endpoint against an earlier result file"
+    print(f"\nvs {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    for name,now in result["endpoints"].items():
+        if (old := baseline["endpoints"].get(name)) is None: continue
+        pct = lambda a, b: f"{(a - b) / b * 100:+.1f}%" if a is not None and b else "n/a"
+        print(f"  {name:<24} rps {old['rps']:>8} -> {now['rps']:<8} ({pct(now['rps'], old['rps'])})   p95 {old['p95_ms']} -> {now['p95_ms']} ms ({pct(now['p95_ms'], old['p95_ms'])})")
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("--app", default="app", choices=list(SCENARIOS), help="which app module to serve")
+    p.add_argument("--mix", help="weighted scenarios, e.g. index=1,generate_flow=4 (default depends on --app)")
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--duration", type=float, default=20.0, help="seconds measured, after --warmup")
+    p.add_argument("--warmup", type=float, default=3.0)
+    p.add_argument("--workers", type=int, default=1, help="uvicorn workers for the app")
+    p.add_argument("--cache", choices=["miss", "hit"], default="miss", help="miss: unique criteria and no_cache, so every generation reaches the provider; hit: a few criteria that repeat, to measure cached responses")
+    p.add_argument("--poll-interval", type=float, default=0.5, help="seconds between /progress polls, as the page does")
+    p.add_argument("--timeout", type=float, default=60.0)
+    p.add_argument("--ttft", default="lognormal:0.4,0.5", help="mock provider time to first token (see mockllm.py)")
+    p.add_argument("--tokens-per-sec", type=float, default=80.0)
+    p.add_argument("--completion-tokens", type=int, default=200)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--out", help="result file (default bench-results/<timestamp>-<commit>-<app>.json)")
+    p.add_argument("--compare", help="an earlier result file to compare against")
+    args = p.parse_args(argv)
+    mix = {k: float(v) for k,v in (kv.split("=") for kv in (args.mix or SCENARIOS[args.app]).split(","))}
+
+    tmp = tempfile.mkdtemp(prefix="bench-")
+    mock_port,app_port = free_port(),free_port()
+    args.mock_url = f"http://127.0.0.1:{mock_port}"
+    env = {k: v for k,v in os.environ.items() if not k.startswith(("TRACE_", "PROFILE_", "OPENAI_"))}
+    env.update(ENVIRONMENT="production", HOST="127.0.0.1", PORT=str(app_port), WEB_CONCURRENCY=str(args.workers), LITELLM_LOCAL_MODEL_COST_MAP="True",
+               OPENAI_API_KEY="sk-bench", OPENAI_BASE_URL=f"{args.mock_url}/v1", OPENAI_API_BASE=f"{args.mock_url}/v1",
+               LLM_RPM="1000000", LLM_TPM="1000000000", LLM_CONCURRENCY="100000",  # measure the app, not the rate limiter
+               HISTORY_PATH=os.path.join(tmp, "history.db"), TEMPLATES_PATH=os.path.join(tmp, "templates.db"), JOBS_PATH=os.path.join(tmp, "jobs.db"),
+               SESSION_STORE=f"sqlite:///{os.path.join(tmp, 'sessions.db')}" if args.workers > 1 else "memory")
+    mock_log,app_log = open(os.path.join(tmp, "mock.log"), "w+"),open(os.path.join(tmp, "app.log"), "w+")
+    mock = subprocess.Popen([sys.executable, os.path.join(HERE, "mockllm.py"), "--port", str(mock_port), "--ttft", args.ttft, "--tokens-per-sec", str(args.tokens_per_sec),
+                             "--completion-tokens", str(args.completion_tokens), "--error-rate", str(args.error_rate)], stdout=mock_log, stderr=subprocess.STDOUT)
+    server = subprocess.Popen([sys.executable, os.path.join(HERE, "server.py"), f"{args.app}:app"], cwd=HERE, env=env, stdout=app_log, stderr=subprocess.STDOUT)
+    try:
+        wait_ready(f"{args.mock_url}/stats", mock, mock_log)
+        wait_ready(f"http://127.0.0.1:{app_port}/", server, app_log)
+        print(f"Benchmarking {args.app} at concurrency {args.concurrency} for {args.duration}s: {mix}")
+        result = asyncio.run(drive(f"http://127.0.0.1:{app_port}", args, mix, server.pid))
+    finally:
+        for proc in (server, mock):
+            proc.terminate()
+            try: proc.wait(10)
+            except subprocess.TimeoutExpired: proc.kill()
+
+    commit = git_commit()
+    result = dict(meta=dict(commit=commit, timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"), python=sys.version.split()[0],
+                            args={k: v for k,v in vars(args).items() if k not in ("out", "compare", "mock_url")}, mix=mix), **result)
+    out = args.out or os.path.join(HERE, "bench-results", f"{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'nogit'}-{args.app}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f: json.dump(result, f, indent=2)
+
+    for name,s in result["endpoints"].items():
+        print(f"  {name:<24} {s['count']:>6} req  {s['errors']:>4} err  {s['rps']:>8} rps   p50 {s['p50_ms']}  p95 {s['p95_ms']}  p99 {s['p99_ms']} ms")
+    print(f"  memory: {result['memory']}")
+    print(f"Saved {out}")
+    if args.compare:
+        with open(args.compare) as f: compare(result, json.load(f))
+
+if __name__ == "__main__": main()
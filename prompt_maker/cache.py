@@ -0,0 +1,57 @@
+"Content-addressed cache for LLM completions"
+import hashlib, json, os
+from store import MemoryStore, SqliteStore
+
+def cache_key(model, system, user, temperature=None, max_tokens=None):
+    "Stable hash of everything that determines a completion; whitespace at the ends of messages is ignored"
+    norm = dict(model=model.strip().lower(), system=(system or "").strip().replace("\r\n", "\n"), user=(user or "").strip().replace("\r\n", "\n"),
+                temperature=None if temperature is None else float(temperature), max_tokens=None if max_tokens is None else int(max_tokens))
+    return hashlib.sha256(json.dumps(norm, sort_keys=True).encode()).hexdigest()
+
+class ResponseCache:
+    "In-memory LRU+TTL tier, optionally backed by an on-disk SQLite tier, with hit/miss counters"
+    def __init__(self, maxsize=1024, ttl=86400, path=None, disk_maxsize=100_000):
+        self.mem = MemoryStore(maxsize, ttl)
+        self.disk = SqliteStore(path, disk_maxsize, ttl, table="responses") if path else None
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        value = self.mem.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None: self.mem[key] = value
+        if value is None: self.misses += 1
+        else: self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.mem[key] = value
+        if self.disk is not None: self.disk[key] = value
+
+    async def aget(self, key):
+        "`get` for async code: the disk tier is read on a thread"
+        value = self.mem.get(key)
+        if value is None and self.disk is not None:
+            value = await self.disk.aget(key)
+            if value is not None: self.mem[key] = value
+        if value is None: self.misses += 1
+        else: self.hits += 1
+        return value
+
+    async def aset(self, key, value):
+        self.mem[key] = value
+        if self.disk is not None: await self.disk.aset(key, value)
+
+    def cleanup(self): return self.mem.cleanup() + (self.disk.cleanup() if self.disk is not None else 0)
+
+    async def acleanup(self): return self.mem.cleanup() + (await self.disk.acleanup() if self.disk is not None else 0)
+
+    @property
+    def hit_rate(self): return self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0
+
+    def stats(self): return dict(hits=self.hits, misses=self.misses, hit_rate=round(self.hit_rate, 4), size=len(self.mem), disk_size=len(self.disk) if self.disk is not None else 0)
+
+def cache_from_env():
+    "Build the response cache from `RESPONSE_CACHE_*` settings; set `RESPONSE_CACHE_PATH` to enable the disk tier"
+    return ResponseCache(maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", 1024)), ttl=float(os.getenv("RESPONSE_CACHE_TTL", 86400)),
+                         path=os.getenv("RESPONSE_CACHE_PATH") or None)
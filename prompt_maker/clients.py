@@ -0,0 +1,125 @@
+"Process-wide LLM clients: one keep-alive, HTTP/2-capable connection pool per provider, with utilization metrics"
+import importlib, os
+from importlib.util import find_spec
+import httpx
+from ratelimit import env_limit, provider_of
+
+# Providers whose LiteLLM handlers accept a client we build; anything else uses LiteLLM's own cached clients
+OPENAI_SDK_PROVIDERS = {"openai"}
+HTTPX_PROVIDERS = {"anthropic", "gemini"}
+
+class TrackedStream(httpx.AsyncByteStream):
+    "A response body that calls `on_close` once, when it has been read to the end or closed"
+    def __init__(self, stream, on_close): self.stream,self.on_close = stream,on_close
+
+    async def __aiter__(self):
+        async for chunk in self.stream: yield chunk
+
+    async def aclose(self):
+        try: await self.stream.aclose()
+        finally:
+            if self.on_close: self.on_close()
+            self.on_close = None
+
+class PoolTransport(httpx.AsyncBaseTransport):
+    "Wraps a pooled transport, counting requests in flight so pool utilization can be reported"
+    def __init__(self, inner, max_connections):
+        self.inner,self.max_connections = inner,max_connections
+        self.in_flight = self.peak = self.requests = self.errors = 0
+
+    async def handle_async_request(self, request):
+        self.in_flight += 1
+        self.requests += 1
+        self.peak = max(self.peak, self.in_flight)
+        try: response = await self.inner.handle_async_request(request)
+        except Exception:
+            self.in_flight -= 1
+            self.errors += 1
+            raise
+        # A streamed body keeps its connection busy until it has been read or closed
+        return httpx.Response(response.status_code, headers=response.headers, extensions=response.extensions,
+                              stream=TrackedStream(response.stream, self._release))
+
+    def _release(self): self.in_flight -= 1
+
+    async def aclose(self): await self.inner.aclose()
+
+    def connections(self):
+        "Open connections in the pool, if the underlying transport exposes them"
+        pool = getattr(self.inner, "_pool", None)
+        return len(getattr(pool, "connections", []))
+
+    def stats(self): return dict(max_connections=self.max_connections, in_flight=self.in_flight, peak_in_flight=self.peak, requests=self.requests,
+                                 errors=self.errors, open_connections=self.connections(), utilization=round(self.in_flight / self.max_connections, 4))
+
+def openai_target(kwargs):
+    "The base URL and API key LiteLLM resolves for an OpenAI call: the call's own, then LiteLLM's globals, then the environment"
+    import litellm
+    api_base = (kwargs.get("api_base") or kwargs.get("base_url") or litellm.api_base or os.getenv("OPENAI_BASE_URL")
+                or os.getenv("OPENAI_API_BASE") or "https://api.openai.com/v1")
+    return api_base, kwargs.get("api_key") or litellm.api_key or litellm.openai_key or os.getenv("OPENAI_API_KEY")
+
+class ProviderPool:
+    "One provider's connection pool and the LiteLLM `client` objects built on top of it"
+    def __init__(self, provider, transport=None):
+        self.provider = provider
+        max_conn = int(env_limit("LLM_POOL_MAX_CONNECTIONS", provider, 100))
+        self.http2 = os.getenv("LLM_HTTP2", "true").lower() in ("1", "true", "yes") and find_spec("h2") is not None
+        self.timeout = httpx.Timeout(env_limit("LLM_TIMEOUT", provider, 600), connect=env_limit("LLM_CONNECT_TIMEOUT", provider, 10))
+        limits = httpx.Limits(max_connections=max_conn, max_keepalive_connections=int(env_limit("LLM_POOL_MAX_KEEPALIVE", provider, 20)),
+                              keepalive_expiry=env_limit("LLM_POOL_KEEPALIVE_EXPIRY", provider, 60))
+        self.transport = PoolTransport(transport or httpx.AsyncHTTPTransport(http2=self.http2, limits=limits), max_conn)
+        self.http = httpx.AsyncClient(transport=self.transport, timeout=self.timeout)
+        self._clients = {}
+
+    def client(self, api_base=None, api_key=None):
+        "The `client` to pass to `litellm.acompletion` for this provider, built on first use; OpenAI SDK clients are per `api_base` and `api_key`"
+        # LiteLLM uses a client it's given as is, so an SDK client must already carry the base URL and key the call would have used
+        target = (api_base, api_key) if self.provider in OPENAI_SDK_PROVIDERS else None
+        if target not in self._clients:
+            if self.provider in OPENAI_SDK_PROVIDERS:
+                from openai import AsyncOpenAI
+                self._clients[target] = AsyncOpenAI(api_key=api_key or "", base_url=api_base, http_client=self.http, max_retries=0)  # retries belong to the governor
+            else:
+                from litellm.llms.custom_httpx.http_handler import AsyncHTTPHandler
+                self._clients[target] = AsyncHTTPHandler(timeout=self.timeout, transport=self.transport)
+        return self._clients[target]
+
+    def stats(self): return dict(self.transport.stats(), http2=self.http2)
+
+class ClientRegistry:
+    "Pools keyed by provider, shared by every request in the process"
+    def __init__(self): self.pools = {}
+
+    def pool(self, provider):
+        if provider not in self.pools: self.pools[provider] = ProviderPool(provider)
+        return self.pools[provider]
+
+    def warm(self, models):
+        "Create the pools for `models` up front, e.g. at startup"
+        for m in models:
+            if (p := provider_of(m)) in OPENAI_SDK_PROVIDERS | HTTPX_PROVIDERS: self.pool(p)
+
+    async def acompletion(self, **kwargs):
+        "`litellm.acompletion` over this process's pooled client for the model's provider"
+        import litellm
+        provider = provider_of(kwargs["model"])
+        if "client" not in kwargs and provider in OPENAI_SDK_PROVIDERS | HTTPX_PROVIDERS:
+            target = openai_target(kwargs) if provider in OPENAI_SDK_PROVIDERS else ()
+            kwargs["client"] = self.pool(provider).client(*target)
+        return await litellm.acompletion(**kwargs)
+
+    async def aclose(self):
+        for pool in self.pools.values(): await pool.http.aclose()
+        self.pools = {}
+
+    def stats(self): return {p: pool.stats() for p,pool in self.pools.items()}
+
+registry = ClientRegistry()
+
+def warm_imports(modules=("litellm",)):
+    "With `LLM_WARMUP=true`, import `modules` at startup, before the worker takes requests, so the first generation doesn't stall it loading LiteLLM; off by default since a new worker then starts ~4s later"
+    if os.getenv("LLM_WARMUP", "false").lower() not in ("1", "true", "yes"): return
+    # Not on a thread, nor on the loop once serving: LiteLLM hooks uvicorn's loggers midway through its import, so a log line from
+    # the serving thread can deadlock the import lock, and importing on the loop stalls every request for the duration
+    for m in modules: importlib.import_module(m)
@@ -0,0 +1,65 @@
+"Single-flight: concurrent identical calls share one upstream run, and one token stream when streaming"
+import asyncio, os
+from metrics import waiting_on_provider
+
+class Flight:
+    "One shared run: its task, how many callers still want it, and for streams every chunk produced so far"
+    def __init__(self): self.task,self.callers,self.chunks,self.changed = None,0,[],asyncio.Event()
+
+class SingleFlight:
+    "Calls keyed by a request fingerprint; a call made while one with the same key is running joins it instead of starting another"
+    def __init__(self, timeout=300.0):
+        self.timeout,self.flights = timeout,{}
+        self.leaders = self.followers = 0
+
+    def _join(self, key, start):
+        if (f := self.flights.get(key)) is None:
+            self.flights[key] = f = Flight()
+            f.task = asyncio.create_task(start(f))
+            f.task.add_done_callback(lambda t: self._landed(key, f))
+            self.leaders += 1
+        else: self.followers += 1
+        f.callers += 1
+        return f
+
+    def _landed(self, key, f):
+        if self.flights.get(key) is f: del self.flights[key]  # later calls start afresh (and usually hit the cache the run just filled)
+        f.changed.set()
+        if not f.task.cancelled(): f.task.exception()  # retrieved here so an error nobody waited for isn't logged as unhandled
+
+    def _leave(self, f):
+        "A caller finished, failed, timed out or was cancelled: the run only stops once no caller wants it"
+        f.callers -= 1
+        if not f.callers and not f.task.done(): f.task.cancel()
+
+    async def do(self, key, fn):
+        "Result of `await fn()`, shared with every concurrent call under `key`; raises TimeoutError after `timeout` seconds"
+        f = self._join(key, lambda f: fn())
+        try:
+            with waiting_on_provider(): return await asyncio.wait_for(asyncio.shield(f.task), self.timeout)  # shielded: a caller's cancel must not stop the others
+        finally: self._leave(f)
+
+    async def stream(self, key, fn):
+        "Items of the async generator `fn()`, shared with every concurrent call under `key`; late joiners replay what they missed"
+        async def pump(f):
+            async for chunk in fn():
+                f.chunks.append(chunk)
+                f.changed.set()
+        f,i = self._join(key, pump),0
+        try:
+            while True:
+                while i < len(f.chunks):
+                    yield f.chunks[i]
+                    i += 1
+                if f.task.done():
+                    f.task.result()  # the upstream error, for every caller
+                    return
+                f.changed.clear()
+                with waiting_on_provider(): await asyncio.wait_for(f.changed.wait(), self.timeout)  # an upstream silent for `timeout` seconds is abandoned
+        finally: self._leave(f)
+
+    def stats(self): return dict(in_flight=len(self.flights), leaders=self.leaders, followers=self.followers)
+
+def singleflight_from_env():
+    "SingleFlight whose callers give up after `COALESCE_TIMEOUT` seconds (default 300)"
+    return SingleFlight(timeout=float(os.getenv("COALESCE_TIMEOUT", 300)))
@@ -0,0 +1,85 @@
+"Cold-start benchmark: import time per module and time until a fresh server answers, each in new processes, failing past a budget"
+import argparse, os, statistics, subprocess, sys, tempfile, time
+import httpx
+from bench import HERE, free_port, wait_ready
+
+def clean_env(tmp, **extra):
+    "Env for a throwaway process: databases in `tmp`, no tracing, and no network fetch of LiteLLM's cost map should it get imported"
+    env = {k: v for k,v in os.environ.items() if not k.startswith(("TRACE_", "PROFILE_"))}
+    env.update(LITELLM_LOCAL_MODEL_COST_MAP="True", HISTORY_PATH=os.path.join(tmp, "history.db"), TEMPLATES_PATH=os.path.join(tmp, "templates.db"),
+               JOBS_PATH=os.path.join(tmp, "jobs.db"), SESSION_STORE="memory", **extra)
+    return env
+
+def import_profile(module, env):
+    "Seconds to import `module` in a fresh interpreter, the cumulative seconds of each top-level package it imports directly, and every module loaded"
+    r = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=HERE, env=env, capture_output=True, text=True)
+    if r.returncode: raise SystemExit(f"import {module} failed:\n{r.stderr[-2000:]}")
+    total,children,loaded,by_package = None,[],set(),{}
+    for line in r.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line: continue
+        _,cumulative,name = line.split("|")
+        indent,name,s = len(name) - len(name.lstrip()) - 1,name.strip(),int(cumulative) / 1e6
+        loaded.add(name)
+        if indent: children.append((indent, name, s))  # a module is listed after everything it imported, two spaces deeper per level
+        elif name != module: children = []
+        else:
+            total = s
+            for _,child,s in (c for c in children if c[0] == 2): by_package[child.split(".")[0]] = by_package.get(child.split(".")[0], 0) + s
+    return total, by_package, loaded
+
+def time_to_ready(app, env, watch=5.0):
+    "Seconds from launching `server.py app:app` (one production worker) until GET / answers, and the slowest GET / over the next `watch` seconds"
+    port = free_port()
+    with tempfile.TemporaryFile("w+") as log:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, os.path.join(HERE, "server.py"), f"{app}:app"], cwd=HERE, stdout=log, stderr=subprocess.STDOUT,
+                                env=dict(env, ENVIRONMENT="production", HOST="127.0.0.1", PORT=str(port), WEB_CONCURRENCY="1"))
+        try:
+            wait_ready(f"http://127.0.0.1:{port}/", proc, log)
+            ready,slowest = time.perf_counter() - t0,0.0
+            with httpx.Client(timeout=30) as c:
+                while time.perf_counter() - t0 < ready + watch:  # catches work a new worker does once it's serving, like a deferred import
+                    t = time.perf_counter()
+                    c.get(f"http://127.0.0.1:{port}/")
+                    slowest = max(slowest, time.perf_counter() - t)
+                    time.sleep(0.05)
+            return ready, slowest
+        finally:
+            proc.terminate()
+            try: proc.wait(10)
+            except subprocess.TimeoutExpired: proc.kill()
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("--app", action="append", choices=["app", "app_bkp"], help="app module to measure; repeat for several (default both)")
+    p.add_argument("--runs", type=int, default=3, help="fresh processes per measurement; the median is reported")
+    p.add_argument("--budget", type=float, default=1.5, help="fail if importing an app takes longer than this many seconds")
+    p.add_argument("--ready-budget", type=float, default=2.0, help="fail if a new server takes longer than this many seconds to answer GET /")
+    p.add_argument("--watch", type=float, default=5.0, help="seconds to keep requesting GET / once the server answers")
+    p.add_argument("--latency-budget", type=float, default=0.25, help="fail if any GET / while watching takes longer than this many seconds")
+    p.add_argument("--no-server", action="store_true", help="only measure imports")
+    p.add_argument("--top", type=int, default=10, help="packages listed per app")
+    p.add_argument("--forbid", default="litellm,lisette,openai", help="modules that must not load at import time (they load on first generation or warm-up)")
+    args = p.parse_args(argv)
+    forbid,failures = [m for m in args.forbid.split(",") if m],[]
+
+    with tempfile.TemporaryDirectory(prefix="coldstart-") as tmp:
+        env = clean_env(tmp)
+        for app in args.app or ["app", "app_bkp"]:
+            profiles = [import_profile(app, env) for _ in range(args.runs)]
+            total = statistics.median(t for t,_,_ in profiles)
+            packages = {k: statistics.median(pkgs.get(k, 0) for _,pkgs,_ in profiles) for k in profiles[0][1]}
+            print(f"{app}: import {total:.3f}s (median of {args.runs}, budget {args.budget}s)")
+            for name,s in sorted(packages.items(), key=lambda kv: -kv[1])[:args.top]: print(f"  {name:<24} {s:8.3f}s")
+            if total > args.budget: failures.append(f"{app} imports in {total:.3f}s, over the {args.budget}s budget")
+            if eager := [m for m in forbid if m in profiles[0][2]]: failures.append(f"{app} imports {', '.join(eager)} at import time")
+            if not args.no_server:
+                runs = [time_to_ready(app, env, args.watch) for _ in range(args.runs)]
+                ready,slowest = statistics.median(r for r,_ in runs),max(s for _,s in runs)
+                print(f"  time to first response {ready:.3f}s (budget {args.ready_budget}s), slowest GET / in the next {args.watch}s {slowest:.3f}s (budget {args.latency_budget}s)")
+                if ready > args.ready_budget: failures.append(f"{app} answers after {ready:.3f}s, over the {args.ready_budget}s budget")
+                if slowest > args.latency_budget: failures.append(f"{app} took {slowest:.3f}s to answer GET / after starting, over the {args.latency_budget}s budget")
+    if failures: raise SystemExit("Cold start over budget:\n  " + "\n  ".join(failures))
+    print("Cold start within budget")
+
+if __name__ == "__main__": main()
@@ -0,0 +1,22 @@
+"Stop work for HTTP clients that have gone away, so a closed tab doesn't keep paying for tokens"
+import asyncio
+
+class Disconnected(Exception):
+    "The client closed the connection before its response was ready"
+
+async def watch_disconnect(request, poll=0.5):
+    "Return once the client behind `request` has disconnected"
+    while not await request.is_disconnected(): await asyncio.sleep(poll)
+
+async def unless_disconnected(request, aw, poll=0.5):
+    "The result of `aw`, or Disconnected once it has been cancelled because the client went away first"
+    work,gone = asyncio.ensure_future(aw),asyncio.create_task(watch_disconnect(request, poll))
+    try: done,_ = await asyncio.wait({work, gone}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        work.cancel()
+        raise
+    finally: gone.cancel()
+    if work in done: return work.result()
+    work.cancel()
+    await asyncio.gather(work, return_exceptions=True)  # let it release slots and close provider connections before answering
+    raise Disconnected()
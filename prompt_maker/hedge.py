@@ -0,0 +1,95 @@
+"Hedged requests and fallback chains across models, to cut tail latency from slow providers"
+import asyncio, os, time
+from collections import defaultdict, deque
+from ratelimit import governor
+
+def parse_models(s):
+    "Comma-separated model list, e.g. `gpt-3.5-turbo,claude-3-haiku-20240307`"
+    return [m.strip() for m in (s or "").split(",") if m.strip()]
+
+def parse_pairs(s):
+    "Comma-separated `primary=backup` pairs, e.g. `gpt-4=claude-3-sonnet-20240229`"
+    return dict(tuple(m.strip() for m in pair.split("=", 1)) for pair in parse_models(s) if "=" in pair)
+
+class LatencyTracker:
+    "Rolling window of time-to-first-token samples per model"
+    def __init__(self, window=200, min_samples=20): self.min_samples,self.samples = min_samples,defaultdict(lambda: deque(maxlen=window))
+    def record(self, model, seconds): self.samples[model].append(seconds)
+
+    def percentile(self, model, q=95):
+        "The `q`th percentile of recent samples, or None until `min_samples` have been seen"
+        xs = sorted(self.samples[model])
+        if len(xs) < self.min_samples: return None
+        return xs[min(len(xs) - 1, int(len(xs) * q / 100))]
+
+async def first_success(tasks):
+    "Whichever task succeeds first, cancelling the rest; re-raises the last error if every task fails"
+    pending,error = set(tasks),None
+    try:
+        while pending:
+            done,pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None: return t
+                error = t.exception()
+        raise error
+    finally:
+        for t in pending: t.cancel()
+
+class Hedger:
+    "Sends a backup request when a model misses its p95 first-token deadline, and walks a fallback chain on hard failures"
+    def __init__(self, hedges=None, fallbacks=None, percentile=95, default_deadline=2.0, completefunc=None):
+        self.hedges,self.fallbacks = hedges or {},fallbacks or []
+        self.percentile,self.default_deadline = percentile,default_deadline
+        self.completefunc = completefunc or governor.acompletion
+        self.latency = LatencyTracker()
+        self.hedges_fired = self.hedge_wins = self.fallbacks_used = 0
+
+    def deadline(self, model): return self.latency.percentile(model, self.percentile) or self.default_deadline
+
+    async def _stream(self, model, started, **kwargs):
+        "Stream one completion, recording time to first token and setting `started` when it arrives"
+        t0 = time.monotonic()
+        parts = []
+        async for chunk in await self.completefunc(model=model, stream=True, **kwargs):
+            if not (delta := chunk.choices[0].delta.content): continue
+            if not started.is_set():
+                self.latency.record(model, time.monotonic() - t0)
+                started.set()
+            parts.append(delta)
+        return "".join(parts)
+
+    async def _hedged(self, model, **kwargs):
+        backup = self.hedges.get(model)
+        if not backup:
+            response = await self.completefunc(model=model, **kwargs)
+            return response.choices[0].message.content
+        started = asyncio.Event()
+        primary,first_token = asyncio.create_task(self._stream(model, started, **kwargs)),asyncio.create_task(started.wait())
+        try: done,_ = await asyncio.wait({primary, first_token}, timeout=self.deadline(model), return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            primary.cancel()  # asyncio.wait doesn't pass a cancel on, and the caller no longer wants this stream
+            raise
+        finally: first_token.cancel()
+        if done: return await primary
+        self.hedges_fired += 1
+        hedge = asyncio.create_task(self._stream(backup, asyncio.Event(), **kwargs))
+        winner = await first_success([primary, hedge])
+        if winner is hedge: self.hedge_wins += 1
+        return winner.result()
+
+    async def complete(self, model, **kwargs):
+        "Completion text for `model`, hedged if it has a backup configured, trying `fallbacks` in order if it fails outright"
+        chain = [model] + [m for m in self.fallbacks if m != model]
+        for i,m in enumerate(chain):
+            try: return await self._hedged(m, **kwargs)
+            except Exception:
+                if i == len(chain) - 1: raise
+                self.fallbacks_used += 1
+
+    def stats(self): return dict(hedges_fired=self.hedges_fired, hedge_wins=self.hedge_wins, fallbacks_used=self.fallbacks_used,
+                                 deadlines={m: round(self.deadline(m), 3) for m in self.hedges})
+
+def hedger_from_env():
+    "Build a Hedger from `LLM_HEDGE` (primary=backup pairs) and `LLM_FALLBACKS` (ordered model list); both empty means plain calls"
+    return Hedger(parse_pairs(os.getenv("LLM_HEDGE")), parse_models(os.getenv("LLM_FALLBACKS")),
+                  percentile=float(os.getenv("HEDGE_PERCENTILE", 95)), default_deadline=float(os.getenv("HEDGE_DEFAULT_DEADLINE", 2.0)))
@@ -0,0 +1,86 @@
+"Server-side prompt history: SQLite in WAL mode, FTS5 full-text search, and cursor pagination"
+import hashlib, json, os, sqlite3, threading, time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prompts (id INTEGER PRIMARY KEY, user TEXT NOT NULL, criteria_hash TEXT NOT NULL, version INTEGER NOT NULL,
+    created REAL NOT NULL, criteria TEXT NOT NULL, prompt TEXT NOT NULL, components TEXT NOT NULL, model TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS prompts_user ON prompts (user, id);
+CREATE UNIQUE INDEX IF NOT EXISTS prompts_user_criteria ON prompts (user, criteria_hash, version);
+CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5(criteria, prompt, content='prompts', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS prompts_ai AFTER INSERT ON prompts BEGIN
+    INSERT INTO prompts_fts (rowid, criteria, prompt) VALUES (new.id, new.criteria, new.prompt); END;
+CREATE TRIGGER IF NOT EXISTS prompts_ad AFTER DELETE ON prompts BEGIN
+    INSERT INTO prompts_fts (prompts_fts, rowid, criteria, prompt) VALUES ('delete', old.id, old.criteria, old.prompt); END;
+"""
+
+COLUMNS = "id, version, created, criteria, prompt, components, model"
+
+def criteria_hash(criteria): return hashlib.sha256(criteria.strip().replace("\r\n", "\n").encode()).hexdigest()
+
+def fts_query(q):
+    "Quote each word of free text as an FTS5 prefix term, so punctuation in user input can't break the MATCH syntax"
+    return " ".join('"' + w.replace('"', '""') + '"*' for w in q.split())
+
+def row_dict(row):
+    d = dict(zip(COLUMNS.split(", "), row))
+    d["components"] = json.loads(d["components"])
+    return d
+
+class HistoryStore:
+    "Every saved prompt version per user, numbered per criteria, listed newest first with `id` cursors"
+    def __init__(self, path="history.db"):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=5)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def _exec(self, sql, params=()):
+        with self.lock: return self.db.execute(sql, params).fetchall()
+
+    def add(self, user, criteria, prompt, components=(), model=""):
+        "Save a new version of `prompt`, numbered after the last one saved for the same criteria"
+        h = criteria_hash(criteria)
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")  # serialise version numbering across workers
+            try:
+                version = self.db.execute("SELECT COALESCE(MAX(version), 0) + 1 FROM prompts WHERE user = ? AND criteria_hash = ?", (user, h)).fetchone()[0]
+                cur = self.db.execute("INSERT INTO prompts (user, criteria_hash, version, created, criteria, prompt, components, model) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                      (user, h, version, time.time(), criteria, prompt, json.dumps(list(components)), model))
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        return self.get(user, cur.lastrowid)
+
+    def get(self, user, id):
+        rows = self._exec(f"SELECT {COLUMNS} FROM prompts WHERE user = ? AND id = ?", (user, id))
+        return row_dict(rows[0]) if rows else None
+
+    def delete(self, user, id):
+        with self.lock: return self.db.execute("DELETE FROM prompts WHERE user = ? AND id = ?", (user, id)).rowcount > 0
+
+    def count(self, user): return self._exec("SELECT COUNT(*) FROM prompts WHERE user = ?", (user,))[0][0]
+
+    def next_version(self, user, criteria):
+        return self._exec("SELECT COALESCE(MAX(version), 0) + 1 FROM prompts WHERE user = ? AND criteria_hash = ?", (user, criteria_hash(criteria)))[0][0]
+
+    def list(self, user, cursor=None, limit=20, q="", criteria=None):
+        "A page of `user`'s history newest first, optionally full-text filtered by `q`, plus the cursor for the next page (None at the end)"
+        sql,params = f"SELECT {COLUMNS} FROM prompts WHERE user = ?",[user]
+        if q.strip():
+            sql += " AND id IN (SELECT rowid FROM prompts_fts WHERE prompts_fts MATCH ?)"
+            params.append(fts_query(q))
+        if criteria is not None:
+            sql += " AND criteria_hash = ?"
+            params.append(criteria_hash(criteria))
+        if cursor:
+            sql += " AND id < ?"
+            params.append(int(cursor))
+        rows = self._exec(sql + " ORDER BY id DESC LIMIT ?", (*params, limit + 1))
+        items = [row_dict(r) for r in rows[:limit]]
+        return items, (items[-1]["id"] if len(rows) > limit else None)
+
+def history_from_env():
+    "Build the history store at `HISTORY_PATH` (default `history.db`)"
+    return HistoryStore(os.getenv("HISTORY_PATH", "history.db"))
@@ -0,0 +1,202 @@
+"Durable generation jobs: a SQLite queue with leases, dedupe of identical pending jobs, cancellation and results that outlive the request"
+import asyncio, hashlib, json, os, sqlite3, threading, time, uuid
+from contextlib import contextmanager
+from metrics import GENERATIONS_CANCELLED
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, key TEXT NOT NULL, status TEXT NOT NULL, payload TEXT NOT NULL, progress INTEGER NOT NULL DEFAULT 0,
+    result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, lease_until REAL, created REAL NOT NULL, updated REAL NOT NULL, watched REAL);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+CREATE TABLE IF NOT EXISTS job_clients (job_id TEXT NOT NULL, client TEXT NOT NULL, PRIMARY KEY (job_id, client));
+"""
+
+COLUMNS = "id, key, status, payload, progress, result, error, attempts, lease_until, created, updated"
+PENDING = ("queued", "running")
+
+def job_key(payload): return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+class QueueFull(Exception):
+    "Raised by `submit` instead of queueing when `max_queued` jobs are already waiting to run"
+    def __init__(self, queued):
+        super().__init__(f"{queued} jobs already queued")
+        self.queued = queued
+
+def row_dict(row):
+    d = dict(zip(COLUMNS.split(", "), row))
+    d["payload"] = json.loads(d["payload"])
+    return d
+
+class JobQueue:
+    "Jobs run by `handler(job_id, payload)` on asyncio tasks in every worker sharing `path`; a worker holds a lease on each job it runs, so jobs from a dead worker are retried. Database calls made from the event loop run on a thread"
+    def __init__(self, handler, path="jobs.db", concurrency=32, lease=30.0, max_attempts=3, ttl=86400.0, poll=0.5, grace=15.0, max_queued=64):
+        self.handler,self.concurrency,self.lease,self.max_attempts,self.ttl,self.poll,self.grace = handler,concurrency,lease,max_attempts,ttl,poll,grace
+        self.max_queued = max_queued
+        self.lock,self.wake,self.tasks,self.runners,self.timers,self.stopping = threading.Lock(),None,{},set(),set(),False
+        self.loop,self.poller = None,None
+        self.finished = {}  # id -> event set when a job finishes in this worker, so local waiters don't have to poll
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=5)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        try: self.db.execute("ALTER TABLE jobs ADD COLUMN watched REAL")  # databases created before jobs could be abandoned
+        except sqlite3.OperationalError: pass
+
+    def _exec(self, sql, params=()):
+        with self.lock: return self.db.execute(sql, params).fetchall()
+
+    @contextmanager
+    def _transaction(self):
+        "The database inside BEGIN IMMEDIATE ... COMMIT, so a check and the write that depends on it don't interleave across workers"
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try: yield self.db
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+
+    def submit(self, payload, key=None, client=None):
+        "Queue `payload`, or return the id of a job with the same `key` (default: the same payload) that is still queued or running; raises QueueFull past `max_queued` waiting jobs"
+        key,now = key or job_key(payload),time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT id FROM jobs WHERE key = ? AND status IN ('queued', 'running') LIMIT 1", (key,)).fetchone()
+            id = row[0] if row else str(uuid.uuid4())
+            if not row and (queued := db.execute("SELECT count(*) FROM jobs WHERE status = 'queued'").fetchone()[0]) >= self.max_queued: raise QueueFull(queued)
+            if not row: db.execute("INSERT INTO jobs (id, key, status, payload, created, updated) VALUES (?, ?, 'queued', ?, ?, ?)", (id, key, json.dumps(payload), now, now))
+            if client is not None: db.execute("INSERT OR IGNORE INTO job_clients (job_id, client) VALUES (?, ?)", (id, client))  # everyone sharing the job, for `cancel`
+        if self.wake: self.wake.set()
+        return id
+
+    def get(self, id):
+        rows = self._exec(f"SELECT {COLUMNS} FROM jobs WHERE id = ?", (id,))
+        return row_dict(rows[0]) if rows else None
+
+    def set_progress(self, id, progress): self._exec("UPDATE jobs SET progress = ?, updated = ? WHERE id = ? AND status = 'running'", (progress, time.time(), id))
+
+    def cancel(self, id, reason="user", unwatched_since=None, client=None):
+        "Cancel a queued or running job (only if nobody has waited on it since `unwatched_since`; for a `client`, only once no other client that submitted it remains); a job running in another worker stops when that worker next renews its lease"
+        with self._transaction() as db:
+            if client is not None: db.execute("DELETE FROM job_clients WHERE job_id = ? AND client = ?", (id, client))
+            if client is not None and db.execute("SELECT 1 FROM job_clients WHERE job_id = ? LIMIT 1", (id,)).fetchone(): return False
+            cancelled = db.execute("UPDATE jobs SET status = 'cancelled', lease_until = NULL, updated = ? WHERE id = ? AND status IN ('queued', 'running') AND (? IS NULL OR coalesce(watched, 0) < ?) RETURNING id",
+                                   (time.time(), id, unwatched_since, unwatched_since)).fetchall()
+        if not cancelled: return False
+        if self.loop is None: self._stopped(id, reason)
+        else: self.loop.call_soon_threadsafe(self._stopped, id, reason)  # sync routes call this from a thread
+        return True
+
+    def _stopped(self, id, reason):
+        "Loop-side half of `cancel`: stop the job if it runs here and wake whoever waits on it"
+        if (task := self.tasks.get(id)) is not None: task.cancel()
+        self._notify(id)
+        GENERATIONS_CANCELLED.inc(reason=reason)
+
+    def abandon(self, id):
+        "Cancel a job if nobody waits on it again within `grace` seconds, e.g. because the page showing it was closed"
+        async def expire():
+            await asyncio.sleep(self.grace)
+            await asyncio.to_thread(self.cancel, id, reason="abandoned", unwatched_since=time.time() - self.grace)
+        if self.grace <= 0: return
+        timer = asyncio.create_task(expire())
+        self.timers.add(timer)
+        timer.add_done_callback(self.timers.discard)
+
+    def claim(self):
+        "Take the oldest queued job, or a running one whose worker stopped renewing its lease"
+        now = time.time()
+        rows = self._exec(f"""UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated = ? WHERE id = (
+            SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) ORDER BY created LIMIT 1) RETURNING {COLUMNS}""",
+                          (now + self.lease, now, now))
+        return row_dict(rows[0]) if rows else None
+
+    async def _finish(self, id, status, result=None, error=None):
+        await asyncio.to_thread(self._exec, "UPDATE jobs SET status = ?, result = ?, error = ?, progress = 100, lease_until = NULL, updated = ? WHERE id = ? AND status = 'running'",
+                                (status, result, error, time.time(), id))
+        self._notify(id)
+
+    def _notify(self, id):
+        if (ev := self.finished.pop(id, None)) is not None: ev.set()
+
+    async def _renew(self, id):
+        "Extend the lease while the job runs, and stop it if it was cancelled elsewhere"
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not await asyncio.to_thread(self._exec, "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running' RETURNING id", (time.time() + self.lease, id)):
+                self.tasks[id].cancel()
+                return
+
+    async def _run(self, job):
+        id = job["id"]
+        if job["attempts"] > self.max_attempts: return await self._finish(id, "failed", error="Gave up after the worker running it stopped repeatedly")
+        self.tasks[id] = task = asyncio.create_task(self.handler(id, job["payload"]))
+        renew = asyncio.create_task(self._renew(id))
+        try: await self._finish(id, "done", result=await task)
+        except asyncio.CancelledError:
+            if self.stopping or not task.cancelled(): raise  # the runner itself is shutting down
+        except Exception as e: await self._finish(id, "failed", error=str(e))
+        finally:
+            renew.cancel()
+            self.tasks.pop(id, None)
+
+    async def _poll(self):
+        "The worker's one claimer: takes jobs while fewer than `concurrency` run here and starts a runner task for each, so idle runners don't each hit the database"
+        while not self.stopping:
+            self.wake.clear()  # before claiming, so a submit that lands meanwhile isn't missed
+            if len(self.runners) < self.concurrency:
+                if (job := await asyncio.to_thread(self.claim)) is not None:
+                    if self.stopping:  # claimed as the worker began shutting down: hand it straight back
+                        await asyncio.to_thread(self._requeue, job["id"])
+                        return
+                    runner = asyncio.create_task(self._run(job))
+                    self.runners.add(runner)
+                    runner.add_done_callback(self._ran)
+                    continue
+            try: await asyncio.wait_for(self.wake.wait(), self.poll)  # jobs submitted to other workers show up on the next poll
+            except asyncio.TimeoutError: pass
+
+    def _ran(self, runner):
+        self.runners.discard(runner)
+        if self.wake: self.wake.set()  # a runner is free for the next job
+
+    def _requeue(self, id): self._exec("UPDATE jobs SET status = 'queued', lease_until = NULL, attempts = attempts - 1 WHERE id = ? AND status = 'running'", (id,))
+
+    def start(self):
+        "Start the claimer on the running event loop; it runs up to `concurrency` jobs at once"
+        self.wake,self.stopping,self.loop = asyncio.Event(),False,asyncio.get_running_loop()
+        self.poller = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        "Stop claiming and running jobs, and hand jobs still running here back to the queue, so another worker (or this one after a restart) picks them up"
+        self.stopping,running = True,list(self.tasks)
+        self.wake.set()  # not cancelled: a claim already on its thread would be lost, leaving the job leased until it expires
+        for t in [*self.runners, *self.tasks.values(), *self.timers]: t.cancel()
+        await asyncio.gather(*self.runners, *[t for t in [self.poller] if t], return_exceptions=True)
+        for id in running: await asyncio.to_thread(self._requeue, id)
+        self.runners,self.poller = set(),None
+
+    async def wait(self, id, timeout=600.0):
+        "The job once it has finished (or whatever state it's in at `timeout`), None if there is no such job; marks the job as watched meanwhile"
+        deadline,watched = time.monotonic() + timeout,0.0
+        while (job := await asyncio.to_thread(self.get, id)) is not None and job["status"] in PENDING and (left := deadline - time.monotonic()) > 0:
+            if time.monotonic() - watched > 1:  # a watched job isn't abandoned, whichever worker the waiter is on
+                await asyncio.to_thread(self._exec, "UPDATE jobs SET watched = ? WHERE id = ?", (time.time(), id))
+                watched = time.monotonic()
+            ev = self.finished.setdefault(id, asyncio.Event())
+            try: await asyncio.wait_for(ev.wait(), min(left, 0.25))  # polling picks up jobs finished by other workers
+            except asyncio.TimeoutError: pass
+        if job is None or job["status"] not in PENDING: self.finished.pop(id, None)
+        return job
+
+    def cleanup(self):
+        "Delete finished jobs older than `ttl`"
+        self._exec("DELETE FROM job_clients WHERE job_id IN (SELECT id FROM jobs WHERE status NOT IN ('queued', 'running'))")
+        return len(self._exec("DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND updated < ? RETURNING id", (time.time() - self.ttl,)))
+
+    async def acleanup(self): return await asyncio.to_thread(self.cleanup)
+
+def queue_from_env(handler):
+    "Job queue at `JOBS_PATH` (default `jobs.db`), with `JOB_CONCURRENCY` runners per worker (default: one per admission slot), at most `JOB_QUEUE` jobs waiting across workers (default `ADMISSION_QUEUE`), `JOB_LEASE` seconds, `JOB_TTL` seconds of result retention and `JOB_ABANDON_GRACE` seconds"
+    return JobQueue(handler, os.getenv("JOBS_PATH", "jobs.db"), concurrency=int(os.getenv("JOB_CONCURRENCY", os.getenv("ADMISSION_CAPACITY", 32))), lease=float(os.getenv("JOB_LEASE", 30)),
+                    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", 3)), ttl=float(os.getenv("JOB_TTL", 86400)), grace=float(os.getenv("JOB_ABANDON_GRACE", 15)),
+                    max_queued=int(os.getenv("JOB_QUEUE", os.getenv("ADMISSION_QUEUE", 64))))
@@ -0,0 +1,82 @@
+"Incremental and lenient parsing of the JSON objects LLMs return"
+import json
+
+_missing = object()
+
+def close_json(fragment, default=None):
+    "Best-effort value from a truncated JSON fragment, closing open strings, arrays and objects; `default` when that fails"
+    stack,in_str,esc = [],False,False
+    for c in fragment:
+        if in_str:
+            if esc: esc = False
+            elif c == "\\": esc = True
+            elif c == '"': in_str = False
+        elif c == '"': in_str = True
+        elif c in "{[": stack.append("}" if c == "{" else "]")
+        elif c in "}]" and stack: stack.pop()
+    s = fragment[:-1] if esc else fragment
+    if in_str: s += '"'
+    s = s.rstrip().rstrip(",")
+    if s.endswith(":"): s += " null"
+    try: return json.loads(s + "".join(reversed(stack)))
+    except json.JSONDecodeError: return default
+
+class JsonObjectStream:
+    "Parses one top-level JSON object as text streams in; `feed` returns each (key, value) pair the moment its value is complete"
+    def __init__(self):
+        self.buf,self.pos,self.depth,self.in_str,self.esc,self.closed = "",0,0,False,False,False
+        self.key = self.key_start = self.value_start = None
+        self.result = {}
+
+    def _emit(self, end):
+        "Finish the current top-level value, if one is in progress, at `buf[:end]`"
+        if self.key is None or self.value_start is None: return []
+        text = self.buf[self.value_start:end].strip()
+        if not text: return []
+        try: value = json.loads(text)
+        except json.JSONDecodeError: value = close_json(text, default=text.strip('"'))
+        key,self.key,self.value_start = self.key,None,None
+        self.result[key] = value
+        return [(key, value)]
+
+    def feed(self, text):
+        self.buf += text
+        out = []
+        for i in range(self.pos, len(self.buf)):
+            c = self.buf[i]
+            if self.in_str:
+                if self.esc: self.esc = False
+                elif c == "\\": self.esc = True
+                elif c == '"':
+                    self.in_str = False
+                    if self.depth == 1 and self.key_start is not None:
+                        self.key,self.key_start = json.loads(self.buf[self.key_start:i + 1]),None
+                    elif self.depth == 1: out += self._emit(i + 1)
+                continue
+            if self.closed: break
+            if c == '"' and self.depth > 0:
+                self.in_str = True
+                if self.depth == 1 and self.key is None: self.key_start = i
+            elif c in "{[": self.depth += 1
+            elif c in "}]" and self.depth > 0:
+                if self.depth == 1:
+                    out += self._emit(i)
+                    self.closed = True
+                self.depth -= 1
+                if self.depth == 1: out += self._emit(i + 1)
+            elif self.depth == 1 and c == ":" and self.key is not None: self.value_start = i + 1
+            elif self.depth == 1 and c == ",": out += self._emit(i)
+        self.pos = len(self.buf)
+        return out
+
+    def partial(self):
+        "Everything parsed so far, with the value still streaming repaired as best we can"
+        if self.key is None or self.value_start is None: return dict(self.result)
+        value = close_json(self.buf[self.value_start:], default=_missing)
+        return dict(self.result) if value is _missing else {**self.result, self.key: value}
+
+def repair_json(text):
+    "Parse an LLM's JSON object leniently: code fences and prose around it are ignored, and a truncated object keeps every value it can"
+    s = JsonObjectStream()
+    s.feed(text)
+    return s.partial()
@@ -0,0 +1,231 @@
+"Prometheus text-format metrics for requests, LLM calls and caches, plus the ASGI middleware and call tracker that feed them"
+import asyncio, math, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from tracing import start_span
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (10, 50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+def fmt_labels(names, values):
+    if not names: return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{n}="{esc(v)}"' for n,v in zip(names, values)) + "}"
+
+def fmt_value(v): return "+Inf" if v == math.inf else repr(float(v)) if isinstance(v, float) else str(v)
+
+class Metric:
+    "A named metric with one series per combination of label values"
+    kind = "untyped"
+    def __init__(self, name, help, labelnames=()): self.name,self.help,self.labelnames,self.series = name,help,tuple(labelnames),{}
+    def key(self, labels): return tuple(str(labels.get(n, "")) for n in self.labelnames)
+    def header(self): return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+    def samples(self): return [f"{self.name}{fmt_labels(self.labelnames, k)} {fmt_value(v)}" for k,v in self.series.items()]
+    def render(self): return self.header() + self.samples()
+
+class Counter(Metric):
+    kind = "counter"
+    def inc(self, amount=1, **labels):
+        k = self.key(labels)
+        self.series[k] = self.series.get(k, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+    def set(self, value, **labels): self.series[self.key(labels)] = value
+    def inc(self, amount=1, **labels):
+        k = self.key(labels)
+        self.series[k] = self.series.get(k, 0) + amount
+    def dec(self, amount=1, **labels): self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        counts,total = self.series.setdefault(self.key(labels), ([0] * len(self.buckets), [0.0]))
+        for i,b in enumerate(self.buckets):
+            if value <= b: counts[i] += 1
+        total[0] += value
+
+    def samples(self):
+        out = []
+        for k,(counts,total) in self.series.items():
+            out += [f"{self.name}_bucket{fmt_labels(self.labelnames + ('le',), k + (fmt_value(b),))} {c}" for b,c in zip(self.buckets, counts)]
+            out += [f"{self.name}_sum{fmt_labels(self.labelnames, k)} {fmt_value(total[0])}", f"{self.name}_count{fmt_labels(self.labelnames, k)} {counts[-1]}"]
+        return out
+
+class Callback(Metric):
+    "A metric read at scrape time from `fn()`, which returns {label values tuple: value}"
+    def __init__(self, name, help, labelnames, fn, kind="gauge"): super().__init__(name, help, labelnames); self.fn,self.kind = fn,kind
+    def samples(self):
+        self.series = self.fn()
+        return super().samples()
+
+class Registry:
+    "Metrics by name; registering a name twice returns the existing metric"
+    def __init__(self): self.metrics = {}
+    def add(self, m): return self.metrics.setdefault(m.name, m)
+    def counter(self, name, help, labelnames=()): return self.add(Counter(name, help, labelnames))
+    def gauge(self, name, help, labelnames=()): return self.add(Gauge(name, help, labelnames))
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS): return self.add(Histogram(name, help, labelnames, buckets))
+    def callback(self, name, help, labelnames, fn, kind="gauge"): return self.add(Callback(name, help, labelnames, fn, kind))
+    def render(self): return "\n".join(line for m in self.metrics.values() for line in m.render()) + "\n"
+
+metrics = Registry()
+REQUEST_SECONDS = metrics.histogram("prompt_maker_request_duration_seconds", "End-to-end HTTP request time, through the last byte of the body", ["route"])
+REQUEST_OVERHEAD = metrics.histogram("prompt_maker_request_overhead_seconds", "HTTP request time not spent waiting on an LLM provider", ["route"])
+IN_FLIGHT = metrics.gauge("prompt_maker_requests_in_flight", "HTTP requests currently being handled")
+LLM_IN_FLIGHT = metrics.gauge("prompt_maker_llm_calls_in_flight", "LLM provider calls currently outstanding", ["model"])
+LLM_SECONDS = metrics.histogram("prompt_maker_llm_duration_seconds", "LLM provider call time per attempt, through the end of the stream", ["model"])
+LLM_TTFT = metrics.histogram("prompt_maker_llm_time_to_first_token_seconds", "Time from sending a streaming LLM call to its first chunk", ["model"])
+LLM_TOKENS = metrics.histogram("prompt_maker_llm_tokens", "Tokens per LLM call, when the provider reports usage", ["model", "type"], TOKEN_BUCKETS)
+LLM_COST = metrics.counter("prompt_maker_llm_cost_usd_total", "Estimated LLM spend from LiteLLM's price table", ["model"])
+ERRORS = metrics.counter("prompt_maker_errors_total", "Errors by where they were caught and exception type", ["where", "type"])
+LLM_CANCELLED = metrics.counter("prompt_maker_llm_cancelled_total", "LLM calls stopped before they finished because nobody was waiting for the result", ["model"])
+LLM_TOKENS_SAVED = metrics.counter("prompt_maker_llm_tokens_saved_total", "Estimated completion tokens cancelled calls didn't generate: the model's typical completion minus chunks already received", ["model"])
+GENERATIONS_CANCELLED = metrics.counter("prompt_maker_generations_cancelled_total", "Generations stopped early: cancelled by the user, by a client disconnect, or as a job nobody came back for", ["reason"])
+ADMISSION_WAIT = metrics.histogram("prompt_maker_admission_wait_seconds", "Time generations waited in the admission queue before getting a slot", ["lane"])
+ADMISSION_REJECTED = metrics.counter("prompt_maker_admission_rejected_total", "Generations refused with a 503 instead of queueing, by lane and reason", ["lane", "reason"])
+
+watched = {}
+
+def watch_cache(name, cache):
+    "Export a cache's `stats()` (hits, misses, hit_rate, size, as `cache.ResponseCache` reports them) under the `cache` label"
+    watched[name] = cache
+    for field,help,kind in [("hits", "Cache hits", "counter"), ("misses", "Cache misses", "counter"),
+                            ("hit_rate", "Cache hits over lookups since start", "gauge"), ("size", "Entries held in memory", "gauge")]:
+        metrics.callback(f"prompt_maker_cache_{field}" + ("_total" if kind == "counter" else ""), help, ["cache"],
+                         lambda f=field: {(n,): c.stats()[f] for n,c in watched.items()}, kind)
+
+def watch_semantic(name, cache):
+    "Export a `semantic.SemanticCache` like any other cache, plus the regenerations that overrode its near-duplicate hits"
+    watch_cache(name, cache)
+    metrics.callback("prompt_maker_cache_overrides_total", "Cache-skipping regenerations right after a near-duplicate hit for the same text (likely false hits)", ["cache"],
+                     lambda: {(n,): c.stats()["overrides"] for n,c in watched.items() if "overrides" in c.stats()}, "counter")
+
+def watch_flights(name, flights):
+    "Export a `coalesce.SingleFlight`'s upstream runs (leaders) and the calls that joined one instead (followers)"
+    metrics.callback("prompt_maker_coalesced_calls_total", "Calls that started an upstream run (leader) or shared one already in flight (follower)", ["flight", "role"],
+                     lambda: {(name, r): flights.stats()[r + "s"] for r in ("leader", "follower")}, "counter")
+    metrics.callback("prompt_maker_coalesced_in_flight", "Upstream runs currently shared through single-flight", ["flight"], lambda: {(name,): flights.stats()["in_flight"]})
+
+def watch_admission(admission):
+    "Export an `admission.AdmissionController`'s slots in use and queue depth per lane"
+    metrics.callback("prompt_maker_admission_active", "Generations holding an admission slot", [], lambda: {(): admission.active})
+    metrics.callback("prompt_maker_admission_capacity", "Admission slots", [], lambda: {(): admission.capacity})
+    metrics.callback("prompt_maker_admission_queue_depth", "Generations waiting for an admission slot", ["lane"], lambda: {(lane,): admission.depth(lane) for lane in admission.queues})
+
+def watch_pools(registry):
+    "Export `clients.ClientRegistry` pool utilization per provider"
+    for field,help in [("in_flight", "Requests using the provider's connection pool"), ("open_connections", "Open connections in the provider's pool"),
+                       ("utilization", "In-flight requests over the pool's connection limit")]:
+        metrics.callback(f"prompt_maker_pool_{field}", help, ["provider"], lambda f=field: {(p,): s[f] for p,s in registry.stats().items()})
+
+class ProviderClock:
+    "Wall time during which at least one LLM call was outstanding, so overlapping calls are only counted once"
+    def __init__(self): self.active,self.started,self.total = 0,0.0,0.0
+
+    def enter(self):
+        if self.active == 0: self.started = time.perf_counter()
+        self.active += 1
+
+    def exit(self):
+        self.active -= 1
+        if self.active == 0: self.total += time.perf_counter() - self.started
+
+provider_clock = ContextVar("provider_clock", default=None)
+
+@contextmanager
+def waiting_on_provider():
+    "Count the block as provider time for the current request, e.g. while it awaits a generation running in a background task"
+    clock = provider_clock.get()
+    if clock: clock.enter()
+    try: yield
+    finally:
+        if clock: clock.exit()
+
+class MetricsMiddleware:
+    "ASGI middleware timing each HTTP request end to end and splitting off the time spent waiting on providers"
+    def __init__(self, app): self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http": return await self.app(scope, receive, send)
+        t0,clock = time.perf_counter(),ProviderClock()
+        token = provider_clock.set(clock)  # tasks spawned by the request copy the context, so they share this clock
+        IN_FLIGHT.inc()
+        try: await self.app(scope, receive, send)
+        except Exception as e:
+            ERRORS.inc(where="request", type=type(e).__name__)
+            raise
+        finally:
+            IN_FLIGHT.dec()
+            provider_clock.reset(token)
+            route,elapsed = getattr(scope.get("route"), "path", "unmatched"),time.perf_counter() - t0
+            REQUEST_SECONDS.observe(elapsed, route=route)
+            REQUEST_OVERHEAD.observe(max(0.0, elapsed - clock.total), route=route)
+
+def estimate_cost(model, usage):
+    try:
+        import litellm
+        return sum(litellm.cost_per_token(model=model, prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens))
+    except Exception: return 0.0
+
+typical_completion = {}  # model -> moving average of completion tokens, to estimate what a cancelled call would have produced
+
+class LlmCall:
+    "Tracks one provider call attempt: latency, first token for streams, token usage, estimated cost, errors and cancellation"
+    def __init__(self, model, max_tokens=None):
+        self.model,self.max_tokens,self.t0,self.clock = model,max_tokens,time.perf_counter(),provider_clock.get()
+        self.span = start_span("llm.completion", kind="client", model=model)
+        LLM_IN_FLIGHT.inc(model=model)
+        if self.clock: self.clock.enter()
+
+    def _finish(self, usage=None, error=None):
+        if self.span: self.span.end(error=error, prompt_tokens=getattr(usage, "prompt_tokens", None), completion_tokens=getattr(usage, "completion_tokens", None))
+        LLM_IN_FLIGHT.dec(model=self.model)
+        LLM_SECONDS.observe(time.perf_counter() - self.t0, model=self.model)
+        if self.clock: self.clock.exit()
+        if usage and getattr(usage, "total_tokens", None):
+            LLM_TOKENS.observe(usage.prompt_tokens, model=self.model, type="prompt")
+            LLM_TOKENS.observe(usage.completion_tokens, model=self.model, type="completion")
+            LLM_COST.inc(estimate_cost(self.model, usage), model=self.model)
+            avg = typical_completion.get(self.model, usage.completion_tokens)
+            typical_completion[self.model] = avg + 0.1 * (usage.completion_tokens - avg)
+
+    def failed(self, e):
+        ERRORS.inc(where="llm", type=type(e).__name__)
+        self._finish(error=e)
+
+    def cancelled(self, received=0):
+        "The caller went away, so the rest of the completion is never generated (or never read)"
+        expected = min(typical_completion.get(self.model, 0), self.max_tokens or math.inf)  # nothing to go on until a call to this model has completed
+        LLM_CANCELLED.inc(model=self.model)
+        LLM_TOKENS_SAVED.inc(max(0, round(expected - received)), model=self.model)
+        if self.span: self.span.set(cancelled=True, received_chunks=received)
+        self._finish()
+
+    def done(self, response):
+        self._finish(getattr(response, "usage", None))
+        return response
+
+    async def stream(self, chunks):
+        "Pass a streamed response through, recording time to first chunk; a stream abandoned part way closes the provider connection"
+        first,usage,received = True,None,0
+        try:
+            async for chunk in chunks:
+                if first:
+                    LLM_TTFT.observe(time.perf_counter() - self.t0, model=self.model)
+                    if self.span: self.span.set(ttft_ms=round((time.perf_counter() - self.t0) * 1000, 1))
+                first,usage,received = False,getattr(chunk, "usage", None) or usage,received + 1
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancelled(received)
+            if hasattr(chunks, "aclose"): await chunks.aclose()  # stops the provider generating tokens nobody will read
+            raise
+        except Exception as e:
+            self.failed(e)
+            raise
+        else: self._finish(usage)
@@ -0,0 +1,88 @@
+"Local mock of the OpenAI chat completions API, with configurable latency, token rate and error injection, for load tests that cost nothing"
+import argparse, asyncio, json, math, random, time, uuid
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+def parse_dist(spec):
+    "A sampler from `fixed:S`, `uniform:LO,HI`, `normal:MEAN,SD` or `lognormal:MEDIAN,SIGMA` (seconds)"
+    kind,_,args = spec.partition(":")
+    a = [float(x) for x in args.split(",") if x]
+    if kind == "fixed": return lambda: a[0]
+    if kind == "uniform": return lambda: random.uniform(a[0], a[1])
+    if kind == "normal": return lambda: max(0.0, random.gauss(a[0], a[1]))
+    if kind == "lognormal": return lambda: random.lognormvariate(math.log(a[0]), a[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+WORDS = "clear specific concise expert context examples format audience tone constraints steps criteria output review".split()
+
+def filler(n): return " ".join(random.choice(WORDS) for _ in range(n))
+
+def reply_text(body, tokens):
+    "Roughly `tokens` tokens of text; a JSON object with the schema's keys when the request asks for JSON output"
+    fmt = body.get("response_format") or {}
+    if fmt.get("type") == "json_schema":
+        keys = list(fmt["json_schema"]["schema"].get("properties", {})) or ["text"]
+        return json.dumps({k: filler(max(1, tokens // len(keys))) for k in keys})
+    if fmt.get("type") == "json_object": return json.dumps({"text": filler(tokens)})
+    return filler(tokens)
+
+class MockProvider:
+    "Chat completions with a sampled time to first token, then tokens at `tokens_per_sec`; `error_rate` of requests fail with one of `error_codes`"
+    def __init__(self, ttft="fixed:0.3", tokens_per_sec=80.0, completion_tokens=200, error_rate=0.0, error_codes=(429, 500)):
+        self.ttft,self.tokens_per_sec,self.completion_tokens = parse_dist(ttft),tokens_per_sec,completion_tokens
+        self.error_rate,self.error_codes = error_rate,tuple(error_codes)
+        self.requests = self.streams = self.errors = 0
+        self.app = Starlette(routes=[Route("/v1/chat/completions", self.completions, methods=["POST"]),
+                                     Route("/chat/completions", self.completions, methods=["POST"]), Route("/stats", self.stats)])
+
+    async def completions(self, request):
+        body = await request.json()
+        self.requests += 1
+        if random.random() < self.error_rate:
+            self.errors += 1
+            code = random.choice(self.error_codes)
+            return JSONResponse({"error": {"message": f"Injected {code}", "type": "mock_error", "code": code}}, status_code=code,
+                                headers={"retry-after": "0"} if code == 429 else None)
+        tokens = min(self.completion_tokens, body.get("max_tokens") or self.completion_tokens)
+        text,model,id = reply_text(body, tokens),body.get("model", "mock"),f"chatcmpl-{uuid.uuid4().hex}"
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+        usage = dict(prompt_tokens=prompt_tokens, completion_tokens=tokens, total_tokens=prompt_tokens + tokens)
+        await asyncio.sleep(self.ttft())
+        if body.get("stream"):
+            self.streams += 1
+            return StreamingResponse(self.chunks(id, model, text, tokens, usage, body), media_type="text/event-stream")
+        await asyncio.sleep(tokens / self.tokens_per_sec)
+        return JSONResponse(dict(id=id, object="chat.completion", created=int(time.time()), model=model, usage=usage,
+                                 choices=[dict(index=0, message=dict(role="assistant", content=text), finish_reason="stop")]))
+
+    async def chunks(self, id, model, text, tokens, usage, body):
+        "SSE chunks of `text`, paced at the configured token rate"
+        parts = max(1, min(tokens, 50))
+        step,delay = math.ceil(len(text) / parts),tokens / self.tokens_per_sec / parts
+        chunk = lambda delta, finish=None: dict(id=id, object="chat.completion.chunk", created=int(time.time()), model=model,
+                                                choices=[dict(index=0, delta=delta, finish_reason=finish)])
+        for i in range(0, len(text), step):
+            yield f"data: {json.dumps(chunk(dict(content=text[i:i + step])))}\n\n"
+            await asyncio.sleep(delay)
+        final = chunk({}, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"): final["usage"] = usage
+        yield f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n"
+
+    async def stats(self, request): return JSONResponse(dict(requests=self.requests, streams=self.streams, errors=self.errors))
+
+def main(argv=None):
+    import uvicorn
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8900)
+    p.add_argument("--ttft", default="fixed:0.3", help="time to first token: fixed:S, uniform:LO,HI, normal:MEAN,SD or lognormal:MEDIAN,SIGMA")
+    p.add_argument("--tokens-per-sec", type=float, default=80.0)
+    p.add_argument("--completion-tokens", type=int, default=200)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--error-codes", default="429,500")
+    a = p.parse_args(argv)
+    mock = MockProvider(a.ttft, a.tokens_per_sec, a.completion_tokens, a.error_rate, [int(c) for c in a.error_codes.split(",")])
+    uvicorn.run(mock.app, host=a.host, port=a.port, log_level="warning")
+
+if __name__ == "__main__": main()
@@ -0,0 +1,138 @@
+"Per-provider rate limiting and retries for LLM calls"
+import asyncio, functools, os, random, time, weakref
+from metrics import LlmCall
+
+PROVIDER_PREFIXES = {"gpt-": "openai", "o1": "openai", "o3": "openai", "o4": "openai", "chatgpt": "openai", "claude": "anthropic",
+                     "gemini": "gemini", "mistral": "mistral", "command": "cohere"}
+
+def provider_of(model):
+    "LiteLLM provider name for `model`, e.g. `openai` for `gpt-4` and `anthropic` for `claude-3-haiku-20240307`"
+    if "/" in model: return model.split("/", 1)[0]
+    return next((p for prefix,p in PROVIDER_PREFIXES.items() if model.startswith(prefix)), "unknown")
+
+class TokenBucket:
+    "Async token bucket refilling at `rate` tokens per second up to `capacity`; waiters are served first come, first served"
+    def __init__(self, rate, capacity=None):
+        self.rate,self.capacity = rate,capacity or rate
+        self.tokens,self.updated,self.lock = self.capacity,time.monotonic(),asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, n=1):
+        n = min(n, self.capacity)
+        async with self.lock:
+            self._refill()
+            while self.tokens < n:
+                await asyncio.sleep((n - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= n
+
+    def refund(self, n):
+        "Return `n` tokens (negative to charge more), e.g. once a call's real usage is known"
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + n)
+
+def env_limit(name, provider, default):
+    "Read `{name}_{PROVIDER}`, falling back to `{name}` and then `default`"
+    return float(os.getenv(f"{name}_{provider.upper()}", os.getenv(name, default)))
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+def is_retryable(e):
+    "Rate limits, provider 5xx errors, timeouts and dropped connections are worth retrying"
+    status = getattr(e, "status_code", None)
+    if status is not None: return status in RETRY_STATUS
+    return type(e).__name__ in ("Timeout", "APIConnectionError", "APITimeoutError", "TimeoutError")
+
+def retry_after(e):
+    "Seconds the provider asked us to wait, if it sent a Retry-After header"
+    try: return float(e.response.headers["retry-after"])
+    except Exception: return None
+
+def estimate_tokens(messages, max_tokens=None):
+    "Rough token cost of a call: ~4 characters per prompt token plus the completion budget"
+    chars = sum(len(m["content"]) if isinstance(m.get("content"), str) else 0 for m in messages)
+    return chars // 4 + (max_tokens or 1000)
+
+@functools.cache
+def reports_stream_usage(model):
+    "Whether `model` can send token usage in a stream's last chunk (`stream_options.include_usage`)"
+    try:
+        import litellm
+        return "stream_options" in (litellm.get_supported_openai_params(model=model) or [])
+    except Exception: return False
+
+class ProviderLimits:
+    "Request and token budgets plus a concurrency cap for one provider"
+    def __init__(self, provider):
+        rpm,tpm = env_limit("LLM_RPM", provider, 60),env_limit("LLM_TPM", provider, 90_000)
+        self.requests,self.tokens = TokenBucket(rpm / 60, capacity=rpm),TokenBucket(tpm / 60, capacity=tpm)
+        self.slots = asyncio.Semaphore(int(env_limit("LLM_CONCURRENCY", provider, 16)))
+
+class Governor:
+    "Shared gate in front of every LLM call: per-provider RPM/TPM budgets, a concurrency cap, and jittered retries on 429/5xx"
+    def __init__(self, retries=None, base_delay=0.5, max_delay=30.0, completefunc=None):
+        self.retries = int(os.getenv("LLM_MAX_RETRIES", 3)) if retries is None else retries
+        self.base_delay,self.max_delay,self.completefunc,self.providers = base_delay,max_delay,completefunc,{}
+
+    def limits(self, model):
+        provider = provider_of(model)
+        if provider not in self.providers: self.providers[provider] = ProviderLimits(provider)
+        return self.providers[provider]
+
+    def backoff(self, attempt, e=None):
+        "Full-jitter exponential backoff, never shorter than the provider's Retry-After"
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after(e) or 0)
+
+    async def acompletion(self, **kwargs):
+        "Drop-in for `litellm.acompletion` (and lisette's `completefunc`) that waits for budget and retries transient errors"
+        if self.completefunc is None:
+            from clients import registry  # pooled per-provider clients shared by the whole process
+            self.completefunc = registry.acompletion
+        kwargs["num_retries"] = 0  # retries happen here, so each attempt is charged against the budget
+        if kwargs.get("stream") and "stream_options" not in kwargs and reports_stream_usage(kwargs["model"]): kwargs["stream_options"] = {"include_usage": True}
+        limits = self.limits(kwargs["model"])
+        est = estimate_tokens(kwargs.get("messages", []), kwargs.get("max_tokens"))
+        for attempt in range(self.retries + 1):
+            await limits.requests.acquire()
+            await limits.tokens.acquire(est)
+            await limits.slots.acquire()  # before the call starts, so time queued for a slot isn't provider latency
+            call,streaming,error = LlmCall(kwargs["model"], kwargs.get("max_tokens")),False,None
+            try:
+                res = await self.completefunc(**kwargs)
+                if kwargs.get("stream"): res,streaming = self.held(limits, est, call, res),True
+            except asyncio.CancelledError:
+                call.cancelled()
+                raise
+            except Exception as e:
+                call.failed(e)
+                if attempt == self.retries or not is_retryable(e): raise
+                error = e
+            finally:
+                if not streaming: limits.slots.release()  # a stream gives its slot back once it's been read
+            if error is not None:
+                await asyncio.sleep(self.backoff(attempt, error))
+                continue
+            if streaming: return res
+            if (usage := getattr(res, "usage", None)) and usage.total_tokens: limits.tokens.refund(est - usage.total_tokens)
+            return call.done(res)
+
+    def held(self, limits, est, call, chunks):
+        "`chunks` holding the provider's concurrency slot until the stream ends, is closed or is dropped unread; the usage in its last chunk corrects the token budget"
+        async def stream():
+            usage = None
+            try:
+                async for chunk in call.stream(chunks):
+                    usage = getattr(chunk, "usage", None) or usage
+                    yield chunk
+            finally: release()
+            if usage and usage.total_tokens: limits.tokens.refund(est - usage.total_tokens)
+        s = stream()
+        release = weakref.finalize(s, limits.slots.release)  # runs once: when the stream finishes, or when it's garbage collected never started
+        return s
+
+governor = Governor()
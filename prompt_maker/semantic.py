@@ -0,0 +1,136 @@
+"Semantic cache: generations for near-duplicate criteria, matched by cosine similarity of local hashed n-gram embeddings in a NumPy index"
+import hashlib, os, re, threading, time
+import numpy as np
+
+STOPWORDS = set("a an and are as at be by for from how i in into is it me my of on or please the to with write create make give".split())
+
+def normalize(text): return " ".join(text.lower().split())
+
+DIRECTIONS = set("to into from than vs versus".split())
+
+def roles(text):
+    "Content words in order, lowercased and crudely singularised, each with the direction word it follows (`to`, `from`, `vs`...) or `head` before any"
+    out,role = [],"head"
+    for w in re.findall(r"[a-z0-9+#]+", text.lower()):
+        if w in DIRECTIONS and out: role = w; continue  # `how to write` has nothing before `to` for it to point away from
+        if w in STOPWORDS: continue
+        if len(w) > 4 and w.endswith("ies"): w = w[:-3] + "y"
+        elif len(w) > 3 and w.endswith("s") and not w.endswith("ss"): w = w[:-1]
+        out.append((w, role))
+    return out
+
+def words(text):
+    "Content words in order, so `Python loops tutorial` and `a python loop tutorial` share every feature"
+    return [w for w,_ in roles(text)]
+
+def feature_index(feature, dim):
+    h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+    return h % dim, 1.0 if h >> 63 else -1.0
+
+class HashingEmbedder:
+    "Text embedding from hashed words, character trigrams and which side of a `to`/`from`/`vs` each word is on: CPU only, no model download, deterministic across workers"
+    def __init__(self, dim=256): self.dim = dim
+
+    def __call__(self, text):
+        v,rs = np.zeros(self.dim, dtype=np.float32),roles(text)
+        for w,_ in rs:
+            i,sign = feature_index(f"w:{w}", self.dim)
+            v[i] += sign
+            padded = f"<{w}>"
+            for j in range(len(padded) - 2):
+                i,sign = feature_index(f"c:{padded[j:j + 3]}", self.dim)
+                v[i] += 0.3 * sign  # trigrams catch typos and word-form variants without outweighing whole words
+        if any(r != "head" for _,r in rs):
+            # Order only matters across a direction: `English to French` and `French to English` share every word but no side,
+            # while `tutorial for beginners` and `beginner tutorial` stay the same bag of words
+            for w,r in rs:
+                i,sign = feature_index(f"r:{r}:{w}", self.dim)
+                v[i] += sign
+        n = np.linalg.norm(v)
+        return v / n if n else v
+
+def scope_id(scope): return int.from_bytes(hashlib.blake2b(repr(scope).encode(), digest_size=8).digest(), "little", signed=True)
+
+class SemanticCache:
+    "Values keyed by text, returned for any text within `threshold` cosine similarity under the same scope (e.g. model and components)"
+    def __init__(self, threshold=0.9, maxsize=10_000, ttl=86400.0, embed=None):
+        self.threshold,self.maxsize,self.ttl,self.embed = threshold,maxsize,ttl,embed or HashingEmbedder()
+        self.lock = threading.Lock()
+        dim,cap = self.embed.dim,min(256, maxsize)
+        self.vectors = np.zeros((cap, dim), dtype=np.float16)  # half precision: similarity only needs to be good to ~1e-3
+        self.scopes,self.expires = np.zeros(cap, dtype=np.int64),np.zeros(cap, dtype=np.float64)
+        self.values,self.keys,self.rows = [None] * cap,[None] * cap,{}
+        self.size = self.next = 0
+        self.hits = self.misses = self.overrides = 0
+        self.served = {}  # (scope, text) -> time of the last near-duplicate hit served for it
+
+    def _grow(self):
+        cap = min(self.maxsize, len(self.values) * 2)
+        if cap == len(self.values): return
+        extra = cap - len(self.values)
+        self.vectors = np.vstack([self.vectors, np.zeros((extra, self.vectors.shape[1]), dtype=np.float16)])
+        self.scopes,self.expires = np.concatenate([self.scopes, np.zeros(extra, dtype=np.int64)]),np.concatenate([self.expires, np.zeros(extra)])
+        self.values += [None] * extra
+        self.keys += [None] * extra
+
+    def get(self, text, scope):
+        "The value stored for the most similar text in `scope` and its similarity, or (None, best similarity) below the threshold"
+        q,sid,now = self.embed(text),scope_id(scope),time.time()
+        with self.lock:
+            live = np.flatnonzero((self.scopes[:self.size] == sid) & (self.expires[:self.size] > now))
+            best,sim = None,0.0
+            if len(live):
+                sims = self.vectors[live].astype(np.float32) @ q
+                i = int(np.argmax(sims))
+                best,sim = int(live[i]),float(sims[i])
+            if best is None or sim < self.threshold:
+                self.misses += 1
+                return None, sim
+            self.hits += 1
+            key = (sid, normalize(text))
+            if self.keys[best] != key: self.served[key] = now
+            return self.values[best], sim
+
+    def set(self, text, scope, value):
+        sid = scope_id(scope)
+        key,vec = (sid, normalize(text)),self.embed(text)
+        with self.lock:
+            if (row := self.rows.get(key)) is None:
+                if self.size < self.maxsize and self.size == len(self.values): self._grow()
+                if self.size < len(self.values): row,self.size = self.size,self.size + 1
+                else: row,self.next = self.next,(self.next + 1) % self.maxsize  # full: overwrite the oldest entry
+                if self.keys[row] is not None: self.rows.pop(self.keys[row], None)
+                self.rows[key] = row
+            self.vectors[row],self.scopes[row],self.expires[row] = vec,sid,time.time() + self.ttl
+            self.values[row],self.keys[row] = value,key
+
+    def override(self, text, scope):
+        "Record a regeneration that bypassed the cache right after a near-duplicate hit for the same text: most likely a false hit"
+        key = (scope_id(scope), normalize(text))
+        with self.lock:
+            if self.served.pop(key, None) is None: return False
+            self.overrides += 1
+            return True
+
+    def cleanup(self):
+        "Forget expired entries and served-hit records"
+        now = time.time()
+        with self.lock:
+            expired = np.flatnonzero((self.expires[:self.size] <= now) & (self.scopes[:self.size] != 0))
+            for row in expired:
+                self.rows.pop(self.keys[row], None)
+                self.values[row],self.keys[row],self.scopes[row] = None,None,0
+            self.served = {k: t for k,t in self.served.items() if t > now - self.ttl}
+        return len(expired)
+
+    @property
+    def hit_rate(self): return self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0
+
+    def stats(self): return dict(hits=self.hits, misses=self.misses, hit_rate=round(self.hit_rate, 4), size=len(self.rows), overrides=self.overrides,
+                                 false_hit_rate=round(self.overrides / self.hits, 4) if self.hits else 0.0, threshold=self.threshold)
+
+def semantic_cache_from_env():
+    "Semantic cache with `SEMANTIC_CACHE_THRESHOLD` (default 0.9), or None when `SEMANTIC_CACHE=false`"
+    if os.getenv("SEMANTIC_CACHE", "true").lower() not in ("1", "true", "yes"): return None
+    return SemanticCache(threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.9)), maxsize=int(os.getenv("SEMANTIC_CACHE_SIZE", 10_000)),
+                         ttl=float(os.getenv("SEMANTIC_CACHE_TTL", os.getenv("RESPONSE_CACHE_TTL", 86400))), embed=HashingEmbedder(int(os.getenv("SEMANTIC_CACHE_DIM", 256))))
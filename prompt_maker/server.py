@@ -0,0 +1,52 @@
+"Development and production server entry points, configured from env vars or CLI flags"
+import argparse, os, sys
+
+CLI_ENV = {"--host": "HOST", "--port": "PORT", "--workers": "WEB_CONCURRENCY", "--keep-alive": "KEEP_ALIVE",
+           "--backlog": "BACKLOG", "--limit-concurrency": "LIMIT_CONCURRENCY", "--graceful-timeout": "GRACEFUL_TIMEOUT"}
+
+def parse_cli(argv=None):
+    "Copy `--prod` and the `CLI_ENV` flags into env vars, so uvicorn's spawned workers see the same settings"
+    p = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    p.add_argument("--prod", action="store_true")
+    for flag,env in CLI_ENV.items(): p.add_argument(flag, dest=env)
+    args,_ = p.parse_known_args(sys.argv[1:] if argv is None else argv)
+    if args.prod: os.environ["ENVIRONMENT"] = "production"
+    for env in CLI_ENV.values():
+        if (v := getattr(args, env)) is not None: os.environ[env] = v
+
+def is_production(): return os.getenv("ENVIRONMENT", "development").lower() == "production"
+
+def app_options():
+    "`live` and `debug` for `fast_app`: live reload only in development, and debug only there when `DEBUG` (default true) allows"
+    parse_cli()
+    prod = is_production()
+    return dict(live=not prod, debug=not prod and os.getenv("DEBUG", "true").lower() in ("1", "true", "yes"))
+
+def serve_production(target):
+    "Serve `target` (`module:app`) with N uvicorn workers, bounded keep-alive and backlog, and a graceful drain of in-flight requests on shutdown"
+    import uvicorn
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+    if workers > 1:
+        # generate and stream requests can land on different workers, so they need a session store every worker sees
+        store = os.environ.setdefault("SESSION_STORE", "sqlite:///sessions.db")
+        if not store.startswith("sqlite://"): raise SystemExit(f"SESSION_STORE={store} is per worker; use sqlite:///sessions.db with {workers} workers, or WEB_CONCURRENCY=1")
+    limit = os.getenv("LIMIT_CONCURRENCY")
+    uvicorn.run(target, host=os.getenv("HOST", "0.0.0.0"), port=int(os.getenv("PORT", 5001)), workers=workers,
+                loop="auto", http="auto",  # uvloop and httptools, installed with uvicorn[standard]
+                reload=False, proxy_headers=True, server_header=False,
+                timeout_keep_alive=int(os.getenv("KEEP_ALIVE", 5)), backlog=int(os.getenv("BACKLOG", 2048)),
+                limit_concurrency=int(limit) if limit else None,
+                # On SIGTERM stop accepting connections and let running generations and streams finish, up to this many seconds
+                timeout_graceful_shutdown=int(os.getenv("GRACEFUL_TIMEOUT", 30)))
+
+def run_production(appname, app="app"):
+    "Replace this process with a `server.py` supervisor, so workers re-import only this small module rather than the whole app script"
+    os.execv(sys.executable, [sys.executable, __file__, f"{appname}:{app}"])
+
+def run(appname, app="app"):
+    "Start the server for the script `appname`: FastHTML's live-reloading `serve()` in development, `run_production` in production"
+    if is_production(): return run_production(appname, app)
+    from fasthtml.common import serve
+    serve(appname=appname, app=app)
+
+if __name__ == "__main__": serve_production(sys.argv[1])
@@ -0,0 +1,923 @@
+// AI Prompt Maker client script, served as a versioned static asset by app_bkp.py
+
+// ---- Component selection and templates ----
+// Template presets data, fetched as cacheable JSON from the versioned URL on the script tag
+const templatePresetsUrl = document.currentScript?.dataset.presetsUrl || '/api/template-presets';
+let templatePresets = [];
+
+function selectAll() {
+    document.querySelectorAll('input[name="components"]').forEach(cb => cb.checked = true);
+}
+function clearAll() {
+    document.querySelectorAll('input[name="components"]').forEach(cb => cb.checked = false);
+}
+
+function applyTemplate() {
+    const select = document.getElementById('template_preset');
+    const index = select.value;
+
+    if (index === '') return;
+
+    const template = templatePresets[index];
+
+    // Clear all first
+    clearAll();
+
+    // Apply template components
+    template.components.forEach(component => {
+        const checkbox = document.getElementById(`comp_${component}`);
+        if (checkbox) checkbox.checked = true;
+    });
+
+    // Show feedback
+    const option = select.options[select.selectedIndex];
+    alert(`Applied template: ${template.name}`);
+
+    // Reset selection
+    select.value = '';
+}
+
+async function saveTemplate() {
+    const selectedComponents = Array.from(document.querySelectorAll('input[name="components"]:checked'))
+        .map(cb => cb.value);
+
+    if (selectedComponents.length === 0) {
+        alert('Please select some components first!');
+        return;
+    }
+
+    const name = prompt('Template name:');
+    if (!name) return;
+
+    const description = prompt('Template description:');
+    if (!description) return;
+
+    const category = prompt('Category (e.g., Writing, Technical, Business):') || 'Custom';
+
+    // Save to the server library, then pull the change into the local copy
+    const response = await fetch('/api/templates', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ name: name, description: description, components: selectedComponents, category: category })
+    });
+    const result = await response.json();
+    if (!result.success) {
+        alert(`Could not save template: ${result.error}`);
+        return;
+    }
+
+    alert(result.added ? `Template "${name}" saved successfully!` : `An identical template is already saved.`);
+    await syncTemplates();
+}
+
+async function showTemplateManager() {
+    const customTemplates = JSON.parse(localStorage.getItem('custom_templates') || '[]');
+
+    if (customTemplates.length === 0) {
+        alert('No custom templates saved yet. Create one using "Save as Template"!');
+        return;
+    }
+
+    let templateList = customTemplates.map((template, index) => 
+        `${index + 1}. ${template.name} (${template.category}) - ${template.components.length} components`
+    ).join('\n');
+
+    const choice = prompt(`Custom Templates:\n\n${templateList}\n\nEnter template number to delete, or press Cancel:`);
+
+    if (choice && !isNaN(choice)) {
+        const index = parseInt(choice) - 1;
+        if (index >= 0 && index < customTemplates.length) {
+            const template = customTemplates[index];
+            if (confirm(`Delete template "${template.name}"?`)) {
+                await fetch(`/api/templates/${template.hash}`, { method: 'DELETE' });
+                await syncTemplates();
+                alert('Template deleted!');
+            }
+        }
+    }
+}
+
+function updateTemplateDropdown() {
+    const select = document.getElementById('template_preset');
+    const customTemplates = JSON.parse(localStorage.getItem('custom_templates') || '[]');
+
+    // Clear existing options except first
+    while (select.options.length > 1) {
+        select.removeChild(select.lastChild);
+    }
+
+    // Add built-in presets
+    templatePresets.forEach((preset, index) => {
+        const option = new Option(`${preset.name} - ${preset.description}`, index);
+        select.appendChild(option);
+    });
+
+    // Add custom templates
+    if (customTemplates.length > 0) {
+        const separator = new Option('--- Custom Templates ---', '', false, false);
+        separator.disabled = true;
+        select.appendChild(separator);
+
+        customTemplates.forEach((template, index) => {
+            const option = new Option(`${template.name} - ${template.description}`, `custom_${index}`);
+            select.appendChild(option);
+        });
+    }
+}
+
+// Enhanced applyTemplate to handle custom templates
+function applyTemplate() {
+    const select = document.getElementById('template_preset');
+    const value = select.value;
+
+    if (value === '') return;
+
+    let template;
+    if (value.startsWith('custom_')) {
+        const customTemplates = JSON.parse(localStorage.getItem('custom_templates') || '[]');
+        const index = parseInt(value.replace('custom_', ''));
+        template = customTemplates[index];
+    } else {
+        template = templatePresets[value];
+    }
+
+    if (!template) return;
+
+    // Clear all first
+    clearAll();
+
+    // Apply template components
+    template.components.forEach(component => {
+        const checkbox = document.getElementById(`comp_${component}`);
+        if (checkbox) checkbox.checked = true;
+    });
+
+    // Show feedback
+    alert(`Applied template: ${template.name}`);
+
+    // Reset selection
+    select.value = '';
+}
+
+// Custom templates live in the server library; localStorage keeps a copy plus the library version it reflects
+async function syncTemplates() {
+    let since = parseInt(localStorage.getItem('custom_templates_version') || '0');
+    let templates = new Map(JSON.parse(localStorage.getItem('custom_templates') || '[]').map(t => [t.hash, t]));
+
+    // Fetch only the changes since our version; the ETag is the library version, so an up-to-date copy costs a 304
+    while (true) {
+        const response = await fetch(`/api/templates?since=${since}`, { headers: { 'If-None-Match': `"${since}"` } });
+        if (response.status === 304) break;
+        const page = await response.json();
+
+        // The server library is older than our copy (e.g. it was reset), so start over from scratch
+        if (page.version < since) {
+            since = 0;
+            templates = new Map();
+            continue;
+        }
+
+        page.changes.forEach(t => t.deleted ? templates.delete(t.hash) : templates.set(t.hash, t));
+        since = page.version;
+        if (!page.more) break;
+    }
+
+    localStorage.setItem('custom_templates', JSON.stringify([...templates.values()]));
+    localStorage.setItem('custom_templates_version', since);
+    updateTemplateDropdown();
+}
+
+async function migrateLocalTemplates() {
+    // Templates saved by older versions of the app only exist in this browser; upload them once
+    const local = JSON.parse(localStorage.getItem('custom_templates') || '[]');
+    const legacy = local.filter(t => !t.hash);
+    if (legacy.length === 0) return;
+
+    // Keep them until the server has them, so a failed upload is retried on the next load
+    try {
+        const response = await fetch('/api/templates/import', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ templates: legacy })
+        });
+        if (!response.ok) return;
+    } catch (error) {
+        return;
+    }
+    localStorage.removeItem('custom_templates');
+    localStorage.removeItem('custom_templates_version');
+}
+
+// Load presets and initialize template dropdown on page load
+document.addEventListener('DOMContentLoaded', async function() {
+    fetch(templatePresetsUrl)
+        .then(response => response.json())
+        .then(presets => {
+            templatePresets = presets;
+            updateTemplateDropdown();
+        });
+
+    await migrateLocalTemplates();
+    await syncTemplates();
+});
+
+// ---- Criteria input: word count and auto-save ----
+let saveTimeout;
+
+function updateWordCount() {
+    const textarea = document.getElementById('main_criteria');
+    const text = textarea.value.trim();
+
+    const wordCount = text === '' ? 0 : text.split(/\s+/).length;
+    const charCount = textarea.value.length;
+
+    document.getElementById('word-count').textContent = wordCount;
+    document.getElementById('char-count').textContent = charCount;
+}
+
+function autoSave() {
+    const status = document.getElementById('save-status');
+    status.classList.remove('opacity-0');
+    status.textContent = 'Saving...';
+    status.className = status.className.replace('text-green-600', 'text-yellow-600');
+
+    // Clear existing timeout
+    clearTimeout(saveTimeout);
+
+    // Set new timeout for auto-save
+    saveTimeout = setTimeout(() => {
+        // Simulate save (in real app, this would send to server)
+        localStorage.setItem('prompt_criteria', document.getElementById('main_criteria').value);
+
+        status.textContent = 'Auto-saved';
+        status.className = status.className.replace('text-yellow-600', 'text-green-600');
+
+        // Hide status after 2 seconds
+        setTimeout(() => {
+            status.classList.add('opacity-0');
+        }, 2000);
+    }, 1000);
+}
+
+// Load saved content on page load
+document.addEventListener('DOMContentLoaded', function() {
+    const saved = localStorage.getItem('prompt_criteria');
+    if (saved) {
+        document.getElementById('main_criteria').value = saved;
+        updateWordCount();
+    }
+});
+
+// ---- Generation, output actions, history, export, help and shortcuts ----
+function previewPrompt() {
+    const output = document.getElementById('generated_prompt');
+    const selectedComponents = Array.from(document.querySelectorAll('input[name="components"]:checked'))
+        .map(cb => cb.value);
+    const criteria = document.getElementById('main_criteria').value.trim();
+
+    if (!criteria) {
+        alert('Please enter your criteria first!');
+        return;
+    }
+
+    const prompt = buildStructuredPrompt(selectedComponents, criteria);
+    output.value = prompt;
+
+    // Show preview feedback
+    const status = document.getElementById('gen-status');
+    status.textContent = 'Preview Generated';
+    status.className = status.className.replace('text-muted-foreground', 'text-blue-600');
+    setTimeout(() => {
+        status.textContent = 'Ready';
+        status.className = status.className.replace('text-blue-600', 'text-muted-foreground');
+    }, 2000);
+}
+
+async function generatePrompt() {
+    const btn = document.getElementById('generate_btn');
+    const status = document.getElementById('gen-status');
+    const spinner = document.getElementById('gen-spinner');
+    const output = document.getElementById('generated_prompt');
+
+    // Get selected components
+    const selectedComponents = Array.from(document.querySelectorAll('input[name="components"]:checked'))
+        .map(cb => cb.value);
+
+    // Get main criteria
+    const criteria = document.getElementById('main_criteria').value.trim();
+
+    if (!criteria) {
+        alert('Please enter your criteria first!');
+        return;
+    }
+
+    // Get configuration
+    const model = document.getElementById('llm_model').value || 'gpt-3.5-turbo';
+    const customConditions = document.getElementById('custom_conditions').value || '';
+
+    // Update UI for generation
+    btn.disabled = true;
+    status.textContent = 'Generating with AI...';
+    status.className = status.className.replace('text-muted-foreground', 'text-blue-600');
+    spinner.classList.remove('hidden');
+
+    try {
+        // Call real API
+        const response = await fetch('/api/generate', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                components: selectedComponents,
+                criteria: criteria,
+                custom_conditions: customConditions,
+                model: model
+            })
+        });
+
+        const result = await response.json();
+
+        if (result.success) {
+            output.value = result.prompt;
+            status.textContent = 'AI Generation Complete';
+            status.className = status.className.replace('text-blue-600', 'text-green-600');
+        } else {
+            output.value = `Error: ${result.error}`;
+            status.textContent = 'Generation Error';
+            status.className = status.className.replace('text-blue-600', 'text-red-600');
+        }
+    } catch (error) {
+        output.value = `Network error: ${error.message}`;
+        status.textContent = 'Network Error';
+        status.className = status.className.replace('text-blue-600', 'text-red-600');
+    }
+
+    // Reset UI
+    btn.disabled = false;
+    spinner.classList.add('hidden');
+
+    // Auto-hide status after 3 seconds
+    setTimeout(() => {
+        status.textContent = 'Ready';
+        status.className = status.className.replace(/text-(green|red)-600/, 'text-muted-foreground');
+    }, 3000);
+}
+
+function buildStructuredPrompt(components, criteria) {
+    let prompt = `# AI Prompt\n\n`;
+
+    if (components.includes('role')) {
+        prompt += `## Role & Persona\nAct as an expert in the relevant field with deep knowledge and experience.\n\n`;
+    }
+
+    if (components.includes('task')) {
+        prompt += `## Task\n${criteria}\n\n`;
+    }
+
+    if (components.includes('context')) {
+        prompt += `## Context\nConsider the broader context and background information relevant to this task.\n\n`;
+    }
+
+    if (components.includes('format')) {
+        prompt += `## Output Format\nProvide a clear, well-structured response that is easy to understand and actionable.\n\n`;
+    }
+
+    if (components.includes('examples')) {
+        prompt += `## Examples\nInclude relevant examples to illustrate key points where appropriate.\n\n`;
+    }
+
+    if (components.includes('constraints')) {
+        prompt += `## Constraints\nEnsure the response is accurate, helpful, and follows best practices.\n\n`;
+    }
+
+    if (components.includes('evaluation')) {
+        prompt += `## Success Criteria\nThe response should be comprehensive, actionable, and directly address the stated requirements.\n\n`;
+    }
+
+    // Add custom conditions if present
+    const customConditions = document.getElementById('custom_conditions').value.trim();
+    if (customConditions) {
+        prompt += `## Additional Requirements\n${customConditions}\n\n`;
+    }
+
+    return prompt;
+}
+
+function copyPrompt() {
+    const output = document.getElementById('generated_prompt');
+    output.select();
+    document.execCommand('copy');
+
+    // Show temporary feedback
+    const btn = event.target;
+    const originalText = btn.textContent;
+    btn.textContent = 'Copied!';
+    setTimeout(() => btn.textContent = originalText, 1500);
+}
+
+function editPrompt() {
+    const output = document.getElementById('generated_prompt');
+    output.readOnly = !output.readOnly;
+
+    const btn = event.target;
+    btn.textContent = output.readOnly ? 'Edit' : 'Lock';
+}
+
+async function saveToHistory() {
+    const prompt = document.getElementById('generated_prompt').value;
+    if (!prompt.trim()) {
+        alert('No prompt to save!');
+        return;
+    }
+
+    // The server numbers versions per criteria and keeps every one of them
+    const response = await fetch('/api/history', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            prompt: prompt,
+            criteria: document.getElementById('main_criteria').value,
+            components: Array.from(document.querySelectorAll('input[name="components"]:checked')).map(cb => cb.value),
+            model: document.getElementById('llm_model').value || 'gpt-3.5-turbo'
+        })
+    });
+    const result = await response.json();
+    if (!result.success) {
+        alert(`Could not save: ${result.error}`);
+        return;
+    }
+
+    // Update button to show next version
+    const btn = document.getElementById('save_btn');
+    const originalText = `Save v${result.next_version}.0`;
+
+    // Show feedback
+    btn.textContent = `Saved v${result.entry.version}.0!`;
+    setTimeout(() => btn.textContent = originalText, 2000);
+
+    // Update history display if visible
+    updateHistoryDisplay();
+}
+
+function showExportModal() {
+    const prompt = document.getElementById('generated_prompt').value;
+    if (!prompt.trim()) {
+        alert('No prompt to export!');
+        return;
+    }
+
+    // Create modal content
+    const modalContent = `
+        <div style="position: fixed; top: 0; left: 0; width: 100%; height: 100%; background: rgba(0,0,0,0.5); z-index: 1000; display: flex; align-items: center; justify-content: center;" onclick="closeExportModal()">
+            <div style="background: white; padding: 2rem; border-radius: 8px; max-width: 500px; width: 90%;" onclick="event.stopPropagation();">
+                <h3 style="margin-top: 0;">Export Prompt</h3>
+                <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 1rem; margin: 1rem 0;">
+                    <button onclick="exportAs('text')" style="padding: 0.5rem; border: 1px solid #ccc; border-radius: 4px; background: #f8f9fa;">Plain Text</button>
+                    <button onclick="exportAs('markdown')" style="padding: 0.5rem; border: 1px solid #ccc; border-radius: 4px; background: #f8f9fa;">Markdown</button>
+                    <button onclick="exportAs('json')" style="padding: 0.5rem; border: 1px solid #ccc; border-radius: 4px; background: #f8f9fa;">JSON</button>
+                    <button onclick="exportAs('copy')" style="padding: 0.5rem; border: 1px solid #ccc; border-radius: 4px; background: #e3f2fd;">Copy to Clipboard</button>
+                </div>
+                <button onclick="closeExportModal()" style="width: 100%; padding: 0.5rem; border: 1px solid #ccc; border-radius: 4px; background: #f5f5f5;">Close</button>
+            </div>
+        </div>
+    `;
+
+    // Add modal to page
+    const modal = document.createElement('div');
+    modal.id = 'export-modal';
+    modal.innerHTML = modalContent;
+    document.body.appendChild(modal);
+}
+
+function closeExportModal() {
+    const modal = document.getElementById('export-modal');
+    if (modal) modal.remove();
+}
+
+function exportAs(format) {
+    const prompt = document.getElementById('generated_prompt').value;
+    const criteria = document.getElementById('main_criteria').value;
+    const timestamp = new Date().toLocaleString();
+    const components = Array.from(document.querySelectorAll('input[name="components"]:checked')).map(cb => cb.value);
+
+    let content, filename, mimeType;
+
+    switch (format) {
+        case 'text':
+            content = prompt;
+            filename = `prompt_${Date.now()}.txt`;
+            mimeType = 'text/plain';
+            break;
+
+        case 'markdown':
+            content = `# AI Prompt Export\n\n**Generated:** ${timestamp}\n**Components:** ${components.join(', ')}\n\n## Original Criteria\n${criteria}\n\n## Generated Prompt\n${prompt}`;
+            filename = `prompt_${Date.now()}.md`;
+            mimeType = 'text/markdown';
+            break;
+
+        case 'json':
+            content = JSON.stringify({
+                timestamp,
+                criteria,
+                components,
+                prompt,
+                metadata: {
+                    wordCount: prompt.trim().split(/\s+/).length,
+                    charCount: prompt.length,
+                    model: document.getElementById('llm_model').value
+                }
+            }, null, 2);
+            filename = `prompt_${Date.now()}.json`;
+            mimeType = 'application/json';
+            break;
+
+        case 'copy':
+            navigator.clipboard.writeText(prompt).then(() => {
+                alert('Prompt copied to clipboard!');
+            });
+            closeExportModal();
+            return;
+    }
+
+    // Download file
+    const blob = new Blob([content], { type: mimeType });
+    const url = URL.createObjectURL(blob);
+    const a = document.createElement('a');
+    a.href = url;
+    a.download = filename;
+    a.click();
+    URL.revokeObjectURL(url);
+
+    closeExportModal();
+}
+
+let historyCursor = null;
+let historySearchTimer = null;
+
+function historyItemHtml(item) {
+    const wordCount = item.prompt.trim().split(/\s+/).length;
+    return `
+            <div class="border-b pb-3 mb-3 cursor-pointer hover:bg-muted p-2 rounded" onclick="loadPrompt(${item.id})">
+                <div class="flex justify-between items-start mb-1">
+                    <strong class="text-sm">v${item.version}.0</strong>
+                    <small class="text-muted-foreground">${new Date(item.created * 1000).toLocaleString()}</small>
+                </div>
+                <div class="text-sm text-muted-foreground mb-1">
+                    Model: ${item.model} | ${wordCount} words
+                </div>
+                <div class="text-sm line-clamp-2">${item.criteria.substring(0, 100)}${item.criteria.length > 100 ? '...' : ''}</div>
+            </div>
+        `;
+}
+
+async function updateHistoryDisplay(append = false) {
+    const count = document.getElementById('history_count');
+    const historyList = document.getElementById('history_list');
+    const search = document.getElementById('history_search');
+
+    // Fetch one page from the server; `append` continues from the last cursor
+    const params = new URLSearchParams({ limit: 5, q: search ? search.value : '' });
+    if (append && historyCursor) params.set('cursor', historyCursor);
+    const response = await fetch(`/api/history?${params}`);
+    const page = await response.json();
+    historyCursor = page.next_cursor;
+
+    // Update count
+    count.textContent = `${page.total} saved`;
+
+    // Update history list
+    if (!append) historyList.innerHTML = '';
+    document.getElementById('history_more')?.remove();
+    if (page.items.length === 0 && !append) {
+        historyList.innerHTML = search && search.value
+            ? '<p class="text-muted-foreground">No saved prompts match your search.</p>'
+            : '<p class="text-muted-foreground">No prompts saved yet. Generate and save prompts to see them here.</p>';
+    } else {
+        historyList.insertAdjacentHTML('beforeend', page.items.map(historyItemHtml).join(''));
+
+        if (historyCursor) {
+            historyList.insertAdjacentHTML('beforeend', `<p id="history_more" class="text-center text-sm"><a href="#" onclick="event.preventDefault(); updateHistoryDisplay(true)">Load more...</a></p>`);
+        }
+    }
+}
+
+function searchHistory() {
+    // Debounce so typing doesn't send a request per keystroke
+    clearTimeout(historySearchTimer);
+    historySearchTimer = setTimeout(() => updateHistoryDisplay(), 200);
+}
+
+async function migrateLocalHistory() {
+    // Move prompts saved by older versions of the app (browser-only, capped at 20) to the server, oldest first
+    // Each prompt leaves localStorage only once the server has it; after a failure the rest wait for the next load
+    const history = JSON.parse(localStorage.getItem('prompt_history') || '[]');
+    while (history.length > 0) {
+        const item = history[history.length - 1];
+        try {
+            const response = await fetch('/api/history', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ prompt: item.prompt, criteria: item.criteria, components: item.components, model: item.model })
+            });
+            if (!response.ok) return;
+        } catch (error) {
+            return;
+        }
+        history.pop();
+        if (history.length > 0) localStorage.setItem('prompt_history', JSON.stringify(history));
+        else localStorage.removeItem('prompt_history');
+    }
+}
+
+function toggleHistory() {
+    const panel = document.getElementById('history_panel');
+    const btn = document.getElementById('history_btn');
+
+    if (panel.classList.contains('hidden')) {
+        panel.classList.remove('hidden');
+        btn.textContent = '︽ Hide History';
+        updateHistoryDisplay();
+    } else {
+        panel.classList.add('hidden');
+        btn.innerHTML = '<svg class="w-4 h-4 mr-2" fill="currentColor"><use href="#history"></use></svg>History';
+    }
+}
+
+async function loadPrompt(promptId) {
+    const response = await fetch(`/api/history/${promptId}`);
+
+    if (response.ok) {
+        const prompt = await response.json();
+
+        // Load prompt data
+        document.getElementById('main_criteria').value = prompt.criteria;
+        document.getElementById('generated_prompt').value = prompt.prompt;
+
+        // Update component selection
+        document.querySelectorAll('input[name="components"]').forEach(cb => {
+            cb.checked = prompt.components.includes(cb.value);
+        });
+
+        // Update model selection
+        document.getElementById('llm_model').value = prompt.model;
+
+        // Update word count
+        updateWordCount();
+
+        // Hide history panel
+        toggleHistory();
+
+        alert(`Loaded v${prompt.version}.0 from ${new Date(prompt.created * 1000).toLocaleString()}`);
+    }
+}
+
+function exportTemplates() {
+    const customTemplates = JSON.parse(localStorage.getItem('custom_templates') || '[]');
+
+    if (customTemplates.length === 0) {
+        alert('No custom templates to export. Create some templates first!');
+        return;
+    }
+
+    // The server streams the whole library as JSONL, one template per line
+    const a = document.createElement('a');
+    a.href = '/api/templates/export';
+    a.download = `prompt_templates_${new Date().toISOString().split('T')[0]}.jsonl`;
+    a.click();
+}
+
+function importTemplates() {
+    const input = document.createElement('input');
+    input.type = 'file';
+    input.accept = '.json,.jsonl';
+    input.onchange = async function(event) {
+        const file = event.target.files[0];
+        if (!file) return;
+
+        // Ask user about merge strategy
+        const choice = confirm(`Import templates from ${file.name}?\n\nOK = Merge with existing\nCancel = Replace all existing`);
+
+        try {
+            // Upload the file as-is; the server streams it in, skipping templates it already has
+            const response = await fetch(`/api/templates/import?mode=${choice ? 'merge' : 'replace'}`, {
+                method: 'POST',
+                headers: { 'Content-Type': file.name.endsWith('.json') ? 'application/json' : 'application/x-ndjson' },
+                body: file
+            });
+            const result = await response.json();
+
+            if (!result.success) {
+                alert('Error reading template file: ' + result.error);
+            } else if (result.duplicates > 0) {
+                alert(`Imported ${result.added} new templates. ${result.duplicates} were skipped (duplicates).`);
+            } else {
+                alert(`Imported ${result.added} templates successfully!`);
+            }
+        } catch (error) {
+            alert('Error importing templates: ' + error.message);
+        }
+
+        await syncTemplates();
+    };
+    input.click();
+}
+
+function showHelp() {
+    const helpContent = `
+        <div style="position: fixed; top: 0; left: 0; width: 100%; height: 100%; background: rgba(0,0,0,0.8); z-index: 2000; display: flex; align-items: center; justify-content: center;" onclick="closeHelp()">
+            <div style="background: white; padding: 2rem; border-radius: 12px; max-width: 600px; width: 90%; max-height: 80vh; overflow-y: auto;" onclick="event.stopPropagation();">
+                <div style="display: flex; justify-content: between; align-items: center; margin-bottom: 1rem;">
+                    <h2 style="margin: 0;">🚀 AI Prompt Maker - Quick Help</h2>
+                    <button onclick="closeHelp()" style="background: #f5f5f5; border: 1px solid #ddd; border-radius: 4px; padding: 0.5rem; cursor: pointer;">✕</button>
+                </div>
+
+                <div style="space-y: 1rem;">
+                    <div>
+                        <h3 style="color: #2563eb; margin-bottom: 0.5rem;">⌨️ Keyboard Shortcuts</h3>
+                        <div style="font-family: monospace; font-size: 0.9rem; line-height: 1.6;">
+                            <div><strong>Ctrl+P</strong> - Preview prompt</div>
+                            <div><strong>Ctrl+G</strong> - Generate with AI</div>
+                            <div><strong>Ctrl+S</strong> - Save to history</div>
+                            <div><strong>Ctrl+H</strong> - Toggle history</div>
+                            <div><strong>Ctrl+E</strong> - Export prompt</div>
+                            <div><strong>Ctrl+A</strong> - Select all components</div>
+                            <div><strong>Ctrl+D</strong> - Clear all components</div>
+                            <div><strong>?</strong> - Show this help</div>
+                            <div><strong>Escape</strong> - Close modals</div>
+                        </div>
+                    </div>
+
+                    <div>
+                        <h3 style="color: #2563eb; margin-bottom: 0.5rem;">📝 Quick Start</h3>
+                        <ol style="padding-left: 1.2rem; line-height: 1.6;">
+                            <li>Choose a template or select components manually</li>
+                            <li>Enter your criteria in the main text area</li>
+                            <li>Click Preview for instant results or Generate with AI for enhanced prompts</li>
+                            <li>Save your prompts and export them for later use</li>
+                        </ol>
+                    </div>
+
+                    <div>
+                        <h3 style="color: #2563eb; margin-bottom: 0.5rem;">💡 Pro Tips</h3>
+                        <ul style="padding-left: 1.2rem; line-height: 1.6;">
+                            <li>Use templates for consistent prompt structures</li>
+                            <li>Save custom templates for your specific use cases</li>
+                            <li>Export templates to share with your team</li>
+                            <li>Version numbering helps track prompt iterations</li>
+                            <li>Custom conditions add specific requirements</li>
+                        </ul>
+                    </div>
+                </div>
+            </div>
+        </div>
+    `;
+
+    const modal = document.createElement('div');
+    modal.id = 'help-modal';
+    modal.innerHTML = helpContent;
+    document.body.appendChild(modal);
+}
+
+function closeHelp() {
+    const modal = document.getElementById('help-modal');
+    if (modal) modal.remove();
+}
+
+// Keyboard shortcuts
+document.addEventListener('keydown', function(e) {
+    // Don't trigger shortcuts when typing in inputs
+    if (e.target.tagName === 'TEXTAREA' || e.target.tagName === 'INPUT') {
+        return;
+    }
+
+    if (e.ctrlKey || e.metaKey) {
+        switch(e.key) {
+            case 'p':
+                e.preventDefault();
+                previewPrompt();
+                break;
+            case 'g':
+                e.preventDefault();
+                generatePrompt();
+                break;
+            case 's':
+                e.preventDefault();
+                saveToHistory();
+                break;
+            case 'h':
+                e.preventDefault();
+                toggleHistory();
+                break;
+            case 'e':
+                e.preventDefault();
+                showExportModal();
+                break;
+            case 'a':
+                e.preventDefault();
+                selectAll();
+                break;
+            case 'd':
+                e.preventDefault();
+                clearAll();
+                break;
+        }
+    } else if (e.key === '?') {
+        e.preventDefault();
+        showHelp();
+    } else if (e.key === 'Escape') {
+        // Close any open modals
+        closeHelp();
+        closeExportModal();
+    }
+});
+
+// Enhanced loading states
+function showLoading(element, text = 'Loading...') {
+    const loadingSpinner = element.querySelector('.loading-spinner') || document.createElement('div');
+    loadingSpinner.className = 'loading-spinner';
+    loadingSpinner.innerHTML = `
+        <div style="display: flex; align-items: center; justify-content: center; padding: 1rem;">
+            <div style="width: 20px; height: 20px; border: 2px solid #f3f3f3; border-top: 2px solid #3498db; border-radius: 50%; animation: spin 1s linear infinite; margin-right: 0.5rem;"></div>
+            <span>${text}</span>
+        </div>
+    `;
+    if (!element.querySelector('.loading-spinner')) {
+        element.appendChild(loadingSpinner);
+    }
+}
+
+function hideLoading(element) {
+    const spinner = element.querySelector('.loading-spinner');
+    if (spinner) spinner.remove();
+}
+
+// Add CSS for spinner animation
+const style = document.createElement('style');
+style.textContent = `
+    @keyframes spin {
+        0% { transform: rotate(0deg); }
+        100% { transform: rotate(360deg); }
+    }
+    .tooltip {
+        position: relative;
+        display: inline-block;
+    }
+    .tooltip .tooltiptext {
+        visibility: hidden;
+        width: 200px;
+        background-color: #333;
+        color: #fff;
+        text-align: center;
+        border-radius: 6px;
+        padding: 5px;
+        position: absolute;
+        z-index: 1;
+        bottom: 125%;
+        left: 50%;
+        margin-left: -100px;
+        opacity: 0;
+        transition: opacity 0.3s;
+        font-size: 0.8rem;
+    }
+    .tooltip:hover .tooltiptext {
+        visibility: visible;
+        opacity: 1;
+    }
+`;
+document.head.appendChild(style);
+
+// Initialize history display and other features on page load
+document.addEventListener('DOMContentLoaded', async function() {
+    if (localStorage.getItem('prompt_history')) await migrateLocalHistory();
+    updateHistoryDisplay();
+
+    // Add tooltips to buttons
+    addTooltips();
+
+    // Show welcome message for first-time users
+    if (!localStorage.getItem('has_visited')) {
+        setTimeout(() => {
+            if (confirm('Welcome to AI Prompt Maker! 🎉\n\nWould you like to see a quick tour of the features?')) {
+                showHelp();
+            }
+            localStorage.setItem('has_visited', 'true');
+        }, 1000);
+    }
+});
+
+function addTooltips() {
+    // Add tooltips to key elements
+    const tooltips = {
+        'generate_btn': 'Generate enhanced prompt using AI (Ctrl+G)',
+        'preview_btn': 'Quick preview of structured prompt (Ctrl+P)', 
+        'save_btn': 'Save this prompt to history (Ctrl+S)',
+        'history_btn': 'View saved prompts (Ctrl+H)',
+        'template_preset': 'Quick-apply common component combinations'
+    };
+
+    Object.entries(tooltips).forEach(([id, text]) => {
+        const element = document.getElementById(id);
+        if (element && !element.title) {
+            element.title = text;
+        }
+    });
+}
@@ -0,0 +1,103 @@
+"Session state stores with max-size and TTL eviction, shared by the generate endpoints"
+import asyncio, json, logging, os, sqlite3, threading, time
+from collections import OrderedDict
+from metrics import ERRORS
+
+log = logging.getLogger(__name__)
+
+class MemoryStore:
+    "In-process LRU store; entries expire after `ttl` seconds and the oldest are evicted beyond `maxsize`"
+    def __init__(self, maxsize=10_000, ttl=3600): self.maxsize,self.ttl,self.d = maxsize,ttl,OrderedDict()
+    def __len__(self): return len(self.d)
+
+    def __setitem__(self, key, value):
+        self.d[key] = (time.monotonic() + self.ttl, value)
+        self.d.move_to_end(key)
+        while len(self.d) > self.maxsize: self.d.popitem(last=False)
+
+    def get(self, key, default=None):
+        item = self.d.get(key)
+        if item is None: return default
+        if item[0] < time.monotonic():
+            del self.d[key]
+            return default
+        self.d.move_to_end(key)
+        return item[1]
+
+    def pop(self, key, default=None):
+        item = self.d.pop(key, None)
+        return default if item is None or item[0] < time.monotonic() else item[1]
+
+    def cleanup(self):
+        "Drop expired entries, returning how many were removed"
+        now = time.monotonic()
+        expired = [k for k,(exp,_) in self.d.items() if exp < now]
+        for k in expired: del self.d[k]
+        return len(expired)
+
+    # The same calls for async code; an in-process dict never blocks, so these run inline on the event loop
+    async def aget(self, key, default=None): return self.get(key, default)
+    async def aset(self, key, value): self[key] = value
+    async def apop(self, key, default=None): return self.pop(key, default)
+    async def acleanup(self): return self.cleanup()
+
+class SqliteStore:
+    "SQLite-backed store in WAL mode, so every uvicorn worker on the host sees the same entries"
+    def __init__(self, path="sessions.db", maxsize=100_000, ttl=3600, table="sessions"):
+        self.maxsize,self.ttl,self.table,self.lock = maxsize,ttl,table,threading.Lock()
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=5)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+        self.db.execute(f"CREATE INDEX IF NOT EXISTS {table}_expires ON {table} (expires)")
+
+    def _exec(self, sql, params=()):
+        with self.lock: return self.db.execute(sql, params).fetchall()
+
+    def __len__(self): return self._exec(f"SELECT COUNT(*) FROM {self.table} WHERE expires >= ?", (time.time(),))[0][0]
+
+    def __setitem__(self, key, value):
+        self._exec(f"INSERT OR REPLACE INTO {self.table} (key, value, expires) VALUES (?, ?, ?)", (key, json.dumps(value), time.time() + self.ttl))
+
+    def get(self, key, default=None):
+        rows = self._exec(f"SELECT value FROM {self.table} WHERE key = ? AND expires >= ?", (key, time.time()))
+        return json.loads(rows[0][0]) if rows else default
+
+    def pop(self, key, default=None):
+        "Atomically remove and return `key`, so only one worker can claim a session"
+        rows = self._exec(f"DELETE FROM {self.table} WHERE key = ? RETURNING value, expires", (key,))
+        return json.loads(rows[0][0]) if rows and rows[0][1] >= time.time() else default
+
+    def cleanup(self):
+        "Drop expired entries and trim the oldest beyond `maxsize`, returning how many were removed"
+        with self.lock:
+            n = self.db.execute(f"DELETE FROM {self.table} WHERE expires < ?", (time.time(),)).rowcount
+            n += self.db.execute(f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY expires DESC LIMIT -1 OFFSET ?)", (self.maxsize,)).rowcount
+        return n
+
+    # The same calls for async code, on a thread: a write can wait up to the 5s busy timeout while another worker holds the lock
+    async def aget(self, key, default=None): return await asyncio.to_thread(self.get, key, default)
+    async def aset(self, key, value): await asyncio.to_thread(self.__setitem__, key, value)
+    async def apop(self, key, default=None): return await asyncio.to_thread(self.pop, key, default)
+    async def acleanup(self): return await asyncio.to_thread(self.cleanup)
+
+def store_from_env():
+    "Build the store named by `SESSION_STORE` (`memory` or `sqlite:///path/to.db`)"
+    url = os.getenv("SESSION_STORE", "memory")
+    kw = dict(maxsize=int(os.getenv("SESSION_MAXSIZE", 10_000)), ttl=float(os.getenv("SESSION_TTL", 3600)))
+    if url.startswith("sqlite://"): return SqliteStore(url.removeprefix("sqlite://").removeprefix("/") or "sessions.db", **kw)
+    return MemoryStore(**kw)
+
+def start_cleanup(store, interval=60):
+    "Run `store.cleanup()` (or `acleanup()`, for stores that would block the loop) every `interval` seconds on the running event loop; a failed run is logged and retried next time"
+    async def _loop():
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if hasattr(store, "acleanup"): await store.acleanup()
+                else: store.cleanup()
+            except Exception as e:  # e.g. "database is locked": one missed sweep mustn't stop them for good
+                ERRORS.inc(where="cleanup", type=type(e).__name__)
+                log.exception("Cleanup of %s failed", type(store).__name__)
+    store.cleanup_task = asyncio.create_task(_loop())
+    return store.cleanup_task
@@ -0,0 +1,132 @@
+"Server-side template library: content-hash dedupe, JSONL import/export, and since-version sync"
+import hashlib, json, os, sqlite3, threading, time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (id INTEGER PRIMARY KEY, library TEXT NOT NULL, hash TEXT NOT NULL, version INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, name TEXT NOT NULL, description TEXT NOT NULL, category TEXT NOT NULL, components TEXT NOT NULL);
+CREATE UNIQUE INDEX IF NOT EXISTS templates_library_hash ON templates (library, hash);
+CREATE INDEX IF NOT EXISTS templates_library_version ON templates (library, version);
+"""
+
+FIELDS = ("name", "description", "category", "components")
+COLUMNS = "hash, version, deleted, created, name, description, category, components"
+
+def normalize(t):
+    "The fields that make up a template, cleaned up; anything else (ids, timestamps) is ignored. Raises ValueError for something that isn't a template"
+    if not isinstance(t, dict): raise ValueError(f"A template must be a JSON object, not {type(t).__name__}")
+    if not isinstance(t.get("components", []), list): raise ValueError("A template's components must be a list")
+    return dict(name=str(t.get("name", "")).strip(), description=str(t.get("description", "")).strip(),
+                category=str(t.get("category") or "Custom").strip(), components=[str(c) for c in t.get("components", [])])
+
+def content_hash(t): return hashlib.sha256(json.dumps(normalize(t), sort_keys=True).encode()).hexdigest()[:32]
+
+def row_dict(row):
+    d = dict(zip(COLUMNS.split(", "), row))
+    d["components"],d["deleted"] = json.loads(d["components"]),bool(d["deleted"])
+    return d
+
+class TemplateLibrary:
+    "Templates per library keyed by content hash; every add or delete bumps the library's version so clients can fetch just the changes"
+    def __init__(self, path="templates.db"):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=5)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def _exec(self, sql, params=()):
+        with self.lock: return self.db.execute(sql, params).fetchall()
+
+    def version(self, library): return self._exec("SELECT COALESCE(MAX(version), 0) FROM templates WHERE library = ?", (library,))[0][0]
+
+    def count(self, library): return self._exec("SELECT COUNT(*) FROM templates WHERE library = ? AND deleted = 0", (library,))[0][0]
+
+    def _write(self, library, fn):
+        "Run `fn(next_version)` in one write transaction; `next_version()` hands out the library's next change numbers"
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")  # serialise version numbers across workers
+            try:
+                v = self.db.execute("SELECT COALESCE(MAX(version), 0) FROM templates WHERE library = ?", (library,)).fetchone()[0]
+                def next_version():
+                    nonlocal v
+                    v += 1
+                    return v
+                res = fn(next_version)
+                self.db.execute("COMMIT")
+                return res
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def _upsert(self, library, templates, next_version):
+        "Insert new templates and revive deleted ones; live duplicates are skipped without bumping the version"
+        added = 0
+        for t in templates:
+            n,h = normalize(t),content_hash(t)
+            row = self.db.execute("SELECT deleted FROM templates WHERE library = ? AND hash = ?", (library, h)).fetchone()
+            if row is not None and not row[0]: continue
+            self.db.execute("INSERT INTO templates (library, hash, version, deleted, created, name, description, category, components) VALUES (?, ?, ?, 0, ?, ?, ?, ?, ?) "
+                            "ON CONFLICT (library, hash) DO UPDATE SET version = excluded.version, deleted = 0",
+                            (library, h, next_version(), time.time(), n["name"], n["description"], n["category"], json.dumps(n["components"])))
+            added += 1
+        return added
+
+    def add(self, library, template):
+        "Add one template, returning its hash and whether it was new"
+        added = self._write(library, lambda nv: self._upsert(library, [template], nv))
+        return content_hash(template), bool(added)
+
+    def delete(self, library, hash):
+        "Leave a tombstone, so clients syncing from an older version learn about the delete"
+        return self._write(library, lambda nv: self.db.execute("UPDATE templates SET deleted = 1, version = ? WHERE library = ? AND hash = ? AND deleted = 0",
+                                                              (nv(), library, hash)).rowcount > 0)
+
+    def _clear(self, library, next_version):
+        hashes = [h for h, in self.db.execute("SELECT hash FROM templates WHERE library = ? AND deleted = 0", (library,))]
+        for h in hashes: self.db.execute("UPDATE templates SET deleted = 1, version = ? WHERE library = ? AND hash = ?", (next_version(), library, h))
+        return len(hashes)
+
+    def clear(self, library):
+        "Delete every template in the library"
+        return self._write(library, lambda nv: self._clear(library, nv))
+
+    def replace(self, library, templates):
+        "Swap the library's templates for `templates` in one transaction, returning (added, duplicates) like `import_many`"
+        templates = list(templates)
+        def _replace(nv):
+            self._clear(library, nv)
+            return self._upsert(library, templates, nv)
+        added = self._write(library, _replace)
+        return added, len(templates) - added
+
+    def import_many(self, library, templates, batch=500):
+        "Add templates from any iterable in `batch`-sized transactions, returning (added, duplicates)"
+        added = total = 0
+        chunk = []
+        for t in templates:
+            chunk.append(t)
+            if len(chunk) == batch:
+                added += self._write(library, lambda nv: self._upsert(library, chunk, nv))
+                total,chunk = total + len(chunk),[]
+        if chunk: added,total = added + self._write(library, lambda nv: self._upsert(library, chunk, nv)),total + len(chunk)
+        return added, total - added
+
+    def changes(self, library, since=0, limit=1000):
+        "Templates added or deleted after version `since`, oldest change first, plus whether more remain"
+        rows = self._exec(f"SELECT {COLUMNS} FROM templates WHERE library = ? AND version > ? ORDER BY version LIMIT ?", (library, since, limit + 1))
+        return [row_dict(r) for r in rows[:limit]], len(rows) > limit
+
+    def export(self, library, batch=1000):
+        "Yield every live template, one JSONL line each, reading `batch` rows at a time"
+        last = 0
+        while True:
+            rows = self._exec(f"SELECT id, {COLUMNS} FROM templates WHERE library = ? AND deleted = 0 AND id > ? ORDER BY id LIMIT ?", (library, last, batch))
+            for r in rows:
+                d = row_dict(r[1:])
+                yield json.dumps({k: d[k] for k in FIELDS}) + "\n"
+            if len(rows) < batch: return
+            last = rows[-1][0]
+
+def library_from_env():
+    "Build the template library at `TEMPLATES_PATH` (default `templates.db`)"
+    return TemplateLibrary(os.getenv("TEMPLATES_PATH", "templates.db"))
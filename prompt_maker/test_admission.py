@@ -0,0 +1,37 @@
+"Admission control: lane priority holds even when the wait queue is full"
+import asyncio
+import pytest
+from admission import AdmissionController, Overloaded
+
+async def waiter(admission, client, lane, log):
+    try:
+        async with admission.slot(client, lane): log.append((client, lane))
+    except Overloaded as e: log.append((client, e.reason))
+
+def test_full_batch_queue_still_admits_interactive():
+    async def run():
+        admission,log = AdmissionController(capacity=1, queue_size=2),[]
+        await admission.acquire("holder")
+        batch = [asyncio.create_task(waiter(admission, f"b{i}", "batch", log)) for i in range(2)]
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded): admission.check("b2", "batch")
+        admission.check("alice", "interactive")  # a batch waiter will make room
+        interactive = asyncio.create_task(waiter(admission, "alice", "interactive", log))
+        await asyncio.sleep(0.01)
+        assert log == [("b1", "preempted")] and admission.depth("interactive") == 1 and admission.depth("batch") == 1
+        admission.release()
+        await asyncio.gather(interactive, *batch)
+        assert log == [("b1", "preempted"), ("alice", "interactive"), ("b0", "batch")]
+    asyncio.run(run())
+
+def test_full_interactive_queue_is_refused():
+    async def run():
+        admission = AdmissionController(capacity=1, queue_size=1)
+        await admission.acquire("holder")
+        queued = asyncio.create_task(admission.acquire("alice"))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded) as e: await admission.acquire("bob")
+        assert e.value.reason == "queue_full"
+        admission.release()
+        await queued
+    asyncio.run(run())
@@ -0,0 +1,18 @@
+"Static assets: each encoding is served with its own ETag, and a 304 only answers a tag for the encoding the client gets"
+from types import SimpleNamespace
+from assets import Asset
+
+asset = Asset("console.log('hello');\n" * 100, "text/javascript")
+
+def get(accept="", if_none_match=""): return asset.response(SimpleNamespace(headers={"accept-encoding": accept, "if-none-match": if_none_match}))
+
+def test_etag_per_encoding():
+    tags = {enc: get(accept).headers["etag"] for enc,accept in [("identity", ""), ("gzip", "gzip"), ("br", "gzip, br")]}
+    assert len(set(tags.values())) == 3
+    assert get("gzip, br").headers["content-encoding"] == "br"
+
+def test_revalidation_matches_the_encoding():
+    gz = get("gzip").headers["etag"]
+    assert get("gzip", gz).status_code == 304
+    r = get("", gz)  # a gzip tag doesn't validate the uncompressed body
+    assert r.status_code == 200 and "content-encoding" not in r.headers
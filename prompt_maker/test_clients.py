@@ -0,0 +1,42 @@
+"Pooled LLM clients: an injected client goes where LiteLLM would have sent the call on its own"
+import asyncio, json, os
+import httpx, pytest
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")  # no network fetch of the cost map when LiteLLM loads
+from clients import ClientRegistry, ProviderPool
+
+def completion(request):
+    body = json.loads(request.content)
+    return httpx.Response(200, json=dict(id="chatcmpl-test", object="chat.completion", created=0, model=body["model"],
+                                         choices=[dict(index=0, message=dict(role="assistant", content="ok"), finish_reason="stop")],
+                                         usage=dict(prompt_tokens=1, completion_tokens=1, total_tokens=2)))
+
+@pytest.fixture
+def seen(monkeypatch):
+    "Requests reaching a mock provider behind the registry's OpenAI pool"
+    for k in ("OPENAI_BASE_URL", "OPENAI_API_BASE", "OPENAI_API_KEY"): monkeypatch.delenv(k, raising=False)
+    requests = []
+    def handler(request):
+        requests.append(request)
+        return completion(request)
+    registry = ClientRegistry()
+    registry.pools["openai"] = ProviderPool("openai", transport=httpx.MockTransport(handler))
+    return registry, requests
+
+def test_routes_through_openai_api_base(seen, monkeypatch):
+    registry,requests = seen
+    monkeypatch.setenv("OPENAI_API_BASE", "http://mock.test/v1")
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-env")
+    r = asyncio.run(registry.acompletion(model="openai/gpt-4o", messages=[{"role": "user", "content": "hi"}]))
+    assert r.choices[0].message.content == "ok"
+    assert str(requests[0].url) == "http://mock.test/v1/chat/completions"
+    assert requests[0].headers["authorization"] == "Bearer sk-env"
+
+def test_per_call_api_base_and_key(seen, monkeypatch):
+    registry,requests = seen
+    monkeypatch.setenv("OPENAI_API_BASE", "http://mock.test/v1")
+    async def calls():
+        for base,key in [("http://a.test/v1", "sk-a"), ("http://b.test/v1", "sk-b"), ("http://a.test/v1", "sk-a")]:
+            await registry.acompletion(model="openai/gpt-4o", messages=[{"role": "user", "content": "hi"}], api_base=base, api_key=key)
+    asyncio.run(calls())
+    assert [(r.url.host, r.headers["authorization"]) for r in requests] == [("a.test", "Bearer sk-a"), ("b.test", "Bearer sk-b"), ("a.test", "Bearer sk-a")]
+    assert len(registry.pools["openai"]._clients) == 2
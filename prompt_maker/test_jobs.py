@@ -0,0 +1,35 @@
+"Job queue: one claimer per worker feeds at most `concurrency` runners, and cancelling from a thread stops a running job"
+import asyncio
+from jobs import JobQueue
+
+def test_runs_at_most_concurrency_jobs(tmp_path):
+    running,peak = 0,0
+    async def handler(id, payload):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        return f"done {payload['n']}"
+    async def run():
+        q = JobQueue(handler, str(tmp_path / "jobs.db"), concurrency=2, poll=0.05)
+        q.start()
+        ids = [q.submit({"n": n}) for n in range(5)]
+        results = [(await q.wait(id, 5))["result"] for id in ids]
+        await q.stop()
+        return results
+    assert asyncio.run(run()) == [f"done {n}" for n in range(5)]
+    assert peak == 2
+
+def test_cancel_from_a_thread(tmp_path):
+    async def handler(id, payload): await asyncio.sleep(30)
+    async def run():
+        q = JobQueue(handler, str(tmp_path / "jobs.db"), poll=0.05)
+        q.start()
+        id = q.submit({})
+        while q.get(id)["status"] != "running": await asyncio.sleep(0.01)
+        assert await asyncio.to_thread(q.cancel, id)  # as a sync route does
+        job = await q.wait(id, 5)
+        await q.stop()
+        return job["status"], q.tasks
+    assert asyncio.run(run()) == ("cancelled", {})
@@ -0,0 +1,31 @@
+"Governor: the concurrency cap, and calls cancelled while they wait for it"
+import asyncio
+from metrics import LLM_IN_FLIGHT
+from ratelimit import Governor, ProviderLimits
+
+MODEL = "openai/gpt-test"
+
+def in_flight(): return LLM_IN_FLIGHT.series.get((MODEL,), 0)
+
+def test_cancel_while_queued_for_a_slot(monkeypatch):
+    monkeypatch.setenv("LLM_CONCURRENCY", "1")
+    async def run():
+        release,started = asyncio.Event(),[]
+        async def complete(**kwargs):
+            started.append(kwargs)
+            await release.wait()
+            return "done"
+        g = Governor(retries=0, completefunc=complete)
+        g.providers["openai"] = limits = ProviderLimits("openai")
+        first = asyncio.create_task(g.acompletion(model=MODEL, messages=[]))
+        await asyncio.sleep(0.01)
+        queued = asyncio.create_task(g.acompletion(model=MODEL, messages=[]))
+        await asyncio.sleep(0.01)
+        assert len(started) == 1 and in_flight() == 1  # the queued call hasn't started, so it isn't in flight
+        queued.cancel()
+        await asyncio.sleep(0.01)
+        assert queued.cancelled() and in_flight() == 1
+        release.set()
+        assert await first == "done"
+        assert in_flight() == 0 and not limits.slots.locked()
+    asyncio.run(run())
@@ -0,0 +1,36 @@
+"Semantic cache matching: paraphrases and near-duplicates hit, requests that swap the two sides of a `to`/`from`/`vs` don't"
+import pytest
+from semantic import HashingEmbedder, SemanticCache
+
+REVERSED = [("Translate English to French", "Translate French to English"),
+            ("Convert Celsius to Fahrenheit", "Convert Fahrenheit to Celsius"),
+            ("Migrate from MySQL to Postgres", "Migrate from Postgres to MySQL"),
+            ("Compare React vs Vue", "Compare Vue vs React")]
+NEAR_DUPLICATES = [("python loops tutorial for beginners", "beginner tutorial on Python loops"),
+                   ("Write a cover letter for a software engineer", "Software engineer cover letter"),
+                   ("How to write a cover letter", "Write a cover letter"),
+                   ("Write a product launch email", "write a product launch email!"),
+                   ("Explain recursion to a beginner", "Explain recursion to beginners"),
+                   ("Write a blog post about Python loops", "Create a blog post about python loops")]
+
+@pytest.mark.parametrize("a,b", REVERSED)
+def test_word_order_counts(a, b):
+    embed = HashingEmbedder()
+    assert float(embed(a) @ embed(b)) < 0.9
+
+@pytest.mark.parametrize("a,b", REVERSED)
+def test_reversed_request_misses(a, b):
+    cache = SemanticCache()
+    cache.set(a, ("gpt-4", "prompt"), "cached")
+    assert cache.get(b, ("gpt-4", "prompt"))[0] is None
+
+@pytest.mark.parametrize("a,b", NEAR_DUPLICATES)
+def test_near_duplicate_hits(a, b):
+    cache = SemanticCache()
+    cache.set(a, ("gpt-4", "prompt"), "cached")
+    assert cache.get(b, ("gpt-4", "prompt"))[0] == "cached"
+
+def test_scope_separates_entries():
+    cache = SemanticCache()
+    cache.set("Translate English to French", ("gpt-4", "prompt"), "cached")
+    assert cache.get("Translate English to French", ("claude-3", "prompt"))[0] is None
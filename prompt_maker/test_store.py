@@ -0,0 +1,21 @@
+"Session stores: the background cleanup survives a failed sweep"
+import asyncio
+from store import start_cleanup
+
+class Flaky:
+    "A store whose first cleanup fails the way a locked SQLite database does"
+    def __init__(self): self.calls = 0
+    def cleanup(self):
+        self.calls += 1
+        if self.calls == 1: raise RuntimeError("database is locked")
+        return 0
+
+def test_cleanup_keeps_running_after_an_error():
+    async def run():
+        store = Flaky()
+        task = start_cleanup(store, interval=0.01)
+        await asyncio.sleep(0.1)
+        task.cancel()
+        return store.calls, task
+    calls,task = asyncio.run(run())
+    assert calls > 1 and task.cancelled()
@@ -0,0 +1,21 @@
+"Template library: malformed templates are rejected up front and a replace is all or nothing"
+import pytest
+from templates import TemplateLibrary, normalize
+
+@pytest.fixture
+def library(tmp_path): return TemplateLibrary(str(tmp_path / "templates.db"))
+
+@pytest.mark.parametrize("template", [None, 3, "Role", {"name": "x", "components": None}, {"name": "x", "components": 5}, {"name": "x", "components": "Role"}])
+def test_normalize_rejects_non_templates(template):
+    with pytest.raises(ValueError): normalize(template)
+
+def test_replace(library):
+    library.import_many("u", [{"name": "old", "components": ["Role"]}, {"name": "kept", "components": ["Task"]}])
+    assert library.replace("u", [{"name": "kept", "components": ["Task"]}, {"name": "new", "components": ["Format"]}]) == (2, 0)
+    assert sorted(t["name"] for t in library.changes("u")[0] if not t["deleted"]) == ["kept", "new"]
+
+def test_failed_replace_keeps_the_library(library):
+    library.import_many("u", [{"name": "old", "components": ["Role"]}])
+    version = library.version("u")
+    with pytest.raises(ValueError): library.replace("u", [{"name": "new", "components": ["Task"]}, {"name": "bad", "components": 5}])
+    assert library.count("u") == 1 and library.version("u") == version
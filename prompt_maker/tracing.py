@@ -0,0 +1,191 @@
+"Opt-in request tracing exported as OTLP/JSON lines, and a sampling profiler that dumps folded stacks for slow requests"
+import json, os, random, sys, threading, time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+SPAN_KINDS = dict(internal=1, server=2, client=3)
+
+class Span:
+    "One timed stage of a request; `attrs` become OTLP attributes"
+    def __init__(self, trace, name, parent=None, kind="internal", **attrs):
+        self.trace,self.name,self.parent,self.kind,self.attrs = trace,name,parent,kind,attrs
+        self.span_id,self.start,self.end_ns,self.error = random.getrandbits(64),time.time_ns(),None,None
+        trace.spans.append(self)
+
+    def set(self, **attrs): self.attrs.update(attrs)
+
+    def end(self, error=None, **attrs):
+        if self.end_ns is not None: return
+        self.attrs.update(attrs)
+        self.end_ns,self.error = time.time_ns(),error
+
+    def otlp(self):
+        d = dict(traceId=f"{self.trace.trace_id:032x}", spanId=f"{self.span_id:016x}", name=self.name, kind=SPAN_KINDS[self.kind],
+                 startTimeUnixNano=str(self.start), endTimeUnixNano=str(self.end_ns or time.time_ns()),
+                 attributes=[otlp_attr(k, v) for k,v in self.attrs.items() if v is not None],
+                 status=dict(code=2, message=f"{type(self.error).__name__}: {self.error}") if self.error else dict(code=1))
+        if self.parent: d["parentSpanId"] = f"{self.parent.span_id:016x}"
+        return d
+
+class Trace:
+    "The spans of one HTTP request; the first span is the request itself"
+    def __init__(self): self.trace_id,self.spans = random.getrandbits(128),[]
+    @property
+    def root(self): return self.spans[0]
+
+def otlp_attr(key, value):
+    if isinstance(value, bool): v = dict(boolValue=value)
+    elif isinstance(value, int): v = dict(intValue=str(value))
+    elif isinstance(value, float): v = dict(doubleValue=value)
+    else: v = dict(stringValue=str(value))
+    return dict(key=key, value=v)
+
+current_span = ContextVar("current_span", default=None)
+
+class Tracer:
+    "Writes each finished trace as one OTLP/JSON `ExportTraceServiceRequest` line, the format the OpenTelemetry collector's `otlpjsonfile` receiver reads"
+    def __init__(self, path=None, sample_rate=1.0, service="prompt-maker"):
+        self.path,self.sample_rate,self.service,self.lock = path,sample_rate,service,threading.Lock()
+
+    @property
+    def enabled(self): return bool(self.path)
+
+    def export(self, trace):
+        line = json.dumps(dict(resourceSpans=[dict(resource=dict(attributes=[otlp_attr("service.name", self.service), otlp_attr("process.pid", os.getpid())]),
+                                                   scopeSpans=[dict(scope=dict(name="prompt_maker"), spans=[s.otlp() for s in trace.spans])])]))
+        with self.lock, open(self.path, "a") as f: f.write(line + "\n")
+
+def tracer_from_env():
+    "Tracing is on when `TRACE_PATH` is set; `TRACE_SAMPLE_RATE` (default 1.0) keeps that fraction of requests"
+    return Tracer(os.getenv("TRACE_PATH") or None, float(os.getenv("TRACE_SAMPLE_RATE", 1.0)))
+
+tracer = tracer_from_env()
+
+def start_span(name, kind="internal", **attrs):
+    "A child of the current span that the caller ends itself, or None when this request isn't traced"
+    parent = current_span.get()
+    return Span(parent.trace, name, parent, kind, **attrs) if parent else None
+
+@contextmanager
+def span(name, **attrs):
+    "Time the `with` block as a child of the current span; a no-op when this request isn't traced"
+    s = start_span(name, **attrs)
+    if s is None:
+        yield None
+        return
+    token = current_span.set(s)
+    try: yield s
+    except BaseException as e:
+        s.end(error=e)
+        raise
+    finally:
+        s.end()
+        try: current_span.reset(token)
+        except ValueError: pass  # an async generator finished in a different context than it started in
+
+@contextmanager
+def trace_task(name, **attrs):
+    "Trace background work that outlives the request that started it as a trace of its own; `attrs` such as `session_id` link the two"
+    if not tracer.enabled or random.random() >= tracer.sample_rate:
+        token = current_span.set(None)  # not part of the starting request's trace, which may already have been exported
+        try: yield None
+        finally: current_span.reset(token)
+        return
+    root = Span(Trace(), name, **attrs)
+    token = current_span.set(root)
+    try: yield root
+    except BaseException as e:
+        root.end(error=e)
+        raise
+    finally:
+        root.end()
+        current_span.reset(token)
+        tracer.export(root.trace)
+
+def tag(**attrs):
+    "Set attributes (e.g. `session_id`) on the traced request's root span, so every trace of one generation can be found together"
+    if (s := current_span.get()) is not None: s.trace.root.set(**attrs)
+
+def collapse(frame):
+    "A stack as `outer;...;inner` frame names, the folded format flamegraph.pl and speedscope read"
+    names = []
+    while frame is not None:
+        names.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class Sampler:
+    "Samples every thread's stack while any request is being profiled; each request keeps the samples taken during its lifetime"
+    def __init__(self, slow_ms=None, interval_ms=5, out_dir="profiles"):
+        self.slow,self.interval,self.out_dir = slow_ms and slow_ms / 1000,interval_ms / 1000,out_dir
+        self.active,self.lock,self.wake,self.thread = {},threading.Lock(),threading.Event(),None
+
+    @property
+    def enabled(self): return bool(self.slow)
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            self.wake.wait()
+            frames,names = sys._current_frames(),{t.ident: t.name for t in threading.enumerate()}
+            stacks = [f"{names.get(tid, tid)};{collapse(f)}" for tid,f in frames.items() if tid != me]
+            with self.lock:
+                for samples in self.active.values(): samples.update(stacks)
+                if not self.active: self.wake.clear()
+            time.sleep(self.interval)
+
+    def start(self, key):
+        with self.lock:
+            self.active[key] = Counter()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self.thread.start()
+            self.wake.set()
+
+    def stop(self, key, elapsed, label):
+        "Finish profiling `key`, writing its folded stacks to `out_dir` when the request took longer than the threshold"
+        with self.lock: samples = self.active.pop(key, None)
+        if not samples or elapsed < self.slow: return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{int(elapsed * 1000)}ms-{label}.folded")
+        with open(path, "w") as f: f.writelines(f"{stack} {n}\n" for stack,n in samples.most_common())
+        return path
+
+def sampler_from_env():
+    "Profiling is on when `PROFILE_SLOW_MS` is set; requests slower than that dump stacks sampled every `PROFILE_INTERVAL_MS` to `PROFILE_DIR`"
+    slow = os.getenv("PROFILE_SLOW_MS")
+    return Sampler(float(slow) if slow else None, float(os.getenv("PROFILE_INTERVAL_MS", 5)), os.getenv("PROFILE_DIR", "profiles"))
+
+sampler = sampler_from_env()
+
+class TracingMiddleware:
+    "ASGI middleware opening a root span per sampled request, exporting its trace when the response ends, and profiling slow requests"
+    def __init__(self, app): self.app = app
+
+    async def __call__(self, scope, receive, send):
+        traced = scope["type"] == "http" and tracer.enabled and random.random() < tracer.sample_rate
+        profiled = scope["type"] == "http" and sampler.enabled
+        if not (traced or profiled): return await self.app(scope, receive, send)
+        root = Span(Trace(), f"{scope['method']} {scope['path']}", kind="server", **{"http.method": scope["method"], "http.target": scope["path"]}) if traced else None
+        token,t0,key = current_span.set(root),time.perf_counter(),object()
+        if profiled: sampler.start(key)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and root: root.set(**{"http.status_code": message["status"]})
+            await send(message)
+
+        error = None
+        try: await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            current_span.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            label = f"{root.trace.trace_id:032x}" if root else scope["path"].strip("/").replace("/", "_") or "index"
+            profile = sampler.stop(key, time.perf_counter() - t0, label) if profiled else None
+            if root:
+                if route: root.name = f"{scope['method']} {route}"
+                root.end(error=error, **{"http.route": route, "profile.path": profile})
+                tracer.export(root.trace)